@@ -0,0 +1,62 @@
+"""
+Аналитика и аудит: события чата, бронирований и действий администратора.
+
+record() только кладет событие в очередь и сразу возвращается; запись
+в таблицу analytics_events (или в JSONL-файл, если ANALYTICS_SINK=file)
+выполняет фоновый BatchWriter пачками.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import insert
+
+from batch_writer import BatchWriter
+from database import AsyncSessionLocal
+from models import AnalyticsEvent
+
+ANALYTICS_SINK = os.getenv("ANALYTICS_SINK", "db").lower()
+ANALYTICS_FILE = Path(os.getenv("ANALYTICS_FILE", str(Path(__file__).parent / "analytics_events.jsonl")))
+
+
+async def _write_db(batch: list[dict]):
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(AnalyticsEvent), [
+            {**row, "payload": json.dumps(row["payload"], ensure_ascii=False, default=str)}
+            for row in batch
+        ])
+        await session.commit()
+
+
+def _append_lines(lines: list[str]):
+    with open(ANALYTICS_FILE, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+async def _write_file(batch: list[dict]):
+    lines = [json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch]
+    await asyncio.to_thread(_append_lines, lines)
+
+
+events = BatchWriter(
+    "analytics",
+    _write_file if ANALYTICS_SINK == "file" else _write_db,
+    batch_size=200,
+    flush_interval=2.0,
+    max_queue=50_000,
+)
+
+
+def record(kind: str, user_id: int | None = None, **payload):
+    """
+    Регистрирует событие. Никогда не блокирует и не бросает исключений:
+    при переполнении очереди событие отбрасывается (см. events.stats["dropped"]).
+    """
+    events.put({
+        "kind": kind,
+        "user_id": user_id,
+        "payload": payload,
+        "created_at": datetime.now(timezone.utc),
+    })
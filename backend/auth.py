@@ -1,4 +1,4 @@
-from fastapi_users import FastAPIUsers
+from fastapi_users import FastAPIUsers, exceptions
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
@@ -6,14 +6,23 @@ from fastapi_users.authentication import (
 )
 
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import decode_jwt
 from fastapi_users.manager import BaseUserManager
 from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from fastapi import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+import asyncio
+import jwt
 import os
+import logging
 from typing import Optional
 from models import User
-from database import get_async_session
+from database import AsyncSessionLocal, get_async_session
+from mailer import queue_email, send_email
+import jobs
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-to-secure-random-string")
@@ -23,6 +32,16 @@ bearer_transport = BearerTransport(tokenUrl="auth/login")
 def get_jwt_strategy() -> JWTStrategy:
     return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
+def token_user_id(authorization: str) -> Optional[int]:
+    """id пользователя из заголовка "Bearer <токен>" без обращения к БД; None, если токен недействителен."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(decode_jwt(token, SECRET, ["fastapi-users:auth"])["sub"])
+    except (jwt.PyJWTError, KeyError, ValueError):
+        return None
+
 auth_backend = AuthenticationBackend(
     name="jwt", 
     transport=bearer_transport,  
@@ -43,16 +62,77 @@ class UserManager(BaseUserManager[User, int]):
         except (ValueError, TypeError) as e:
             raise ValueError(f"Невозможно преобразовать ID пользователя в число: {value}") from e
 
+    # Хеширование и проверка пароля (argon2/bcrypt) занимают десятки-сотни миллисекунд
+    # CPU; в базовом классе проверка при входе вызывается прямо в цикле событий, здесь - в потоке
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Хеш все равно считается, чтобы по времени ответа нельзя было угадать email
+            await asyncio.to_thread(self.password_helper.hash, credentials.password)
+            return None
+        verified, updated_password_hash = await asyncio.to_thread(
+            self.password_helper.verify_and_update, credentials.password, user.hashed_password
+        )
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        return user
+
+    # Письма не отправляются в обработчике запроса: задача ставится в очередь (jobs.py),
+    # отправку выполняет фоновый воркер
     async def on_after_register(self, user: User, request=None):
-        print(f"User {user.id} has registered.")
+        logger.info(f"User {user.id} has registered.")
+        await queue_email(
+            user.email,
+            "Добро пожаловать в прокат костюмов",
+            "Вы успешно зарегистрировались. Теперь можно оформлять заказы и бронировать костюмы.",
+        )
+
+    # Токены сброса пароля и подтверждения email не попадают в очередь: payload задачи
+    # хранится в таблице jobs. В задаче только id пользователя; воркер повторяет
+    # forgot_password/request_verify библиотеки с MailingUserManager, и токен
+    # создается прямо перед отправкой письма
+    async def on_after_forgot_password(self, user: User, token: str, request=None):
+        logger.info(f"User {user.id} has forgot their password.")
+        await jobs.enqueue("send_password_reset", {"user_id": user.id})
+
+    async def on_after_request_verify(self, user: User, token: str, request=None):
+        logger.info(f"Verification requested for user {user.id}.")
+        await jobs.enqueue("send_verification", {"user_id": user.id})
+
+
+class MailingUserManager(UserManager):
+    """Менеджер для фоновых задач: токен, созданный библиотекой, сразу уходит письмом."""
 
-    
     async def on_after_forgot_password(self, user: User, token: str, request=None):
-        print(f"User {user.id} has forgot their password. Reset token: {token}")
+        await send_email(
+            user.email,
+            "Восстановление пароля",
+            f"Для сброса пароля используйте код:\n\n{token}\n\nЕсли вы не запрашивали сброс, просто проигнорируйте это письмо.",
+        )
 
-   
     async def on_after_request_verify(self, user: User, token: str, request=None):
-        print(f"Verification requested for user {user.id}. Verification token: {token}")
+        await send_email(user.email, "Подтверждение email", f"Код подтверждения адреса:\n\n{token}")
+
+
+@jobs.handler("send_password_reset", concurrency=2, max_attempts=6, timeout=60.0)
+async def send_password_reset(user_id: int):
+    async with AsyncSessionLocal() as session:
+        user = await session.get(User, user_id)
+        if user is None or not user.is_active:
+            return
+        await MailingUserManager(SQLAlchemyUserDatabase(session, User)).forgot_password(user)
+
+
+@jobs.handler("send_verification", concurrency=2, max_attempts=6, timeout=60.0)
+async def send_verification(user_id: int):
+    async with AsyncSessionLocal() as session:
+        user = await session.get(User, user_id)
+        if user is None or not user.is_active or user.is_verified:
+            return
+        await MailingUserManager(SQLAlchemyUserDatabase(session, User)).request_verify(user)
 
 
 async def get_user_db():
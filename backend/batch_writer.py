@@ -0,0 +1,92 @@
+"""
+Фоновая пакетная запись.
+
+Обработчики запросов кладут записи в ограниченную очередь и сразу
+продолжают работу. Фоновая задача сбрасывает очередь пачками, когда
+накопилось batch_size записей или прошло flush_interval секунд.
+Если очередь переполнена, запись отбрасывается и учитывается в счетчике
+dropped - обработчик никогда не ждет ввода-вывода.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    def __init__(self, name: str, write, batch_size: int = 100,
+                 flush_interval: float = 1.0, max_queue: int = 10_000):
+        """
+        write - корутина, принимающая список записей и сохраняющая их одной операцией.
+        """
+        self.name = name
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.stats = {"queued": 0, "dropped": 0, "written": 0, "failed": 0, "batches": 0}
+        self._queue: asyncio.Queue | None = None
+        self._batch_ready: asyncio.Event | None = None
+        self._lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def put(self, item) -> bool:
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["queued"] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._batch_ready = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Не отменяем задачу: отмена посреди записи оставила бы транзакцию
+            # SQLite открытой (и БД заблокированной), а пачку - потерянной
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Сбрасывает все, что накопилось в очереди."""
+        if self._queue is None:
+            return
+        async with self._lock:
+            while not self._queue.empty():
+                batch = []
+                while not self._queue.empty() and len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+                try:
+                    await self.write(batch)
+                    self.stats["written"] += len(batch)
+                    self.stats["batches"] += 1
+                except Exception as e:
+                    self.stats["failed"] += len(batch)
+                    logger.error(f"{self.name}: не удалось записать пачку из {len(batch)} записей: {e}")
@@ -0,0 +1,132 @@
+"""
+Бенчмарк сериализации больших списков заказов (/orders/all).
+
+Сравнивает прежний путь (ORM-объекты -> OrderAdminOut -> повторная
+валидация response_model -> json) и новый (кортежи колонок -> RowEncoder
+-> orjson).
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_serialization --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+
+from benchmarks.tempdb import temp_database
+from models import Costume, Order, User
+from serializers import ORDER_ADMIN_COLUMNS, order_admin_encoder
+
+
+async def seed(session, rows: int):
+    await session.execute(insert(User), [
+        {"id": i, "email": f"user{i}@example.com", "hashed_password": "x"} for i in range(1, 1001)
+    ])
+    await session.execute(insert(Costume), [
+        {"id": i, "title": f"Костюм {i}", "image_filename": f"{i}.jpg", "price": 100 * i} for i in range(1, 201)
+    ])
+    start = date(2024, 1, 1)
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    batch = []
+    for i in range(1, rows + 1):
+        batch.append({
+            "user_id": i % 1000 + 1,
+            "costume_id": (i % 200 + 1) if i % 3 else None,
+            "title": f"Заказ {i}",
+            "phone": "+7 900 000-00-00",
+            "date_from": start + timedelta(days=i % 365),
+            "date_to": start + timedelta(days=i % 365 + 2),
+            "status": "новая",
+            "created_at": created + timedelta(minutes=i),
+        })
+        if len(batch) == 10_000:
+            await session.execute(insert(Order), batch)
+            batch = []
+    if batch:
+        await session.execute(insert(Order), batch)
+    await session.commit()
+
+
+async def old_path(session, adapter):
+    # Как было в get_all_orders_admin до перехода на кодировщики
+    from main import OrderAdminOut
+    result = await session.execute(
+        select(Order, User, Costume)
+        .join(User, User.id == Order.user_id)
+        .outerjoin(Costume, Costume.id == Order.costume_id)
+        .order_by(Order.created_at.desc())
+    )
+    items = [
+        OrderAdminOut(
+            id=o.id, user_id=u.id, user_email=u.email, title=o.title, status=o.status,
+            created_at=str(o.created_at), costume_id=o.costume_id,
+            costume_title=(c.title if c else None), phone=o.phone,
+            date_from=o.date_from, date_to=o.date_to,
+        )
+        for o, u, c in result.all()
+    ]
+    # Повторная валидация и сериализация, которые выполнял FastAPI по response_model
+    validated = adapter.validate_python(items, from_attributes=True)
+    return json.dumps(adapter.dump_python(validated, mode="json"), ensure_ascii=False).encode("utf-8")
+
+
+async def new_path(session):
+    result = await session.execute(
+        select(*ORDER_ADMIN_COLUMNS)
+        .join(User, User.id == Order.user_id)
+        .outerjoin(Costume, Costume.id == Order.costume_id)
+        .order_by(Order.created_at.desc())
+    )
+    return order_admin_encoder.encode_many(result.all())
+
+
+async def timed(fn, repeat: int):
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        best = min(best, time.perf_counter() - started)
+        size = len(body)
+    return best, size
+
+
+async def main(rows: int, repeat: int):
+    from main import OrderAdminOut
+    adapter = TypeAdapter(list[OrderAdminOut])
+
+    async with temp_database() as (_, sessions):
+        async with sessions() as session:
+            await seed(session, rows)
+
+        async def run_old():
+            async with sessions() as session:
+                return await old_path(session, adapter)
+
+        async def run_new():
+            async with sessions() as session:
+                return await new_path(session)
+
+        old_time, old_size = await timed(run_old, repeat)
+        new_time, new_size = await timed(run_new, repeat)
+
+    print(f"Строк: {rows}, повторов: {repeat} (лучшее время)")
+    print(f"  ORM + Pydantic + response_model: {old_time:8.3f} с, {old_size / 1e6:6.1f} МБ")
+    print(f"  колонки + RowEncoder + orjson:   {new_time:8.3f} с, {new_size / 1e6:6.1f} МБ")
+    print(f"  ускорение: x{old_time / new_time:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
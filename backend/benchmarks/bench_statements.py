@@ -0,0 +1,164 @@
+"""
+Бенчмарк накладных расходов ORM на горячих запросах (statements.py).
+
+Сравнивает прежний способ (запрос собирается в обработчике на каждый вызов)
+и заранее построенные запросы с bindparam. Для каждого запроса два замера:
+
+- "сборка": только Python - построение выражения и ключа кэша компиляции,
+  без обращения к БД. Это та часть, которую убирают готовые запросы;
+- "выполнение": полный вызов session.execute на небольшой базе SQLite,
+  время на запрос в микросекундах.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_statements --iterations 2000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert, select, union_all
+
+import statements
+from benchmarks.tempdb import temp_database
+from models import Costume, Order, OrderHistory, Reservation, ReservationHistory, User
+from serializers import ORDER_COLUMNS, ORDER_HISTORY_COLUMNS, RESERVATION_COLUMNS, RESERVATION_HISTORY_COLUMNS
+
+COSTUMES = 20
+USERS = 20
+START = date(2030, 1, 1)
+
+
+async def seed(session):
+    await session.execute(insert(User), [
+        {"id": i, "email": f"user{i}@example.com", "hashed_password": "x"} for i in range(1, USERS + 1)
+    ])
+    await session.execute(insert(Costume), [
+        {"id": i, "title": f"Костюм {i}", "image_filename": f"{i}.jpg", "price": 100 * i} for i in range(1, COSTUMES + 1)
+    ])
+    await session.execute(insert(Order), [
+        {"user_id": n % USERS + 1, "title": f"Заказ {n}", "status": "новая", "costume_id": n % COSTUMES + 1,
+         "date_from": START + timedelta(days=7 * n), "date_to": START + timedelta(days=7 * n + 2)}
+        for n in range(200)
+    ])
+    await session.execute(insert(Reservation), [
+        {"user_id": n % USERS + 1, "costume_id": n % COSTUMES + 1,
+         "date_from": START + timedelta(days=7 * n + 3), "date_to": START + timedelta(days=7 * n + 5)}
+        for n in range(200)
+    ])
+    await session.commit()
+
+
+# ========== ПРЕЖНИЕ ЗАПРОСЫ (как были в main.py) ==========
+
+def old_my_orders(user_id: int):
+    return statements.order_union(union_all(
+        select(*ORDER_COLUMNS).where(Order.user_id == user_id),
+        select(*ORDER_HISTORY_COLUMNS).where(OrderHistory.user_id == user_id),
+    ), "created_at", descending=True), {}
+
+
+def old_my_reservations(user_id: int):
+    return statements.order_union(union_all(
+        select(*RESERVATION_COLUMNS).where(Reservation.user_id == user_id),
+        select(*RESERVATION_HISTORY_COLUMNS).where(ReservationHistory.user_id == user_id),
+    ), "date_from", descending=True), {}
+
+
+def old_availability(costume_id: int, from_date: date, to_date: date):
+    return select(Order).where(
+        Order.costume_id == costume_id
+    ).where(
+        Order.date_from.isnot(None)
+    ).where(
+        Order.date_to.isnot(None)
+    ).where(
+        Order.date_from <= to_date,
+        Order.date_to >= from_date
+    ), {}
+
+
+def old_order_conflict(costume_id: int, date_from: date, date_to: date):
+    return select(Order).where(
+        Order.costume_id == costume_id,
+        Order.date_from.isnot(None),
+        Order.date_to.isnot(None),
+        Order.date_from <= date_to,
+        Order.date_to >= date_from
+    ), {}
+
+
+# ========== ГОТОВЫЕ ЗАПРОСЫ ==========
+
+def new_my_orders(user_id: int):
+    return statements.MY_ORDERS, {"user_id": user_id}
+
+
+def new_my_reservations(user_id: int):
+    return statements.MY_RESERVATIONS, {"user_id": user_id}
+
+
+def new_availability(costume_id: int, from_date: date, to_date: date):
+    _, q_orders, params = statements.availability(costume_id, from_date, to_date)
+    return q_orders, params
+
+
+def new_order_conflict(costume_id: int, date_from: date, date_to: date):
+    return statements.ORDER_CONFLICT, {"costume_id": costume_id, "date_from": date_from, "date_to": date_to}
+
+
+CASES = [
+    ("заказы пользователя", old_my_orders, new_my_orders, lambda n: (n % USERS + 1,)),
+    ("брони пользователя", old_my_reservations, new_my_reservations, lambda n: (n % USERS + 1,)),
+    ("доступность (заказы)", old_availability, new_availability,
+     lambda n: (n % COSTUMES + 1, START, START + timedelta(days=365))),
+    ("пересечение дат", old_order_conflict, new_order_conflict,
+     lambda n: (n % COSTUMES + 1, START + timedelta(days=n), START + timedelta(days=n + 2))),
+]
+
+
+def build_us(build, args, iterations: int) -> float:
+    # Сборка выражения и ключа кэша - то, что движок делает перед поиском в кэше компиляции
+    started = time.perf_counter()
+    for n in range(iterations):
+        stmt, _ = build(*args(n))
+        stmt._generate_cache_key()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def execute_us(sessions, build, args, iterations: int) -> float:
+    async with sessions() as session:
+        for n in range(50):
+            await session.execute(*build(*args(n)))
+        started = time.perf_counter()
+        for n in range(iterations):
+            result = await session.execute(*build(*args(n)))
+            result.all()
+        elapsed = time.perf_counter() - started
+    return elapsed / iterations * 1e6
+
+
+async def main(iterations: int):
+    async with temp_database() as (_, sessions):
+        async with sessions() as session:
+            await seed(session)
+
+        print(f"Итераций на запрос: {iterations}, мкс на вызов")
+        print(f"  {'запрос':<22} {'сборка: было':>13} {'стало':>8} {'выполнение: было':>18} {'стало':>8}")
+        for name, old, new, args in CASES:
+            old_build, new_build = build_us(old, args, iterations), build_us(new, args, iterations)
+            old_exec = await execute_us(sessions, old, args, iterations)
+            new_exec = await execute_us(sessions, new, args, iterations)
+            print(f"  {name:<22} {old_build:13.1f} {new_build:8.1f} {old_exec:18.1f} {new_exec:8.1f}"
+                  f"   x{old_exec / new_exec:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
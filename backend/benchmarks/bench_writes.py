@@ -0,0 +1,125 @@
+"""
+Бенчмарк пропускной способности бронирований (POST /reservations).
+
+Сравнивает прежний путь записи (session.add -> commit -> refresh, лишний
+SELECT после каждой записи) и новый (INSERT ... RETURNING -> commit).
+Обе версии выполняют одинаковые проверки: костюм, пересечение дат,
+обновление сводной таблицы отчетов. Кроме времени считается число
+SQL-запросов на одно бронирование.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_writes --bookings 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import event, insert, select
+
+import reports
+from benchmarks.tempdb import temp_database
+from models import Costume, Reservation, User
+from serializers import RESERVATION_COLUMNS, reservation_encoder
+
+COSTUMES = 50
+USERS = 100
+
+
+async def seed(session):
+    await session.execute(insert(User), [
+        {"id": i, "email": f"user{i}@example.com", "hashed_password": "x"} for i in range(1, USERS + 1)
+    ])
+    await session.execute(insert(Costume), [
+        {"id": i, "title": f"Костюм {i}", "image_filename": f"{i}.jpg", "price": 100 * i} for i in range(1, COSTUMES + 1)
+    ])
+    await session.commit()
+
+
+async def check(session, costume_id: int, date_from: date, date_to: date):
+    # Общие проверки create_reservation; в бенчмарке конфликтов нет
+    costume = await session.get(Costume, costume_id)
+    assert costume is not None and costume.available
+    conflict = await session.execute(
+        select(Reservation).where(
+            Reservation.costume_id == costume_id,
+            Reservation.date_from <= date_to,
+            Reservation.date_to >= date_from,
+        )
+    )
+    assert conflict.scalars().first() is None
+
+
+async def old_booking(session, user_id: int, costume_id: int, date_from: date, date_to: date) -> bytes:
+    # Как было в create_reservation до перехода на RETURNING
+    await check(session, costume_id, date_from, date_to)
+    res = Reservation(user_id=user_id, costume_id=costume_id, date_from=date_from, date_to=date_to)
+    session.add(res)
+    await reports.bump_costume_days(session, res.costume_id, res.date_from, res.date_to, 1)
+    await session.commit()
+    await session.refresh(res)
+    return reservation_encoder.encode_one((res.id, res.costume_id, res.date_from, res.date_to, res.created_at))
+
+
+async def new_booking(session, user_id: int, costume_id: int, date_from: date, date_to: date) -> bytes:
+    await check(session, costume_id, date_from, date_to)
+    result = await session.execute(
+        insert(Reservation).values(
+            user_id=user_id, costume_id=costume_id, date_from=date_from, date_to=date_to,
+        ).returning(*RESERVATION_COLUMNS)
+    )
+    res = result.one()
+    await reports.bump_costume_days(session, res.costume_id, res.date_from, res.date_to, 1)
+    await session.commit()
+    return reservation_encoder.encode_one(res)
+
+
+async def run(booking, bookings: int, concurrency: int, start: date) -> tuple[float, int]:
+    async with temp_database() as (engine, sessions):
+        async with sessions() as session:
+            await seed(session)
+
+        statements = 0
+
+        def count(*args):
+            nonlocal statements
+            statements += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        queue = list(range(bookings))
+
+        async def client():
+            while queue:
+                n = queue.pop()
+                # Каждое бронирование - свой костюм и неделя, пересечений нет
+                first = start + timedelta(days=7 * (n // COSTUMES))
+                async with sessions() as session:
+                    await booking(session, n % USERS + 1, n % COSTUMES + 1, first, first + timedelta(days=2))
+
+        started = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return elapsed, statements
+
+
+async def main(bookings: int, concurrency: int):
+    start = date(2030, 1, 1)
+    old_time, old_statements = await run(old_booking, bookings, concurrency, start)
+    new_time, new_statements = await run(new_booking, bookings, concurrency, start)
+
+    print(f"Бронирований: {bookings}, параллельно: {concurrency}")
+    print(f"  add + commit + refresh:  {bookings / old_time:8.1f} брон./с, {old_statements / bookings:4.1f} SQL на бронирование")
+    print(f"  INSERT ... RETURNING:    {bookings / new_time:8.1f} брон./с, {new_statements / bookings:4.1f} SQL на бронирование")
+    print(f"  ускорение: x{old_time / new_time:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.bookings, args.concurrency))
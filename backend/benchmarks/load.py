@@ -0,0 +1,324 @@
+"""
+Нагрузочный тест API на заранее заполненных данных.
+
+По умолчанию приложение запускается в этом же процессе (httpx + ASGITransport,
+без сети) на временной БД, заполненной benchmarks.seed_data; Gemini
+заменяется заглушкой с фиксированной задержкой. С --url нагрузка подается
+на запущенный сервер (его БД нужно заранее заполнить seed_data).
+
+Сценарии (--workloads):
+    catalog      - каталог, карточка костюма, поиск;
+    availability - проверка доступности костюма на случайные даты;
+    booking      - всплеск бронирований небольшого набора "популярных" костюмов
+                   (409 при пересечении дат считается нормальным ответом);
+    admin        - списки всех заказов и бронирований;
+    chat         - вопросы, которых нет в базе знаний (уходят в LLM-заглушку).
+
+Каждый сценарий выполняется отдельно --duration секунд в --concurrency
+параллельных клиентах. Результат: число запросов, запросов/с, p50/p95/p99 (мс)
+и ошибки. --save сохраняет результат в JSON, --compare сравнивает с ранее
+сохраненным и отмечает регрессии больше --threshold.
+
+Запуск из каталога backend:
+    python -m benchmarks.load --save benchmarks/baselines/local.json
+    python -m benchmarks.load --compare benchmarks/baselines/local.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from benchmarks.seed_data import ADMIN_EMAIL, PASSWORD, user_email
+
+HOT_COSTUMES = 10
+SEARCH_WORDS = ["пират", "фея", "рыцарь", "красный", "золотой", "принцесса", "ведьма"]
+
+
+# ========== СЦЕНАРИИ ==========
+# Каждая функция возвращает один запрос: (метод, путь, json, чей токен, допустимые статусы)
+
+def catalog(ctx, rng):
+    roll = rng.random()
+    if roll < 0.4:
+        return "GET", "/costumes", None, None, (200,)
+    if roll < 0.7:
+        return "GET", f"/costumes/{rng.randint(1, ctx['costumes'])}", None, None, (200,)
+    return "GET", f"/costumes/search?q={rng.choice(SEARCH_WORDS)}&limit=20", None, None, (200,)
+
+
+def availability(ctx, rng):
+    first = ctx["start"] + timedelta(days=rng.randint(0, 365))
+    last = first + timedelta(days=rng.randint(0, 7))
+    return ("GET", f"/costumes/{rng.randint(1, ctx['costumes'])}/availability?from_date={first}&to_date={last}",
+            None, None, (200,))
+
+
+def booking(ctx, rng):
+    first = ctx["start"] + timedelta(days=rng.randint(400, 800))
+    body = {
+        "costume_id": rng.choice(ctx["hot_costumes"]),
+        "date_from": str(first),
+        "date_to": str(first + timedelta(days=rng.randint(0, 3))),
+    }
+    return "POST", "/reservations", body, "user", (201, 409)
+
+
+def admin(ctx, rng):
+    path = "/orders/all" if rng.random() < 0.5 else "/reservations/all"
+    return "GET", path, None, "admin", (200,)
+
+
+def chat(ctx, rng):
+    # Слова, которых нет в базе знаний: вопрос гарантированно уходит в LLM
+    return "POST", "/chat", {"text": f"zq{rng.randint(1, 10**6)} xv{rng.randint(1, 10**6)}"}, None, (200,)
+
+
+WORKLOADS = {
+    "catalog": catalog,
+    "availability": availability,
+    "booking": booking,
+    "admin": admin,
+    "chat": chat,
+}
+
+
+# ========== ЗАГЛУШКА LLM ==========
+
+class FakeLLM:
+    """Клиент модели для llm.LLMChain: синхронный generate с фиксированной задержкой."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        time.sleep(self.latency)
+        return "Уточните, пожалуйста, детали по телефону ателье."
+
+
+# ========== ИЗМЕРЕНИЕ ==========
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_workload(client, name: str, ctx: dict, duration: float, concurrency: int, seed: int) -> dict:
+    make_request = WORKLOADS[name]
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user_loop(n: int):
+        nonlocal errors
+        rng = random.Random(f"{seed}-{name}-{n}")
+        while time.perf_counter() < deadline:
+            method, path, body, auth, ok = make_request(ctx, rng)
+            headers = {}
+            if auth == "admin":
+                headers["Authorization"] = f"Bearer {ctx['admin_token']}"
+            elif auth == "user":
+                headers["Authorization"] = f"Bearer {rng.choice(ctx['user_tokens'])}"
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                status = response.status_code
+            except Exception:
+                status = 0
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status not in ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[user_loop(n) for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def wait_ready(client, timeout: float = 60.0):
+    # Нагрузка подается только после прогрева (GET /ready), иначе первые секунды искажают p95
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get("/ready")
+        if response.status_code != 503:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Приложение не завершило прогрев")
+
+
+async def login(client, email: str) -> str:
+    response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+# ========== ОТЧЕТ И СРАВНЕНИЕ ==========
+
+def print_table(results: dict):
+    print(f"\n{'сценарий':<14}{'запросов':>10}{'rps':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'ошибок':>9}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['requests']:>10}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>9}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Регрессия - p95 вырос или rps упал больше чем на threshold (доля)."""
+    regressions = []
+    print(f"\nСравнение с базовым прогоном ({baseline['meta'].get('created_at', '?')}):")
+    for name, r in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name}: нет в базовом прогоне")
+            continue
+        p95_change = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        rps_change = (r["rps"] - base["rps"]) / base["rps"] if base["rps"] else 0.0
+        marks = []
+        if p95_change > threshold:
+            marks.append("p95")
+        if rps_change < -threshold:
+            marks.append("rps")
+        print(f"  {name:<14} p95 {base['p95_ms']} -> {r['p95_ms']} мс ({p95_change:+.0%}), "
+              f"rps {base['rps']} -> {r['rps']} ({rps_change:+.0%}){'  РЕГРЕССИЯ: ' + ', '.join(marks) if marks else ''}")
+        if marks:
+            regressions.append(name)
+    return regressions
+
+
+# ========== ЗАПУСК ==========
+
+async def main_async(args) -> dict:
+    workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = [w for w in workloads if w not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(unknown)}")
+
+    ctx = {"costumes": args.costumes, "start": date(2026, 1, 1)}
+    seed_info = None
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = await stack.enter_async_context(httpx.AsyncClient(base_url=args.url, timeout=60))
+        else:
+            workdir = tempfile.mkdtemp(prefix="bench-")
+            os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/bench.db"
+            os.environ["SUPERUSER_EMAIL"] = ADMIN_EMAIL
+            os.environ["SUPERUSER_PASSWORD"] = PASSWORD
+            os.environ["JOBS_WORKER"] = "external"
+            os.environ.setdefault("ANALYTICS_SINK", "db")
+            if not args.rate_limits:
+                os.environ["RATE_LIMIT_ENABLED"] = "false"
+            logging.disable(logging.WARNING)
+
+            from benchmarks.seed_data import seed
+            from database import engine
+            engine.echo = False
+            seed_info = await seed(args.users, args.costumes, args.orders, args.reservations, args.seed)
+            print(f"Данные: {seed_info}")
+
+            import main
+            import llm
+            fake_llm = FakeLLM(args.llm_latency)
+            main.llm_chain = llm.LLMChain([llm.Provider("fake", fake_llm)])
+            await stack.enter_async_context(main.app.router.lifespan_context(main.app))
+            transport = httpx.ASGITransport(app=main.app)
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+            )
+
+        await wait_ready(client)
+        ctx["admin_token"] = await login(client, ADMIN_EMAIL)
+        ctx["user_tokens"] = [await login(client, user_email(i)) for i in range(1, min(args.users, 20))]
+        # "Популярные" костюмы для всплеска бронирований - первые доступные
+        costumes = (await client.get("/costumes")).json()
+        ctx["hot_costumes"] = [c["id"] for c in costumes if c["available"]][:HOT_COSTUMES]
+
+        results = {}
+        for name in workloads:
+            results[name] = await run_workload(client, name, ctx, args.duration, args.concurrency, args.seed)
+            print(f"  {name}: {results[name]['requests']} запросов, p95 {results[name]['p95_ms']} мс")
+
+    background = None
+    if not args.url:
+        # Счетчики фоновой записи: потерянные события тоже регрессия
+        import analytics
+        background = {"analytics": dict(analytics.events.stats), "llm_calls": fake_llm.calls}
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "target": args.url or "in-process",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "data": seed_info,
+            "background": background,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="адрес запущенного сервера вместо запуска в процессе")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--costumes", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--reservations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="задержка заглушки LLM, с")
+    parser.add_argument("--rate-limits", action="store_true", help="не отключать ограничение частоты")
+    parser.add_argument("--save", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    # Базовый прогон читается до запуска: --save может указывать на тот же файл
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+    report = asyncio.run(main_async(args))
+    print_table(report["results"])
+
+    regressions = compare(report["results"], baseline, args.threshold) if baseline else []
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nРезультат сохранен в {args.save}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
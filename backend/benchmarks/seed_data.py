@@ -0,0 +1,127 @@
+"""
+Генератор тестовых данных для нагрузочных тестов.
+
+Заполняет БД из DATABASE_URL пользователями, костюмами, заказами и
+бронированиями. Данные детерминированы (--seed), поэтому прогоны на
+разных версиях кода сравнимы. Все пользователи получают пароль PASSWORD,
+первый из них (bench0@example.com) - администратор.
+
+Запуск из каталога backend (в пустую БД):
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.seed_data --orders 50000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from passlib.context import CryptContext
+from sqlalchemy import insert
+
+PASSWORD = "benchmark"
+ADMIN_EMAIL = "bench0@example.com"
+CHUNK = 5000
+
+WORDS = [
+    "пират", "фея", "принцесса", "рыцарь", "супергерой", "клоун", "ведьма", "снегурочка",
+    "дед мороз", "зайчик", "лиса", "мушкетер", "ковбой", "индеец", "вампир", "ангел",
+]
+COLORS = ["красный", "синий", "зеленый", "золотой", "серебряный", "черный", "белый"]
+STATUSES = ["новая", "в обработке", "завершена"]
+
+
+def user_email(i: int) -> str:
+    return f"bench{i}@example.com"
+
+
+async def _insert_chunks(session, model, rows):
+    for i in range(0, len(rows), CHUNK):
+        await session.execute(insert(model), rows[i:i + CHUNK])
+
+
+async def seed(users: int = 1000, costumes: int = 500, orders: int = 20000,
+               reservations: int = 20000, seed: int = 42, start: date = date(2026, 1, 1)) -> dict:
+    from database import AsyncSessionLocal, create_tables
+    from models import Costume, Order, Reservation, User
+
+    await create_tables()
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    # Один хеш на всех: bcrypt на каждого пользователя занял бы минуты
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+
+    async with AsyncSessionLocal() as session:
+        await _insert_chunks(session, User, [
+            {"email": user_email(i), "hashed_password": hashed, "is_active": True,
+             "is_superuser": i == 0, "is_verified": True}
+            for i in range(users)
+        ])
+        await session.flush()
+        user_ids = list(range(1, users + 1))
+
+        await _insert_chunks(session, Costume, [
+            {
+                "title": f"Костюм {rng.choice(WORDS)} {i}",
+                "description": f"{rng.choice(COLORS).capitalize()} костюм: {rng.choice(WORDS)}, {rng.choice(WORDS)}",
+                "image_filename": "placeholder.jpg",
+                "price": rng.randrange(300, 9000, 50),
+                "available": rng.random() > 0.1,
+            }
+            for i in range(costumes)
+        ])
+
+        def period():
+            first = start + timedelta(days=rng.randint(-200, 365))
+            return first, first + timedelta(days=rng.randint(0, 6))
+
+        order_rows = []
+        for i in range(orders):
+            first, last = period()
+            dated = rng.random() > 0.2
+            order_rows.append({
+                "user_id": rng.choice(user_ids),
+                "costume_id": rng.randint(1, costumes) if dated else None,
+                "title": f"Заказ {i}",
+                "phone": f"+7 900 {rng.randint(0, 9999999):07d}",
+                "date_from": first if dated else None,
+                "date_to": last if dated else None,
+                "status": rng.choice(STATUSES),
+                "created_at": datetime.combine(first, datetime.min.time()) - timedelta(days=rng.randint(1, 30)),
+            })
+        await _insert_chunks(session, Order, order_rows)
+
+        reservation_rows = []
+        for _ in range(reservations):
+            first, last = period()
+            reservation_rows.append({
+                "user_id": rng.choice(user_ids),
+                "costume_id": rng.randint(1, costumes),
+                "date_from": first,
+                "date_to": last,
+            })
+        await _insert_chunks(session, Reservation, reservation_rows)
+        await session.commit()
+
+    return {
+        "users": users, "costumes": costumes, "orders": orders, "reservations": reservations,
+        "seed": seed, "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--costumes", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--reservations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(asyncio.run(seed(args.users, args.costumes, args.orders, args.reservations, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Временная БД SQLite для микробенчмарков (bench_*.py).
+
+Бенчмарк получает свой файл во временном каталоге со схемой по моделям:
+рабочая chat_app.db и DATABASE_URL не используются, файл удаляется при
+выходе из контекста.
+
+    async with temp_database() as (engine, sessions):
+        async with sessions() as session:
+            ...
+"""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import Base
+
+
+@asynccontextmanager
+async def temp_database():
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            yield engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        finally:
+            await engine.dispose()
@@ -0,0 +1,259 @@
+"""
+Массовый импорт и экспорт каталога костюмов.
+
+Импорт: манифест CSV или JSONL (поля title, description, price, available,
+image) читается в потоке пачками по batch_size строк: загруженный файл
+больше 1 МБ лежит на диске, и чтение блокировало бы цикл событий. Для каждой пачки
+изображения извлекаются из zip-архива и сохраняются в uploads пулом потоков,
+после чего костюмы вставляются одним INSERT ... VALUES (...), (...) в
+отдельной транзакции.
+
+Экспорт: строки читаются серверным курсором (session.stream) порциями
+и сразу отдаются клиенту, весь каталог в память не загружается.
+"""
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import insert, select, text
+
+from database import AsyncSessionLocal
+from exports import stream_partitions
+from models import Costume
+from search import stem_text
+
+BATCH_SIZE = 500
+IMAGE_WORKERS = 4
+ALLOWED_EXTENSIONS = (".jpg", ".jpeg", ".png")
+EXPORT_FIELDS = ["id", "title", "description", "price", "available", "image_filename"]
+BAD_UTF8 = "\ufffd"
+
+
+# ========== ИМПОРТ ==========
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return True
+    return str(value).strip().lower() in ("1", "true", "yes", "да")
+
+
+def iter_manifest(fileobj, filename: str):
+    """
+    Построчно читает манифест, выдает (номер строки, dict или ValueError).
+    Испорченная строка (не JSON, не UTF-8) - ошибка этой строки, а не всего импорта.
+    """
+    # Некорректные байты заменяются на U+FFFD; строка CSV с ними отклоняется в _validate_row
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if BAD_UTF8 in line:
+                yield line_no, ValueError("некорректная кодировка, ожидается UTF-8")
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, ValueError(f"некорректный JSON: {e.msg}")
+    else:
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+
+
+def _next_rows(rows, size: int) -> list:
+    """Следующие size строк манифеста (выполняется в потоке: чтение файла блокирует)."""
+    return list(itertools.islice(rows, size))
+
+
+def _validate_row(row) -> dict:
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("строка манифеста должна быть JSON-объектом")
+    if any(BAD_UTF8 in str(value) for value in row.values() if value is not None):
+        raise ValueError("некорректная кодировка, ожидается UTF-8")
+    title = (row.get("title") or "").strip()
+    if not title:
+        raise ValueError("пустое title")
+    try:
+        price = int(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("price должен быть целым числом")
+    if price < 0:
+        raise ValueError("price не может быть отрицательным")
+    image = (row.get("image") or "").strip()
+    if not image:
+        raise ValueError("не указано image")
+    if os.path.splitext(image)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise ValueError("недопустимый формат изображения, только .jpg, .png")
+    return {
+        "title": title,
+        "description": (row.get("description") or None),
+        "price": price,
+        "available": _parse_bool(row.get("available")),
+        "image": image,
+    }
+
+
+def _extract_images(zip_path: str | None, names: list[str], upload_dir: Path) -> list[str | Exception]:
+    """Копирует изображения из архива в uploads (выполняется в потоке пула)."""
+    results: list[str | Exception] = []
+    if zip_path is None:
+        return [ValueError("архив с изображениями не передан") for _ in names]
+    # У каждого потока свой ZipFile: объект ZipFile нельзя читать из нескольких потоков
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in names:
+            try:
+                ext = os.path.splitext(name)[1].lower()
+                unique_filename = f"{uuid.uuid4()}{ext}"
+                with archive.open(name) as src, open(upload_dir / unique_filename, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                results.append(unique_filename)
+            except KeyError:
+                results.append(ValueError(f"файл {name} не найден в архиве"))
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+async def _save_images(pool, zip_path, names: list[str], upload_dir: Path) -> list[str | Exception]:
+    loop = asyncio.get_running_loop()
+    chunk = max(1, -(-len(names) // IMAGE_WORKERS))
+    parts = [names[i:i + chunk] for i in range(0, len(names), chunk)]
+    done = await asyncio.gather(*[
+        loop.run_in_executor(pool, _extract_images, zip_path, part, upload_dir) for part in parts
+    ])
+    return [item for part in done for item in part]
+
+
+async def _insert_batch(rows: list[dict]) -> list[int]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            insert(Costume).values(rows).returning(Costume.id, Costume.title, Costume.description)
+        )
+        inserted = result.all()
+        if session.bind.dialect.name == "sqlite":
+            await session.execute(
+                text("INSERT INTO costume_search (rowid, title, description) VALUES (:id, :title, :description)"),
+                [{"id": cid, "title": stem_text(t), "description": stem_text(d)} for cid, t, d in inserted],
+            )
+        await session.commit()
+        return [cid for cid, _, _ in inserted]
+
+
+def _spool_to_disk(fileobj) -> str:
+    tmp = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
+    with tmp:
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, tmp)
+    return tmp.name
+
+
+async def import_costumes(manifest_file, manifest_name: str, images_file, upload_dir: Path,
+                          batch_size: int = BATCH_SIZE, max_errors: int = 100):
+    started = time.perf_counter()
+    zip_path = await asyncio.to_thread(_spool_to_disk, images_file) if images_file is not None else None
+    imported_ids: list[int] = []
+    errors: list[dict] = []
+    error_count = 0
+
+    def add_error(line_no, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < max_errors:
+            errors.append({"line": line_no, "error": str(message)})
+
+    async def flush(batch):
+        if not batch:
+            return
+        names = [row["image"] for _, row in batch]
+        saved = await _save_images(pool, zip_path, names, upload_dir)
+        rows = []
+        for (line_no, row), image in zip(batch, saved):
+            if isinstance(image, Exception):
+                add_error(line_no, image)
+                continue
+            rows.append({
+                "title": row["title"],
+                "description": row["description"],
+                "price": row["price"],
+                "available": row["available"],
+                "image_filename": image,
+            })
+        if rows:
+            try:
+                imported_ids.extend(await _insert_batch(rows))
+            except Exception as e:
+                # Пачка не вставилась - удаляем уже сохраненные изображения
+                for r in rows:
+                    (upload_dir / r["image_filename"]).unlink(missing_ok=True)
+                add_error(batch[0][0], f"ошибка вставки пачки: {e}")
+
+    pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="costume-import")
+    try:
+        await asyncio.to_thread(manifest_file.seek, 0)
+        rows = iter_manifest(manifest_file, manifest_name)
+        while chunk := await asyncio.to_thread(_next_rows, rows, batch_size):
+            batch = []
+            for line_no, raw in chunk:
+                try:
+                    batch.append((line_no, _validate_row(raw)))
+                except ValueError as e:
+                    add_error(line_no, e)
+            await flush(batch)
+    finally:
+        pool.shutdown(wait=True)
+        if zip_path is not None:
+            os.unlink(zip_path)
+
+    seconds = time.perf_counter() - started
+    return {
+        "imported": len(imported_ids),
+        "failed": error_count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(len(imported_ids) / seconds, 1) if seconds > 0 else None,
+    }
+
+
+# ========== ЭКСПОРТ ==========
+
+async def export_rows(chunk_size: int = 1000):
+    stmt = select(
+        Costume.id, Costume.title, Costume.description,
+        Costume.price, Costume.available, Costume.image_filename,
+    ).order_by(Costume.id)
+    async for partition in stream_partitions(stmt, chunk_size):
+        yield partition
+
+
+async def export_jsonl():
+    async for partition in export_rows():
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n" for row in partition
+        ).encode("utf-8")
+
+
+async def export_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode("utf-8-sig")
+    async for partition in export_rows():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(partition)
+        yield buffer.getvalue().encode("utf-8")
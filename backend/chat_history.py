@@ -0,0 +1,156 @@
+"""
+История диалога для авторизованного чата.
+
+Для каждого пользователя в памяти хранится кольцевой буфер последних реплик
+(deque, размер которого ограничен MAX_TURNS) и краткое резюме более старой части диалога.
+Когда буфер переполняется, самые старые реплики сворачиваются в резюме,
+поэтому объем памяти на пользователя ограничен.
+
+Сохранение в таблицу chat_messages идет в фоне: реплики кладутся в очередь,
+а фоновая задача записывает их пачками (одна транзакция на пачку), так что
+обработчик запроса не ждет коммита.
+"""
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+
+from batch_writer import BatchWriter
+from database import AsyncSessionLocal
+from models import ChatMessage
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Сколько реплик держим целиком, прежде чем свернуть старые в резюме
+MAX_TURNS = 12
+# Ограничение на размер контекста, отправляемого в Gemini (приблизительно, в токенах)
+MAX_CONTEXT_TOKENS = 1500
+# Ограничение длины резюме в символах
+MAX_SUMMARY_CHARS = 1200
+# Сколько пользователей держим в памяти одновременно
+MAX_USERS = 5000
+
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка: ~4 символа на токен, этого достаточно для ограничения контекста
+    return len(text) // 4 + 1
+
+
+def summarize(previous: str, turns) -> str:
+    """
+    Сворачивает старые реплики в короткое резюме без обращения к LLM:
+    сохраняются только вопросы пользователя, обрезанные до одной строки.
+    """
+    questions = [text.strip().replace("\n", " ")[:120] for role, text in turns if role == "user"]
+    if not questions:
+        return previous
+    summary = (previous + "; " if previous else "Ранее пользователь спрашивал: ") + "; ".join(questions)
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = "…" + summary[-MAX_SUMMARY_CHARS:]
+    return summary
+
+
+class Conversation:
+    __slots__ = ("turns", "summary")
+
+    def __init__(self):
+        self.turns: deque = deque()
+        self.summary = ""
+
+
+class ConversationStore:
+    def __init__(self, max_turns: int = MAX_TURNS, max_users: int = MAX_USERS,
+                 batch_size: int = 100, flush_interval: float = 1.0):
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self._conversations: OrderedDict[int, Conversation] = OrderedDict()
+        self.writer = BatchWriter("chat_messages", self._write, batch_size, flush_interval)
+        # Одновременные первые запросы пользователя ждут одну загрузку истории: иначе каждый
+        # загрузил бы свою копию и последняя затерла бы реплики, добавленные в остальные
+        # (здесь общий результат изменяется намеренно: все получают один объект Conversation)
+        self._loads = SingleFlight("chat_history")
+
+    # ---------- история в памяти ----------
+
+    async def _get(self, user_id: int) -> Conversation:
+        conv = self._conversations.get(user_id)
+        if conv is not None:
+            self._conversations.move_to_end(user_id)
+            return conv
+        return await self._loads.do(user_id, lambda: self._load(user_id))
+
+    async def _load(self, user_id: int) -> Conversation:
+        conv = Conversation()
+        # После перезапуска поднимаем последние реплики из БД
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(ChatMessage.role, ChatMessage.text)
+                    .where(ChatMessage.user_id == user_id)
+                    .order_by(ChatMessage.id.desc())
+                    .limit(self.max_turns)
+                )
+                conv.turns.extend(reversed(result.all()))
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить историю чата пользователя {user_id}: {e}")
+        self._conversations[user_id] = conv
+        if len(self._conversations) > self.max_users:
+            self._conversations.popitem(last=False)
+        return conv
+
+    async def context(self, user_id: int, max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+        """Текст истории для промпта: резюме + последние реплики в пределах лимита токенов."""
+        conv = await self._get(user_id)
+        lines = []
+        budget = max_tokens
+        for role, text in reversed(conv.turns):
+            line = f"{'Клиент' if role == 'user' else 'Помощник'}: {text}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            lines.append(line)
+            budget -= cost
+        lines.reverse()
+        if conv.summary and estimate_tokens(conv.summary) <= budget:
+            lines.insert(0, conv.summary)
+        return "\n".join(lines)
+
+    async def append(self, user_id: int, role: str, text: str):
+        conv = await self._get(user_id)
+        conv.turns.append((role, text))
+        if len(conv.turns) > self.max_turns:
+            # Сворачиваем старшую половину буфера в резюме
+            old = [conv.turns.popleft() for _ in range(len(conv.turns) - self.max_turns // 2)]
+            conv.summary = summarize(conv.summary, old)
+        self._enqueue({
+            "user_id": user_id,
+            "role": role,
+            "text": text,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+    # ---------- фоновая запись в БД ----------
+
+    def _enqueue(self, row: dict):
+        if not self.writer.put(row):
+            logger.warning("Очередь записи истории чата недоступна или переполнена, сообщение не сохранено")
+
+    def start(self):
+        self.writer.start()
+
+    async def stop(self):
+        await self.writer.stop()
+
+    async def flush(self):
+        """Записывает все, что накопилось в очереди (используется при остановке и чтении истории)."""
+        await self.writer.flush()
+
+    async def _write(self, batch: list[dict]):
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(ChatMessage), batch)
+            await session.commit()
+
+
+chat_history = ConversationStore()
@@ -1,13 +1,35 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
-DATABASE_URL = "sqlite+aiosqlite:///./chat_app.db"
+import os
 
-engine = create_async_engine(
-    DATABASE_URL,  
-    connect_args={"check_same_thread": False},  
-    echo=True,  
-)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./chat_app.db")
+
+# Кэш скомпилированных запросов движка (запросы из statements.py и остальные)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1000"))
+# Подготовленные выражения на соединение (только asyncpg): повторный запрос
+# не разбирается и не планируется сервером заново
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))
+
+
+def engine_connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"check_same_thread": False}
+    if url.startswith("postgresql+asyncpg"):
+        return {"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE}
+    return {}
+
+
+def make_engine(url: str):
+    return create_async_engine(
+        url,  
+        connect_args=engine_connect_args(url),  
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        echo=True,  
+    )
+
+
+engine = make_engine(DATABASE_URL)
 
 
 AsyncSessionLocal = async_sessionmaker(
@@ -18,6 +40,12 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=True, 
 )
 
+# Реплики только для чтения, через запятую; маршрутизация чтений - replicas.py.
+# Схему и данные на реплики переносит репликация БД, приложение в них не пишет
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+replica_engines = [make_engine(url) for url in DATABASE_REPLICA_URLS]
+
 Base = declarative_base()
 
 
@@ -29,9 +57,65 @@ async def get_async_session() -> AsyncSession:
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_autoincrement)
+        await conn.run_sync(create_missing_indexes)
     await migrate_missing_columns()
 
 
+# Таблицы с AUTOINCREMENT (models.py) и их архивы: id из архива не должен
+# достаться новой строке, поэтому счетчик начинается после максимального из обоих
+AUTOINCREMENT_TABLES = {"orders": "order_history", "reservations": "reservation_history"}
+
+
+def migrate_autoincrement(sync_conn):
+    from sqlalchemy import text
+
+    if sync_conn.dialect.name != "sqlite":
+        return
+    for name, history in AUTOINCREMENT_TABLES.items():
+        sql = sync_conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+        ).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            continue
+        # SQLite не умеет менять первичный ключ: таблица пересоздается с копированием строк
+        table = Base.metadata.tables[name]
+        old_columns = {row[1] for row in sync_conn.execute(text(f"PRAGMA table_info({name})"))}
+        columns = ", ".join(c.name for c in table.columns if c.name in old_columns)
+        sync_conn.execute(text(f"ALTER TABLE {name} RENAME TO _{name}_old"))
+        for (index,) in sync_conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+        ), {"name": f"_{name}_old"}).all():
+            sync_conn.execute(text(f"DROP INDEX {index}"))
+        table.create(sync_conn)
+        sync_conn.execute(text(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM _{name}_old"))
+        sync_conn.execute(text(f"DROP TABLE _{name}_old"))
+        top = sync_conn.execute(text(
+            f"SELECT max(coalesce((SELECT max(id) FROM {name}), 0), coalesce((SELECT max(id) FROM {history}), 0))"
+        )).scalar()
+        sync_conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": name})
+        sync_conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": name, "seq": top})
+        print(f"✅ Таблица {name} пересоздана с AUTOINCREMENT")
+
+
+# Одиночные индексы, которые заменены составными (см. models.py)
+REDUNDANT_INDEXES = [
+    "ix_orders_user_id", "ix_orders_costume_id",
+    "ix_reservations_user_id", "ix_reservations_costume_id",
+]
+
+
+def create_missing_indexes(sync_conn):
+    from sqlalchemy import text
+
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for name in REDUNDANT_INDEXES:
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def migrate_missing_columns():
     from sqlalchemy import text
     
@@ -0,0 +1,65 @@
+"""
+Потоковая выгрузка таблиц в NDJSON или CSV.
+
+Строки читаются серверным курсором (session.stream + yield_per) порциями
+и сразу отдаются в StreamingResponse, поэтому память не зависит от числа
+строк. При gzip=True поток сжимается на лету.
+"""
+import csv
+import io
+import zlib
+
+from database import AsyncSessionLocal
+from serializers import RowEncoder, dumps
+
+CHUNK_SIZE = 1000
+
+
+async def stream_partitions(stmt, chunk_size: int = CHUNK_SIZE):
+    # Своя сессия: зависимость get_async_session закрывается раньше, чем дочитается поток
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def ndjson_stream(stmt, encoder: RowEncoder):
+    to_dict = encoder.to_dict
+    async for partition in stream_partitions(stmt):
+        yield b"".join(dumps(to_dict(row)) + b"\n" for row in partition)
+
+
+async def csv_stream(stmt, encoder: RowEncoder):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    to_dict = encoder.to_dict
+    writer.writerow([field for field, _ in encoder.fields])
+    # BOM, чтобы Excel открыл UTF-8 без вопросов
+    yield buffer.getvalue().encode("utf-8-sig")
+    async for partition in stream_partitions(stmt):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(to_dict(row).values() for row in partition)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 - формат gzip
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(stmt, encoder: RowEncoder, fmt: str, gzip: bool = False):
+    """Возвращает (асинхронный генератор байтов, media_type, расширение файла)."""
+    if fmt == "csv":
+        chunks, media_type, ext = csv_stream(stmt, encoder), "text/csv; charset=utf-8", "csv"
+    elif fmt in ("ndjson", "jsonl"):
+        chunks, media_type, ext = ndjson_stream(stmt, encoder), "application/x-ndjson", "ndjson"
+    else:
+        raise ValueError(fmt)
+    if gzip:
+        return gzip_stream(chunks), "application/gzip", ext + ".gz"
+    return chunks, media_type, ext
@@ -0,0 +1,149 @@
+"""
+Заглушка LLM-сервера для проверки цепочки моделей и выключателей (llm.py).
+
+Отвечает на POST /models/<имя> с телом {"prompt": ...} ответом {"text": ...}.
+Для каждой модели задаются задержка и доля ошибок (HTTP 500); их можно
+менять на ходу:
+    POST /control  {"model": "primary", "latency": 2.0, "error_rate": 1.0}
+    ("model": "*" - для всех моделей)
+    GET  /stats    число вызовов и ошибок по моделям
+    POST /reset    сброс настроек и счетчиков
+
+Запуск и подключение:
+    python fake_llm_server.py [--port 8089] [--latency 0.2] [--error-rate 0.1]
+    LLM_CHAIN=http://127.0.0.1:8089/models/primary,http://127.0.0.1:8089/models/cheap uvicorn main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8089, latency: float = 0.0, error_rate: float = 0.0):
+        self.defaults = {"latency": latency, "error_rate": error_rate}
+        self.config: dict[str, dict] = {}
+        self.stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def model_url(self, name: str) -> str:
+        return f"{self.url}/models/{name}"
+
+    def configure(self, model: str = "*", **values):
+        with self._lock:
+            if model == "*":
+                self.defaults.update(values)
+                for config in self.config.values():
+                    config.update(values)
+            else:
+                self.config.setdefault(model, dict(self.defaults)).update(values)
+
+    def reset(self):
+        with self._lock:
+            self.defaults = {"latency": 0.0, "error_rate": 0.0}
+            self.config.clear()
+            self.stats.clear()
+
+    def calls(self, model: str) -> int:
+        return self.stats.get(model, {}).get("calls", 0)
+
+    def generate(self, model: str, prompt: str) -> str | None:
+        """Текст ответа или None, если нужно вернуть ошибку."""
+        with self._lock:
+            config = dict(self.config.get(model, self.defaults))
+            stats = self.stats.setdefault(model, {"calls": 0, "errors": 0})
+            stats["calls"] += 1
+            failed = random.random() < config["error_rate"]
+            if failed:
+                stats["errors"] += 1
+        time.sleep(config["latency"])
+        if failed:
+            return None
+        return f"[{model}] Ответ на вопрос длиной {len(prompt)} символов."
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, payload: dict):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # клиент уже ушел по таймауту
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    with server._lock:
+                        self._reply(200, {"models": server.stats, "config": server.config, "defaults": server.defaults})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = self._body()
+                if self.path.startswith("/models/"):
+                    text = server.generate(self.path[len("/models/"):], body.get("prompt", ""))
+                    if text is None:
+                        self._reply(500, {"error": "injected failure"})
+                    else:
+                        self._reply(200, {"text": text})
+                elif self.path == "/control":
+                    model = body.pop("model", "*")
+                    server.configure(model, **{k: float(v) for k, v in body.items() if k in ("latency", "error_rate")})
+                    self._reply(200, {"ok": True})
+                elif self.path == "/reset":
+                    server.reset()
+                    self._reply(200, {"ok": True})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+        return Handler
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeLLMServer(args.host, args.port, args.latency, args.error_rate)
+    print(f"Заглушка LLM слушает {server.url} (задержка {args.latency} с, ошибок {args.error_rate:.0%})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
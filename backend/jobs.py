@@ -0,0 +1,306 @@
+"""
+Очередь фоновых задач: письма, обработка файлов и прочие медленные побочные эффекты.
+
+Обработчик запроса вызывает enqueue() - задача записывается в таблицу jobs
+и запрос сразу завершается. Воркер (JobWorker) забирает готовые задачи
+атомарным UPDATE ... RETURNING, выполняет их и помечает done. При ошибке
+задача возвращается в очередь с экспоненциальной задержкой, после
+max_attempts попыток - помечается failed.
+
+Воркер работает либо внутри приложения (JOBS_WORKER=inline, по умолчанию),
+либо отдельным процессом: JOBS_WORKER=external и `python worker.py`.
+Несколько воркеров могут работать одновременно - задачу забирает только один.
+
+Выполненные задачи удаляются через JOBS_DONE_RETENTION_DAYS дней, failed -
+через JOBS_FAILED_RETENTION_DAYS (purge_finished, вызывается из maintenance.py):
+payload писем содержит адреса и тексты, хранить их бессрочно незачем.
+
+Типы задач регистрируются декоратором:
+
+    @jobs.handler("send_email", concurrency=2)
+    async def send_email(to, subject, body): ...
+
+concurrency - сколько задач этого типа один воркер выполняет одновременно.
+
+Изображения костюмов и фото профиля в очередь не ставятся: они сохраняются
+как есть, без пережатия и миниатюр, и запись файла уже идет в потоке
+(save_upload в main.py, пул потоков в catalog_io.py). Ответ на загрузку
+должен ссылаться на готовый файл, а отложенная запись этого не дает. Когда
+появится обработка (миниатюры, пережатие), она станет задачей этой очереди.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+
+from database import AsyncSessionLocal
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+JOBS_WORKER = os.getenv("JOBS_WORKER", "inline").lower()
+POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "2.0"))
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+# Задача в статусе running дольше этого времени считается брошенной (воркер упал)
+LOCK_TIMEOUT = 600.0
+JOBS_DONE_RETENTION_DAYS = float(os.getenv("JOBS_DONE_RETENTION_DAYS", "7"))
+# failed хранятся дольше: их можно вернуть в очередь (retry_job)
+JOBS_FAILED_RETENTION_DAYS = float(os.getenv("JOBS_FAILED_RETENTION_DAYS", "30"))
+PURGE_BATCH = 1000
+
+
+@dataclass
+class JobType:
+    kind: str
+    run: object
+    concurrency: int = 1
+    max_attempts: int = 5
+    timeout: float = 60.0
+
+
+HANDLERS: dict[str, JobType] = {}
+
+
+def handler(kind: str, concurrency: int = 1, max_attempts: int = 5, timeout: float = 60.0):
+    def register(func):
+        HANDLERS[kind] = JobType(kind, func, concurrency, max_attempts, timeout)
+        return func
+    return register
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def enqueue(kind: str, payload: dict, delay: float = 0, session=None) -> int:
+    """
+    Ставит задачу в очередь. Если передана session, задача добавляется в ее
+    транзакцию и появится в очереди только после commit вызывающего кода.
+    """
+    job_type = HANDLERS.get(kind)
+    if job_type is None:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    now = utcnow()
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload, ensure_ascii=False, default=str),
+        status="queued",
+        attempts=0,
+        max_attempts=job_type.max_attempts,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+    )
+    if session is not None:
+        session.add(job)
+        await session.flush()
+        return job.id
+    async with AsyncSessionLocal() as own_session:
+        own_session.add(job)
+        await own_session.commit()
+    worker.wake()
+    return job.id
+
+
+class JobWorker:
+    def __init__(self, worker_id: str | None = None, poll_interval: float = POLL_INTERVAL):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stats = {"done": 0, "retried": 0, "failed": 0, "recovered": 0}
+        self.running: dict[str, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._loop_task: asyncio.Task | None = None
+        self._stopping = False
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._loop_task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run(), name="job-worker")
+            logger.info(f"Воркер задач {self.worker_id} запущен, типы: {', '.join(HANDLERS)}")
+
+    async def stop(self, grace: float = 10.0):
+        if self._loop_task is None:
+            return
+        # Цикл выходит между опросами, а не отменяется посреди UPDATE ... RETURNING
+        self._stopping = True
+        self.wake()
+        await self._loop_task
+        self._loop_task = None
+        # Даем текущим задачам завершиться; прерванные вернутся в очередь через LOCK_TIMEOUT
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=grace)
+
+    async def _run(self):
+        last_recovery = 0.0
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                if loop.time() - last_recovery > LOCK_TIMEOUT / 2:
+                    last_recovery = loop.time()
+                    await self.recover_stale()
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера задач: {e}")
+            if self._stopping:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> int:
+        """Забирает готовые задачи в пределах свободных слотов каждого типа."""
+        started = 0
+        for kind, job_type in HANDLERS.items():
+            free = job_type.concurrency - self.running.get(kind, 0)
+            if free <= 0:
+                continue
+            for job in await self.claim(kind, free):
+                self.running[kind] = self.running.get(kind, 0) + 1
+                task = asyncio.create_task(self._execute(job_type, job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                started += 1
+        return started
+
+    async def claim(self, kind: str, limit: int) -> list:
+        now = utcnow()
+        ready = (
+            select(Job.id)
+            .where(Job.status == "queued", Job.kind == kind, Job.run_at <= now)
+            .order_by(Job.run_at, Job.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as session:
+            # Повторная проверка status в UPDATE не дает двум воркерам забрать одну задачу
+            result = await session.execute(
+                update(Job)
+                .where(Job.id.in_(ready), Job.status == "queued")
+                .values(status="running", attempts=Job.attempts + 1, locked_by=self.worker_id, locked_at=now)
+                .returning(Job.id, Job.payload, Job.attempts, Job.max_attempts)
+                .execution_options(synchronize_session=False)
+            )
+            jobs = result.all()
+            await session.commit()
+        return jobs
+
+    async def _execute(self, job_type: JobType, job):
+        job_id, payload, attempts, max_attempts = job
+        try:
+            await asyncio.wait_for(job_type.run(**json.loads(payload)), timeout=job_type.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempts >= max_attempts:
+                self.stats["failed"] += 1
+                logger.error(f"Задача {job_type.kind}#{job_id} не выполнена после {attempts} попыток: {error}")
+                await self._finish(job_id, status="failed", last_error=error, finished_at=utcnow())
+            else:
+                self.stats["retried"] += 1
+                delay = backoff(attempts)
+                logger.warning(f"Задача {job_type.kind}#{job_id} (попытка {attempts}) повторится через {delay:.0f} с: {error}")
+                await self._finish(job_id, status="queued", last_error=error,
+                                   run_at=utcnow() + timedelta(seconds=delay))
+        else:
+            self.stats["done"] += 1
+            await self._finish(job_id, status="done", finished_at=utcnow())
+        finally:
+            self.running[job_type.kind] -= 1
+            self.wake()
+
+    async def _finish(self, job_id: int, **values):
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(Job).where(Job.id == job_id)
+                .values(locked_by=None, locked_at=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def recover_stale(self) -> int:
+        """Возвращает в очередь задачи, захваченные упавшим воркером."""
+        deadline = utcnow() - timedelta(seconds=LOCK_TIMEOUT)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(Job)
+                .where(Job.status == "running", Job.locked_at < deadline)
+                .values(status="queued", locked_by=None, locked_at=None, run_at=utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        if result.rowcount:
+            self.stats["recovered"] += result.rowcount
+            logger.warning(f"Возвращено в очередь брошенных задач: {result.rowcount}")
+        return result.rowcount
+
+
+worker = JobWorker()
+
+
+async def job_stats(session) -> dict:
+    result = await session.execute(
+        select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status)
+    )
+    counts: dict[str, dict[str, int]] = {}
+    for kind, status, count in result.all():
+        counts.setdefault(kind, {})[status] = count
+    return {"mode": JOBS_WORKER, "worker": worker.worker_id, "counts": counts,
+            "running": dict(worker.running), "stats": dict(worker.stats)}
+
+
+async def retry_job(session, job_id: int) -> bool:
+    result = await session.execute(
+        update(Job).where(Job.id == job_id, Job.status == "failed")
+        .values(status="queued", attempts=0, run_at=utcnow(), finished_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    if result.rowcount:
+        worker.wake()
+    return bool(result.rowcount)
+
+
+async def purge_finished(batch_size: int = PURGE_BATCH) -> dict:
+    """Удаляет завершенные задачи старше срока хранения, пачками в коротких транзакциях."""
+    now = utcnow()
+    purged = {}
+    for status, days in (("done", JOBS_DONE_RETENTION_DAYS), ("failed", JOBS_FAILED_RETENTION_DAYS)):
+        cutoff = now - timedelta(days=days)
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as session:
+                ids = (await session.execute(
+                    select(Job.id).where(Job.status == status, Job.finished_at < cutoff).limit(batch_size)
+                )).scalars().all()
+                if not ids:
+                    break
+                await session.execute(
+                    delete(Job).where(Job.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+                await session.commit()
+            total += len(ids)
+            await asyncio.sleep(0)
+        purged[status] = total
+    return purged
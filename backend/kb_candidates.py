@@ -0,0 +1,310 @@
+"""
+Заготовка ответов на частые вопросы, которых нет в базе знаний.
+
+Большая часть вопросов чата - перефразировки нескольких десятков тем, но
+каждый промах find_in_knowledge_base() идет в LLM. Задача kb_candidates
+собирает из аналитики вопросы, на которые база знаний не ответила (source
+llm, kb_retrieval или fallback), и группирует их по основам слов: вопрос
+попадает в группу, если его основы совпадают с основами самой частой
+формулировки группы не меньше чем на CLUSTER_SIMILARITY (коэффициент Жаккара).
+
+Для TOP_CLUSTERS самых частых групп ответ заранее генерирует цепочка LLM -
+пачками по BATCH_SIZE, не больше CONCURRENCY вызовов одновременно и не чаще
+RATE_PER_SECOND в секунду, - и сохраняется в knowledge_candidates со
+статусом pending. Администратор просматривает и правит кандидатов
+(GET /knowledge-base/candidates); одобренный ответ становится записью
+раздела "вопросы", и дальше его перефразировки отвечаются из индекса в
+памяти без вызова LLM.
+
+Для уже сохраненных кандидатов LLM повторно не вызывается - обновляется
+только число вопросов. Отклоненные вопросы больше не предлагаются.
+
+Запуск: POST /knowledge-base/candidates/generate (задача очереди) или вручную
+    python kb_candidates.py [--top 20] [--days 30] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+import analytics
+import jobs
+import llm
+from database import AsyncSessionLocal
+from knowledge_base import kb_index, load_knowledge_base, preprocess_text, significant_stems
+from models import AnalyticsEvent, KnowledgeCandidate, KnowledgeEntry
+
+logger = logging.getLogger(__name__)
+
+TOP_CLUSTERS = int(os.getenv("KB_CANDIDATES_TOP", "20"))
+MIN_HITS = int(os.getenv("KB_CANDIDATES_MIN_HITS", "3"))
+LOOKBACK_DAYS = int(os.getenv("KB_CANDIDATES_DAYS", "30"))
+MAX_EVENTS = 50_000
+CLUSTER_SIMILARITY = 0.5
+BATCH_SIZE = int(os.getenv("KB_CANDIDATES_BATCH", "8"))
+CONCURRENCY = int(os.getenv("KB_CANDIDATES_CONCURRENCY", "4"))
+RATE_PER_SECOND = float(os.getenv("KB_CANDIDATES_RATE", "2.0"))
+EXAMPLES = 5
+
+MISSED_SOURCES = ("llm", "kb_retrieval", "fallback")
+
+# Собственная цепочка: пакетная генерация не размыкает выключатели живого чата
+_chain: llm.LLMChain | None = None
+
+
+def get_chain() -> llm.LLMChain:
+    global _chain
+    if _chain is None:
+        _chain = llm.create_chain()
+    return _chain
+
+
+# ========== СБОР ВОПРОСОВ ==========
+
+def _missed(payload: dict | None) -> str | None:
+    if payload and payload.get("source") in MISSED_SOURCES and payload.get("question"):
+        return payload["question"]
+    return None
+
+
+async def _missed_from_db(since: datetime, limit: int) -> list[str]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(AnalyticsEvent.payload)
+            .where(AnalyticsEvent.kind == "chat", AnalyticsEvent.created_at >= since)
+            .order_by(AnalyticsEvent.id.desc())
+            .limit(limit)
+        )
+        payloads = result.scalars().all()
+    return [q for q in (_missed(json.loads(p)) for p in payloads if p) if q]
+
+
+def _missed_from_file(since: datetime, limit: int) -> list[str]:
+    questions = []
+    if not analytics.ANALYTICS_FILE.exists():
+        return questions
+    with open(analytics.ANALYTICS_FILE, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                if row.get("kind") != "chat" or datetime.fromisoformat(row["created_at"]) < since:
+                    continue
+            except (ValueError, KeyError):
+                continue  # недописанная строка
+            question = _missed(row.get("payload"))
+            if question:
+                questions.append(question)
+    return questions[-limit:]
+
+
+async def missed_questions(days: int = LOOKBACK_DAYS, limit: int = MAX_EVENTS) -> list[str]:
+    """Вопросы чата за последние days дней, на которые не ответила база знаний."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    if analytics.ANALYTICS_SINK == "file":
+        return await asyncio.to_thread(_missed_from_file, since, limit)
+    return await _missed_from_db(since, limit)
+
+
+# ========== ГРУППИРОВКА ==========
+
+@dataclass
+class Cluster:
+    key: str  # самая частая формулировка (после preprocess_text)
+    stems: frozenset
+    variants: Counter = field(default_factory=Counter)
+
+    @property
+    def hits(self) -> int:
+        return sum(self.variants.values())
+
+    def examples(self) -> list[str]:
+        return [text for text, _ in self.variants.most_common(EXAMPLES)]
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b)
+
+
+def cluster_questions(questions: list[str], similarity: float = CLUSTER_SIMILARITY) -> list[Cluster]:
+    """
+    Жадная группировка: формулировки перебираются от частых к редким, каждая
+    присоединяется к самой похожей группе или открывает новую. Группы - по
+    убыванию числа вопросов.
+    """
+    counts = Counter(t for t in (preprocess_text(q).strip() for q in questions) if t)
+    clusters: list[Cluster] = []
+    by_stem: dict[str, list[Cluster]] = {}
+    for text, count in counts.most_common():
+        stems = significant_stems(text)
+        if not stems:
+            continue
+        candidates = {id(c): c for s in stems for c in by_stem.get(s, ())}.values()
+        best, best_score = None, similarity
+        for cluster in candidates:
+            score = _similarity(stems, cluster.stems)
+            if score >= best_score:
+                best, best_score = cluster, score
+        if best is None:
+            best = Cluster(text, stems)
+            clusters.append(best)
+            for s in stems:
+                by_stem.setdefault(s, []).append(best)
+        best.variants[text] += count
+    clusters.sort(key=lambda c: c.hits, reverse=True)
+    return clusters
+
+
+# ========== ГЕНЕРАЦИЯ ==========
+
+class RateLimiter:
+    """Не чаще rate вызовов в секунду: каждый вызов получает свой интервал."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _save(batch: list[tuple[Cluster, llm.LLMAnswer]]):
+    now = jobs.utcnow()
+    async with AsyncSessionLocal() as session:
+        for cluster, answer in batch:
+            session.add(KnowledgeCandidate(
+                key=cluster.key,
+                answer=answer.text.strip(),
+                examples=json.dumps(cluster.examples(), ensure_ascii=False),
+                hits=cluster.hits,
+                model=answer.provider,
+                status="pending",
+                created_at=now,
+            ))
+        await session.commit()
+
+
+async def _refresh_pending(clusters: list[Cluster]):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(KnowledgeCandidate).where(KnowledgeCandidate.key.in_([c.key for c in clusters]))
+        )
+        by_key = {c.key: c for c in clusters}
+        for candidate in result.scalars().all():
+            candidate.hits = by_key[candidate.key].hits
+            candidate.examples = json.dumps(by_key[candidate.key].examples(), ensure_ascii=False)
+        await session.commit()
+
+
+async def _known_keys(keys: list[str]) -> tuple[set[str], set[str]]:
+    """Ключи уже сохраненных кандидатов: (pending, все остальные + записи базы знаний)."""
+    async with AsyncSessionLocal() as session:
+        if kb_index.version == 0:
+            # Отдельный процесс (worker.py, CLI): индекс базы знаний еще не загружен
+            await load_knowledge_base(session)
+        candidates = (await session.execute(
+            select(KnowledgeCandidate.key, KnowledgeCandidate.status).where(KnowledgeCandidate.key.in_(keys))
+        )).all()
+        entries = (await session.execute(
+            select(KnowledgeEntry.key).where(KnowledgeEntry.section == "вопросы", KnowledgeEntry.key.in_(keys))
+        )).scalars().all()
+    pending = {key for key, status in candidates if status == "pending"}
+    done = {key for key, status in candidates if status != "pending"} | set(entries)
+    return pending, done
+
+
+async def generate_candidates(
+    top: int = TOP_CLUSTERS,
+    days: int = LOOKBACK_DAYS,
+    min_hits: int = MIN_HITS,
+    chain: llm.LLMChain | None = None,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+    rate: float = RATE_PER_SECOND,
+    dry_run: bool = False,
+) -> dict:
+    started = time.perf_counter()
+    questions = await missed_questions(days)
+    clusters = [c for c in cluster_questions(questions) if c.hits >= min_hits]
+    pending, done = await _known_keys([c.key for c in clusters])
+    # База знаний могла пополниться после того, как вопрос был задан
+    fresh = [c for c in clusters if c.key not in done and c.key not in pending and kb_index.find(c.key) is None]
+    report = {
+        "questions": len(questions),
+        "clusters": len(clusters),
+        "refreshed": 0,
+        "generated": 0,
+        "failed": 0,
+    }
+    if dry_run:
+        report["top"] = [{"key": c.key, "hits": c.hits, "examples": c.examples()} for c in fresh[:top]]
+        return report
+
+    await _refresh_pending([c for c in clusters if c.key in pending])
+    report["refreshed"] = len(pending)
+
+    chain = chain or get_chain()
+    if not chain.providers:
+        logger.warning("Заготовка ответов: в цепочке LLM нет моделей")
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        return report
+
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(cluster: Cluster) -> llm.LLMAnswer | None:
+        async with semaphore:
+            await limiter.wait()
+            return await chain.generate(llm.build_prompt(cluster.key))
+
+    todo = fresh[:top]
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        answers = await asyncio.gather(*(answer(c) for c in batch))
+        ok = [(c, a) for c, a in zip(batch, answers) if a is not None]
+        if ok:
+            # Каждая пачка сохраняется сразу: прерванный запуск не теряет готовые ответы
+            await _save(ok)
+        report["generated"] += len(ok)
+        report["failed"] += len(batch) - len(ok)
+        if not ok:
+            logger.warning("Заготовка ответов: модели не ответили ни на один вопрос пачки, запуск прерван")
+            break
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Заготовка ответов базы знаний: {report}")
+    return report
+
+
+# Повторять не нужно: следующий запуск продолжит с тех же групп
+@jobs.handler("kb_candidates", concurrency=1, max_attempts=1, timeout=1800.0)
+async def kb_candidates_job(top: int = TOP_CLUSTERS, days: int = LOOKBACK_DAYS, min_hits: int = MIN_HITS):
+    await generate_candidates(top=top, days=days, min_hits=min_hits)
+
+
+async def _main(args):
+    from database import create_tables
+
+    await create_tables()
+    report = await generate_candidates(top=args.top, days=args.days, min_hits=args.min_hits, dry_run=args.dry_run)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Заготовка ответов на частые вопросы чата")
+    parser.add_argument("--top", type=int, default=TOP_CLUSTERS)
+    parser.add_argument("--days", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--min-hits", type=int, default=MIN_HITS)
+    parser.add_argument("--dry-run", action="store_true", help="только показать группы, без вызова LLM")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,36 +1,347 @@
-knowledge_base = {
-    "термины": {
-        "ателье": "Мастерская 'Новый Стиль', занимающаяся пошивом, ремонтом и декорированием одежды и текстиля, а также печатью на кружках и предметах.",
-        "ремонт одежды": "Комплекс работ по восстановлению, изменению или подгонке предметов одежды и текстиля.",
-        "пошив одежды": "Создание нового предмета одежды по индивидуальным меркам или типовым размерам.",
-        "вышивка": "Нанесение изображений, узоров, логотипов или надписей на ткань с помощью специальных нитей и вышивальной машины.",
-        "печать на кружках": "Нанесение изображений, логотипов или надписей на кружки с использованием различных технологий термотрансфера.",
-        "печать на одежде": "Нанесение изображений, логотипов или надписей на предметы одежды (футболки, толстовки, кепки) с использованием различных технологий печати.",
-        "прием заказа": "Процесс оформления запроса клиента на услугу, обсуждение деталей, снятие мерок, выбор материалов и определение стоимости.",
-        "мастер": "Квалифицированный специалист ателье 'Новый Стиль', выполняющий работы по ремонту, пошиву, вышивке или печати.",
-        "подгон по фигуре": "Изменение размеров одежды (укорачивание, удлинение, зауживание, расширение) для идеальной посадки по фигуре клиента.",
-        "срочный заказ": "Выполнение работ в ускоренном режиме за дополнительную плату."
-    },
-    "вопросы": {
-        "где находится ателье": "Ателье 'Новый Стиль' находится по адресу: улица Гагарина, дом 36/1.",
-        "график работы": "Мы работаем с понедельника по субботу с 9:00 до 18:00. Воскресенье - выходной день.",
-        "что такое ремонт одежды": "Ремонт одежды включает в себя подгон по фигуре (укорачивание, удлинение, зауживание брюк, юбок, платьев), замену молний, пуговиц, подкладки, а также устранение разрывов, штопку, ремонт трикотажных изделий и реставрацию. Работаем с различными тканями, включая джинсу, кожу и мех (базовый ремонт).",
-        "какие виды ремонта одежды вы делаете": "Мы выполняем подгон по фигуре, замену молний, подкладки, пуговиц, крючков. Также занимаемся зашиванием разрывов, штопкой, восстановлением швов, поднятием петель на трикотаже и базовой реставрацией. Работаем с хлопком, льном, шерстью, шелком, джинсой, кожей, мехом.",
-        "что входит в пошив одежды": "Мы предлагаем индивидуальный пошив повседневной (брюки, юбки, платья, блузки), вечерней, праздничной и верхней одежды (пальто, плащи). Также возможен пошив детской одежды и корпоративной униформы. Помогаем в разработке дизайна.",
-        "можно ли пошить костюм": "Да, ателье 'Новый Стиль' занимается индивидуальным пошивом костюмов по вашим меркам и с учетом всех пожеланий.",
-        "делаете ли вы вышивку": "Да, мы делаем машинную вышивку. Это может быть нанесение логотипов, инициалов, монограмм, узоров, орнаментов, надписей и слоганов.",
-        "на чем можно сделать вышивку": "Вышивку можно сделать на одежде (футболки, толстовки, рубашки, куртки), текстильных аксессуарах (сумки, рюкзаки) и предметах домашнего текстиля. Работаем как с готовыми изделиями, так и с кроем.",
-        "вы делаете печать на кружках": "Да, мы предлагаем печать на кружках. Это могут быть фотографии, любые изображения, надписи или логотипы. Отличный вариант для подарков или корпоративной продукции.",
-        "вы делаете печать на одежде": "Да, мы осуществляем печать на различных предметах одежды: футболках, толстовках, худи, кепках и бейсболках. Наносим любые изображения, логотипы, фотографии и надписи, используя современные и долговечные технологии.",
-        "можно ли принести свой материал для пошива": "Да, вы можете принести свои материалы. Также мы можем помочь в подборе тканей у наших поставщиков.",
-        "какие сроки выполнения заказа": "Сроки выполнения работ зависят от сложности заказа и текущей загрузки ателье. Они обсуждаются индивидуально при оформлении заказа.",
-        "сколько стоят ваши услуги": "Стоимость услуг определяется индивидуально после консультации и оценки сложности работы. Подробный прайс-лист можно уточнить при личном визите в ателье или по телефону.",
-        "есть ли скидки для постоянных клиентов": "По вопросу скидок и специальных предложений для постоянных клиентов уточняйте информацию у администратора ателье.",
-        "контакты ателье": "Наше ателье 'Новый Стиль' находится по адресу Гагарина, 36/1. Для уточнения телефона и других контактов, пожалуйста, посетите наш официальный сайт или найдите нас на картах."
-    },
-    "приветствия": {
-        "default": "Привет! Я помощник ателье 'Новый Стиль'. Могу рассказать о наших услугах, ценах и графике работы. Чем могу помочь?",
-        "hello": "Здравствуйте! Добро пожаловать в ателье 'Новый Стиль'. Я здесь, чтобы ответить на ваши вопросы. Спрашивайте о ремонте, пошиве, вышивке, печати или нашем местонахождении.",
-        "start": "Добро пожаловать в 'Новый Стиль'! Мы находимся на Гагарина, 36/1 и предлагаем ремонт, пошив одежды, а также вышивку и печать на разных предметах. Задайте свой вопрос!"
-    }
-}
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import AsyncSessionLocal
+from models import KnowledgeBaseVersion, KnowledgeEntry
+from search import stem_text
+
+logger = logging.getLogger(__name__)
+
+# Как часто процесс проверяет, не изменил ли базу знаний другой процесс (0 - не проверять)
+KB_SYNC_SECONDS = float(os.getenv("KB_SYNC_SECONDS", "5"))
+
+knowledge_base = {
+    "термины": {
+        "ателье": "Мастерская 'Новый Стиль', занимающаяся пошивом, ремонтом и декорированием одежды и текстиля, а также печатью на кружках и предметах.",
+        "ремонт одежды": "Комплекс работ по восстановлению, изменению или подгонке предметов одежды и текстиля.",
+        "пошив одежды": "Создание нового предмета одежды по индивидуальным меркам или типовым размерам.",
+        "вышивка": "Нанесение изображений, узоров, логотипов или надписей на ткань с помощью специальных нитей и вышивальной машины.",
+        "печать на кружках": "Нанесение изображений, логотипов или надписей на кружки с использованием различных технологий термотрансфера.",
+        "печать на одежде": "Нанесение изображений, логотипов или надписей на предметы одежды (футболки, толстовки, кепки) с использованием различных технологий печати.",
+        "прием заказа": "Процесс оформления запроса клиента на услугу, обсуждение деталей, снятие мерок, выбор материалов и определение стоимости.",
+        "мастер": "Квалифицированный специалист ателье 'Новый Стиль', выполняющий работы по ремонту, пошиву, вышивке или печати.",
+        "подгон по фигуре": "Изменение размеров одежды (укорачивание, удлинение, зауживание, расширение) для идеальной посадки по фигуре клиента.",
+        "срочный заказ": "Выполнение работ в ускоренном режиме за дополнительную плату."
+    },
+    "вопросы": {
+        "где находится ателье": "Ателье 'Новый Стиль' находится по адресу: улица Гагарина, дом 36/1.",
+        "график работы": "Мы работаем с понедельника по субботу с 9:00 до 18:00. Воскресенье - выходной день.",
+        "что такое ремонт одежды": "Ремонт одежды включает в себя подгон по фигуре (укорачивание, удлинение, зауживание брюк, юбок, платьев), замену молний, пуговиц, подкладки, а также устранение разрывов, штопку, ремонт трикотажных изделий и реставрацию. Работаем с различными тканями, включая джинсу, кожу и мех (базовый ремонт).",
+        "какие виды ремонта одежды вы делаете": "Мы выполняем подгон по фигуре, замену молний, подкладки, пуговиц, крючков. Также занимаемся зашиванием разрывов, штопкой, восстановлением швов, поднятием петель на трикотаже и базовой реставрацией. Работаем с хлопком, льном, шерстью, шелком, джинсой, кожей, мехом.",
+        "что входит в пошив одежды": "Мы предлагаем индивидуальный пошив повседневной (брюки, юбки, платья, блузки), вечерней, праздничной и верхней одежды (пальто, плащи). Также возможен пошив детской одежды и корпоративной униформы. Помогаем в разработке дизайна.",
+        "можно ли пошить костюм": "Да, ателье 'Новый Стиль' занимается индивидуальным пошивом костюмов по вашим меркам и с учетом всех пожеланий.",
+        "делаете ли вы вышивку": "Да, мы делаем машинную вышивку. Это может быть нанесение логотипов, инициалов, монограмм, узоров, орнаментов, надписей и слоганов.",
+        "на чем можно сделать вышивку": "Вышивку можно сделать на одежде (футболки, толстовки, рубашки, куртки), текстильных аксессуарах (сумки, рюкзаки) и предметах домашнего текстиля. Работаем как с готовыми изделиями, так и с кроем.",
+        "вы делаете печать на кружках": "Да, мы предлагаем печать на кружках. Это могут быть фотографии, любые изображения, надписи или логотипы. Отличный вариант для подарков или корпоративной продукции.",
+        "вы делаете печать на одежде": "Да, мы осуществляем печать на различных предметах одежды: футболках, толстовках, худи, кепках и бейсболках. Наносим любые изображения, логотипы, фотографии и надписи, используя современные и долговечные технологии.",
+        "можно ли принести свой материал для пошива": "Да, вы можете принести свои материалы. Также мы можем помочь в подборе тканей у наших поставщиков.",
+        "какие сроки выполнения заказа": "Сроки выполнения работ зависят от сложности заказа и текущей загрузки ателье. Они обсуждаются индивидуально при оформлении заказа.",
+        "сколько стоят ваши услуги": "Стоимость услуг определяется индивидуально после консультации и оценки сложности работы. Подробный прайс-лист можно уточнить при личном визите в ателье или по телефону.",
+        "есть ли скидки для постоянных клиентов": "По вопросу скидок и специальных предложений для постоянных клиентов уточняйте информацию у администратора ателье.",
+        "контакты ателье": "Наше ателье 'Новый Стиль' находится по адресу Гагарина, 36/1. Для уточнения телефона и других контактов, пожалуйста, посетите наш официальный сайт или найдите нас на картах."
+    },
+    "приветствия": {
+        "default": "Привет! Я помощник ателье 'Новый Стиль'. Могу рассказать о наших услугах, ценах и графике работы. Чем могу помочь?",
+        "hello": "Здравствуйте! Добро пожаловать в ателье 'Новый Стиль'. Я здесь, чтобы ответить на ваши вопросы. Спрашивайте о ремонте, пошиве, вышивке, печати или нашем местонахождении.",
+        "start": "Добро пожаловать в 'Новый Стиль'! Мы находимся на Гагарина, 36/1 и предлагаем ремонт, пошив одежды, а также вышивку и печать на разных предметах. Задайте свой вопрос!"
+    }
+}
+
+
+# ========== ИНДЕКС БАЗЫ ЗНАНИЙ В ПАМЯТИ ==========
+#
+# Словарь выше используется только как начальные данные: при первом запуске
+# он переносится в таблицу knowledge_entries, а дальше база знаний живет в БД
+# и редактируется через админские эндпоинты без перезапуска сервера.
+#
+# Индекс свой у каждого процесса: правка через эндпоинт сразу видна только
+# в процессе, который ее выполнил. Каждая запись увеличивает счетчик в таблице
+# knowledge_base_version; остальные процессы сравнивают его со своим
+# (KnowledgeSync) и перечитывают базу знаний из БД.
+
+SECTIONS = ("термины", "вопросы", "приветствия")
+
+GREETING_WORDS = ['привет', 'здравствуй', 'здравствуйте', 'начать', 'start', 'hello', 'hi']
+GENERAL_QUESTIONS = ['что ты умеешь', 'что можешь', 'твои возможности', 'функции']
+GENERAL_ANSWER = "Я могу отвечать на вопросы о работе ателье. Попробуйте спросить о чем-то конкретном!"
+
+
+def preprocess_text(text: str) -> str:
+    text = text.lower().strip()
+    # Заменяем все знаки препинания на пробел: "Привет, мир!" -> "привет  мир "
+    text = re.sub(r'[^\w\s]', ' ', text)
+    # Заменяем множественные пробелы на один пробел
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+class KnowledgeIndex:
+    """
+    Структуры для быстрого поиска по базе знаний.
+
+    Для каждого вопроса заранее хранится множество слов, поэтому поиск
+    не токенизирует вопросы на каждый запрос. Изменения применяются точечно
+    (upsert/remove), после каждого изменения увеличивается version -
+    кэш ответов чата с другой версией считается устаревшим.
+    """
+
+    def __init__(self, answer_cache_size: int = 1024):
+        self.version = 0
+        self.terms: dict[str, str] = {}
+        self.questions: dict[str, tuple[frozenset, str]] = {}
+        # Основы слов вопросов - для приблизительного поиска (retrieve)
+        self.question_stems: dict[str, frozenset] = {}
+        self.greetings: dict[str, str] = {}
+        self._answer_cache: OrderedDict = OrderedDict()
+        self._answer_cache_size = answer_cache_size
+        self._export: tuple[int, bytes, str] | None = None
+
+    def _bump(self):
+        self.version += 1
+        self._answer_cache.clear()
+
+    def load(self, entries):
+        """Полная перестройка индекса из пар (section, key, answer)."""
+        self.terms = {}
+        self.questions = {}
+        self.question_stems = {}
+        self.greetings = {}
+        for section, key, answer in entries:
+            self._set(section, key, answer)
+        self._bump()
+
+    def _set(self, section: str, key: str, answer: str):
+        if section == "термины":
+            self.terms[key] = answer
+        elif section == "вопросы":
+            self.questions[key] = (frozenset(preprocess_text(key).split()), answer)
+            self.question_stems[key] = significant_stems(key)
+        elif section == "приветствия":
+            self.greetings[key] = answer
+
+    def upsert(self, section: str, key: str, answer: str):
+        self._set(section, key, answer)
+        self._bump()
+
+    def remove(self, section: str, key: str):
+        if section == "термины":
+            self.terms.pop(key, None)
+        elif section == "вопросы":
+            self.questions.pop(key, None)
+            self.question_stems.pop(key, None)
+        elif section == "приветствия":
+            self.greetings.pop(key, None)
+        self._bump()
+
+    def find(self, user_input: str) -> str | None:
+        user_input = preprocess_text(user_input)
+
+        cached = self._answer_cache.get(user_input)
+        if cached is not None:
+            self._answer_cache.move_to_end(user_input)
+            return cached[0]
+
+        answer = self._match(user_input)
+        self._answer_cache[user_input] = (answer,)
+        if len(self._answer_cache) > self._answer_cache_size:
+            self._answer_cache.popitem(last=False)
+        return answer
+
+    def _match(self, user_input: str) -> str | None:
+        # Приветствия
+        if any(word in user_input for word in GREETING_WORDS) and len(user_input.split()) < 4:
+            default = self.greetings.get("default")
+            if default:
+                return default
+
+        # Общие вопросы о возможностях бота
+        if any(question in user_input for question in GENERAL_QUESTIONS):
+            return GENERAL_ANSWER
+
+        # Точное совпадение термина
+        for term, definition in self.terms.items():
+            if term in user_input:
+                return f"📚 {term.upper()}: {definition}"
+
+        # Вопрос с наибольшим числом общих слов
+        input_words = set(user_input.split())
+        best_match = None
+        max_matches = 0
+        for question_words, answer in self.questions.values():
+            matches = len(question_words.intersection(input_words))
+            if matches > max_matches:
+                max_matches = matches
+                best_match = answer
+        return best_match
+
+    def retrieve(self, user_input: str) -> str | None:
+        """
+        Приблизительный поиск по основам слов ("пошиву" ~ "пошив") для случая,
+        когда find() ничего не нашел, а LLM недоступна. Нужно совпадение хотя бы
+        половины значимых слов вопроса пользователя.
+        """
+        input_stems = significant_stems(user_input)
+        if not input_stems:
+            return None
+        best_key, best_score = None, 0
+        for key, stems in self.question_stems.items():
+            score = len(stems & input_stems)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is None or best_score * 2 < len(input_stems):
+            return None
+        return f"Возможно, вы спрашиваете: «{best_key}». {self.questions[best_key][1]}"
+
+    def export(self) -> dict:
+        """
+        Компактный индекс для чат-виджета: виджет повторяет _match() у себя и
+        обращается к серверу только при промахе. Порядок терминов и вопросов
+        сохраняется - при равном числе совпадений побеждает первый. Одинаковые
+        ответы хранятся один раз, вопросы и термины ссылаются на них по номеру.
+        """
+        answers: list[str] = []
+        positions: dict[str, int] = {}
+
+        def ref(answer: str) -> int:
+            if answer not in positions:
+                positions[answer] = len(answers)
+                answers.append(answer)
+            return positions[answer]
+
+        return {
+            "greeting_words": GREETING_WORDS,
+            "greeting": self.greetings.get("default"),
+            "general_questions": GENERAL_QUESTIONS,
+            "general_answer": GENERAL_ANSWER,
+            "terms": [[term, ref(f"📚 {term.upper()}: {definition}")] for term, definition in self.terms.items()],
+            "questions": [[sorted(words), ref(answer)] for words, answer in self.questions.values()],
+            "answers": answers,
+        }
+
+    def export_json(self) -> tuple[bytes, str]:
+        """
+        JSON индекса и его ETag; пересчитываются только после изменения базы знаний.
+        Версия индекса - хеш содержимого, а не self.version: после перезапуска
+        сервера self.version начинается заново, а закэшированный индекс клиента
+        остается действительным, если база знаний не менялась.
+        """
+        if self._export is None or self._export[0] != self.version:
+            index = self.export()
+            digest = hashlib.sha1(json.dumps(index, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+            body = json.dumps({"version": digest, **index}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._export = (self.version, body, f'"{digest}"')
+        return self._export[1], self._export[2]
+
+
+def significant_stems(text: str) -> frozenset:
+    # Короткие слова (предлоги, "ли", "вы") не учитываются
+    return frozenset(s for s in stem_text(text).split() if len(s) >= 3)
+
+
+kb_index = KnowledgeIndex()
+
+
+async def seed_knowledge_base(session):
+    """Переносит встроенный словарь в БД, если таблица еще пустая."""
+    result = await session.execute(select(KnowledgeEntry.id).limit(1))
+    if result.first() is not None:
+        return False
+    for section, items in knowledge_base.items():
+        for key, answer in items.items():
+            session.add(KnowledgeEntry(section=section, key=key, answer=answer))
+    await bump_version(session)
+    await session.commit()
+    return True
+
+
+async def bump_version(session):
+    """Увеличивает счетчик изменений; вызывается в транзакции, которая меняет knowledge_entries."""
+    insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(KnowledgeBaseVersion.__table__).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={"version": KnowledgeBaseVersion.__table__.c.version + 1},
+    )
+    await session.execute(stmt)
+
+
+async def stored_version(session) -> int:
+    version = await session.scalar(select(KnowledgeBaseVersion.version).where(KnowledgeBaseVersion.id == 1))
+    return version or 0
+
+
+async def load_knowledge_base(session):
+    """Полностью перечитывает базу знаний из БД в индекс."""
+    # Счетчик читается до записей: изменение между двумя запросами вызовет еще одну перезагрузку
+    kb_sync.db_version = await stored_version(session)
+    result = await session.execute(
+        select(KnowledgeEntry.section, KnowledgeEntry.key, KnowledgeEntry.answer)
+        .order_by(KnowledgeEntry.id)
+    )
+    kb_index.load(result.all())
+    return kb_index.version
+
+
+# ========== СИНХРОНИЗАЦИЯ МЕЖДУ ПРОЦЕССАМИ ==========
+
+class KnowledgeSync:
+    """
+    Раз в interval секунд сравнивает счетчик изменений в БД со счетчиком
+    последней загрузки и при расхождении перечитывает индекс.
+    Процесс, сам выполнивший правку, тоже один раз перечитает индекс - это
+    дешевле, чем отслеживать, чьи изменения уже применены.
+    """
+
+    def __init__(self, interval: float = KB_SYNC_SECONDS):
+        self.interval = interval
+        self.db_version: int | None = None
+        self.stats = {"checks": 0, "reloads": 0, "errors": 0}
+        self._task: asyncio.Task | None = None
+        self._stopping: asyncio.Event | None = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="kb-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            # Не отменяем задачу посреди запроса к БД - она завершится между проверками
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.check()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Не удалось проверить изменения базы знаний: {e}")
+
+    async def check(self) -> bool:
+        self.stats["checks"] += 1
+        async with AsyncSessionLocal() as session:
+            if await stored_version(session) == self.db_version:
+                return False
+            version = await load_knowledge_base(session)
+        self.stats["reloads"] += 1
+        logger.info(f"База знаний изменена другим процессом, индекс перечитан (версия {version})")
+        return True
+
+
+kb_sync = KnowledgeSync()
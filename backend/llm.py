@@ -0,0 +1,315 @@
+"""
+Вызов LLM для чата: цепочка моделей с автоматическими выключателями.
+
+Цепочка (LLM_CHAIN) - упорядоченный список моделей, по умолчанию основная
+Gemini и более дешевая. Вопрос уходит первой модели, чей выключатель
+пропускает запрос; при ошибке или таймауте - следующей. На каждую попытку
+отводится не больше LLM_TIMEOUT секунд, на всю цепочку - LLM_DEADLINE, так
+что недоступный Gemini задерживает ответ чата не дольше этого срока. Если
+ни одна модель не ответила, main.py переходит к поиску по базе знаний и
+заготовленным ответам.
+
+Выключатель (CircuitBreaker) после LLM_BREAKER_FAILURES ошибок подряд
+размыкается, и модель пропускается без запроса. Через LLM_BREAKER_RESET
+секунд он переходит в полуоткрытое состояние: один пробный запрос; успех
+замыкает выключатель, ошибка снова размыкает. Состояние и счетчики -
+llm_chain.metrics() (GET /llm/metrics).
+
+Элементы LLM_CHAIN:
+    gemini:<модель>   - Gemini (нужен GEMINI_API_KEY);
+    http://...        - JSON API {"prompt"} -> {"text"}, например fake_llm_server.py.
+
+google.generativeai импортируется не при импорте модуля, а при первом
+вызове модели (или заранее, на шаге прогрева - см. startup.py): импорт этой
+библиотеки занимает больше половины холодного старта.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "gemini-flash-2.5"
+CHEAP_MODEL_NAME = "gemini-2.5-flash-lite"
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "4.0"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "6.0"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30.0"))
+LLM_MAX_THREADS = int(os.getenv("LLM_MAX_THREADS", "8"))
+
+
+# ========== ПРОМПТ ЧАТА ==========
+# Общий для чата и для заготовки ответов заранее (kb_candidates.py)
+
+PROMPT_HEADER = """Ты - помощник для клиентов в ателье 'Новый стиль'.
+
+           Основные услуги ателье "Новый Стиль":
+           1. Ремонт одежды
+           2. Пошив одежды
+           3. Вышивка
+           4. Печать на кружках и предметах одежды
+
+           Общая информация и преимущества "Нового Стиля":
+
+            •  Расположение: Удобное расположение на улице Гагарина 36/1, легко добраться.
+            •  Мастера: Команда опытных и квалифицированных мастеров, которые любят свою работу.
+            •  Качество: Гарантия высокого качества всех предоставляемых услуг. Мы используем профессиональное оборудование и материалы.
+            •  Индивидуальный подход: Внимательное отношение к каждому клиенту и его пожеланиям.
+            •  Консультации: Всегда готовы проконсультировать по вопросам выбора материалов, дизайна, возможностей ремонта или пошива.
+            •  Сроки: Сроки выполнения работ обсуждаются индивидуально и зависят от сложности заказа и текущей загрузки.
+            •  Цены: Конкурентные цены, подробный прайс-лист можно уточнить при личном визите или по телефону.
+
+
+            Если вопрос не по работе или ты не знаешь ответ - вежливо откажись отвечать.
+            """
+
+
+def build_prompt(question: str, history: str | None = None) -> str:
+    """Промпт для вопроса; history - история диалога авторизованного пользователя."""
+    prompt = PROMPT_HEADER
+    if history is not None:
+        prompt += f"""
+            История диалога (используй ее, чтобы понять уточняющие вопросы):
+            {history}
+"""
+    return prompt + f"""
+            Вопрос: {question}
+
+            Краткий ответ:"""
+
+
+# ========== КЛИЕНТЫ МОДЕЛЕЙ ==========
+# Синхронный generate(prompt, timeout) -> текст; выполняется в пуле потоков цепочки
+
+class LazyGemini:
+    """Модель Gemini, которая создается при первом обращении."""
+
+    def __init__(self, api_key: str, model_name: str = MODEL_NAME):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._error: Exception | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        # Вызывается и из потока прогрева, и из обработчиков запросов
+        if self._model is None and self._error is None:
+            with self._lock:
+                if self._model is None and self._error is None:
+                    try:
+                        import google.generativeai as genai
+
+                        genai.configure(api_key=self.api_key)
+                        self._model = genai.GenerativeModel(self.model_name)
+                        logger.info(f"Gemini {self.model_name} успешно инициализирован")
+                    except Exception as e:
+                        self._error = e
+                        logger.error(f"Ошибка инициализации Gemini: {str(e)}")
+        if self._model is None:
+            raise RuntimeError(f"Gemini не инициализирован: {self._error}")
+        return self._model
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        response = self.load().generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+
+class HTTPModel:
+    """Модель за простым JSON API: POST {"prompt": ...} -> {"text": ...}."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"prompt": prompt}, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())["text"]
+
+
+# ========== АВТОМАТИЧЕСКИЙ ВЫКЛЮЧАТЕЛЬ ==========
+
+class CircuitBreaker:
+    """
+    closed - запросы проходят; open - модель пропускается без запроса;
+    half_open - пропускается один пробный запрос.
+    Используется только из цикла событий, блокировки не нужны.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.last_error: str | None = None
+        self._probe_in_flight = False
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != "closed":
+            logger.info("Выключатель LLM замкнут: пробный запрос успешен")
+        self.state = "closed"
+
+    def record_failure(self, error: str, timeout: bool = False):
+        self.stats["failures"] += 1
+        if timeout:
+            self.stats["timeouts"] += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = self.clock()
+
+    def release(self):
+        # Запрос отменен (клиент ушел) - пробный слот освобождается без вердикта
+        self._probe_in_flight = False
+
+    def metrics(self) -> dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = round(max(0.0, self.reset_timeout - (self.clock() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": retry_in,
+            "last_error": self.last_error,
+            **self.stats,
+        }
+
+
+# ========== ЦЕПОЧКА МОДЕЛЕЙ ==========
+
+@dataclass
+class Provider:
+    name: str
+    client: object
+    timeout: float = LLM_TIMEOUT
+    breaker: CircuitBreaker = None
+
+    def __post_init__(self):
+        if self.breaker is None:
+            self.breaker = CircuitBreaker()
+
+
+@dataclass
+class LLMAnswer:
+    text: str
+    provider: str
+    latency_ms: float
+
+
+class LLMChain:
+    def __init__(self, providers: list[Provider], deadline: float = LLM_DEADLINE, max_threads: int = LLM_MAX_THREADS):
+        self.providers = providers
+        self.deadline = deadline
+        # Собственный пул: зависшие вызовы модели не занимают общий пул asyncio.to_thread
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="llm")
+        self.stats = {"answered": 0, "exhausted": 0}
+
+    async def generate(self, prompt: str) -> LLMAnswer | None:
+        """Ответ первой доступной модели или None, если до дедлайна не ответила ни одна."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        for provider in self.providers:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            if not provider.breaker.allow():
+                continue
+            timeout = min(provider.timeout, remaining)
+            provider.breaker.stats["calls"] += 1
+            started = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, provider.client.generate, prompt, timeout),
+                    timeout=timeout,
+                )
+                if not text:
+                    raise ValueError("Пустой ответ")
+            except asyncio.CancelledError:
+                provider.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                logger.warning(f"LLM {provider.name}: нет ответа за {timeout:.1f} с")
+                provider.breaker.record_failure(f"таймаут {timeout:.1f} с", timeout=True)
+            except Exception as e:
+                # urllib оборачивает таймаут сокета в URLError - он тоже считается таймаутом
+                is_timeout = isinstance(getattr(e, "reason", e), TimeoutError)
+                logger.warning(f"LLM {provider.name}: ошибка {type(e).__name__}: {e}")
+                provider.breaker.record_failure(f"{type(e).__name__}: {e}", timeout=is_timeout)
+            else:
+                provider.breaker.record_success()
+                self.stats["answered"] += 1
+                return LLMAnswer(text, provider.name, round((time.perf_counter() - started) * 1000, 1))
+        self.stats["exhausted"] += 1
+        return None
+
+    async def warmup(self):
+        loop = asyncio.get_running_loop()
+        for provider in self.providers:
+            load = getattr(provider.client, "load", None)
+            if load is not None:
+                await loop.run_in_executor(self._executor, load)
+
+    def metrics(self) -> dict:
+        return {
+            "deadline": self.deadline,
+            **self.stats,
+            "providers": [
+                {"name": p.name, "timeout": p.timeout, **p.breaker.metrics()} for p in self.providers
+            ],
+        }
+
+
+def create_chain() -> LLMChain:
+    api_key = os.getenv("GEMINI_API_KEY")
+    default = f"gemini:{MODEL_NAME},gemini:{CHEAP_MODEL_NAME}" if api_key else ""
+    providers = []
+    for entry in filter(None, (e.strip() for e in os.getenv("LLM_CHAIN", default).split(","))):
+        if entry.startswith("gemini:"):
+            if not api_key:
+                logger.warning(f"{entry}: GEMINI_API_KEY не задан, модель пропущена")
+                continue
+            providers.append(Provider(entry, LazyGemini(api_key, entry.split(":", 1)[1])))
+        elif entry.startswith(("http://", "https://")):
+            providers.append(Provider(entry, HTTPModel(entry)))
+        else:
+            logger.warning(f"Неизвестный элемент LLM_CHAIN: {entry}")
+    if not providers:
+        logger.warning("GEMINI_API_KEY не найден в переменных окружения. Gemini будет отключен.")
+    return LLMChain(providers)
@@ -0,0 +1,232 @@
+"""
+Контроль задержки цикла событий: поиск блокирующих вызовов в async-обработчиках.
+
+Синхронный вызов внутри async def (bcrypt, запись файла, клиент LLM без
+потока) останавливает весь цикл событий - все остальные запросы ждут его.
+LoopMonitor каждые LOOP_MONITOR_INTERVAL секунд засыпает через asyncio.sleep
+и измеряет, насколько позже положенного цикл его разбудил. Это и есть
+задержка планирования: распределение (p50/p99/max) и число блокировок
+дольше LOOP_BLOCK_THRESHOLD_MS отдает GET /loop/metrics.
+
+Отладочный режим (LOOP_MONITOR_DEBUG=true): отдельный поток-сторож следит за
+тем, как давно цикл событий последний раз отозвался. Если дольше порога,
+он снимает стек потока цикла событий прямо во время блокировки - в стеке
+виден блокирующий вызов - и запоминает, какой запрос (METHOD путь) или
+фоновая задача выполнялись. Последние блокировки - в GET /loop/metrics.
+
+Тестовый режим (LOOP_LAG_FAIL_MS=X): сторож включен с порогом X мс, и
+запрос, во время которого цикл событий был заблокирован дольше X мс,
+получает вместо своего ответа 500 со стеком блокировки. Так тесты
+(test_loop_blocking.py) падают, как только в обработчике появляется
+блокирующий вызов.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_MONITOR_DEBUG = os.getenv("LOOP_MONITOR_DEBUG", "false").lower() in ("1", "true", "yes")
+LOOP_LAG_FAIL_MS = float(os.getenv("LOOP_LAG_FAIL_MS")) if os.getenv("LOOP_LAG_FAIL_MS") else None
+WINDOW = 1200
+MAX_INCIDENTS = 50
+STACK_LIMIT = 25
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+                 debug: bool = LOOP_MONITOR_DEBUG, fail_ms: float | None = LOOP_LAG_FAIL_MS):
+        self.fail_ms = fail_ms
+        self.threshold = (fail_ms if fail_ms is not None else threshold_ms) / 1000
+        # В тестовом режиме такт мельче порога, иначе короткая блокировка недоизмеряется на такт
+        self.interval = min(interval, self.threshold / 5) if fail_ms is not None else interval
+        self.debug = debug or fail_ms is not None
+        self.lags: deque[float] = deque(maxlen=WINDOW)
+        self.incidents: deque[dict] = deque(maxlen=MAX_INCIDENTS)
+        self.stats = {"samples": 0, "blocked": 0, "max_lag_ms": 0.0, "incidents": 0}
+        # Задача asyncio -> "METHOD путь" обрабатываемого ею запроса (заполняет LoopMonitorMiddleware)
+        self.routes: dict[asyncio.Task, str] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._stopping = False
+        self._beat = 0.0
+        self._open: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopping = False
+        self._stop_event.clear()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._stop_event.set()
+        await self._task
+        self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - started - self.interval))
+            self._beat = time.monotonic()
+
+    def _record(self, lag: float):
+        lag_ms = lag * 1000
+        self.lags.append(lag_ms)
+        self.stats["samples"] += 1
+        self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag_ms, 1))
+        if lag >= self.threshold:
+            self.stats["blocked"] += 1
+        incident = self._open
+        if incident is not None:
+            # Сторож снял стек во время блокировки; точная длительность известна только сейчас
+            incident["blocked_ms"] = max(incident["blocked_ms"], round(lag_ms, 1))
+            self._open = None
+
+    # ========== СТОРОЖ (ОТДЕЛЬНЫЙ ПОТОК) ==========
+
+    def _watch(self):
+        poll = max(self.threshold / 4, 0.002)
+        captured_beat = None
+        while not self._stop_event.wait(poll):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            if captured_beat != beat:
+                captured_beat = beat
+                self._capture(stalled)
+            elif self._open is not None:
+                self._open["blocked_ms"] = max(self._open["blocked_ms"], round(stalled * 1000, 1))
+
+    def _capture(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = [
+            f"{f.filename}:{f.lineno} in {f.name}" + (f": {f.line}" if f.line else "")
+            for f in traceback.extract_stack(frame, limit=STACK_LIMIT)
+        ] if frame is not None else []
+        task = asyncio.current_task(self._loop)
+        incident = {
+            "at": time.time(),
+            "blocked_ms": round(stalled * 1000, 1),
+            "route": self.routes.get(task),
+            "task": task.get_name() if task is not None else None,
+            "stack": stack,
+        }
+        self.incidents.append(incident)
+        self.stats["incidents"] += 1
+        self._open = incident
+        where = incident["route"] or incident["task"] or "вне задачи"
+        logger.warning(f"Цикл событий заблокирован дольше {self.threshold * 1000:.0f} мс ({where}):\n"
+                       + "\n".join(stack[-5:]))
+
+    def incidents_for(self, task: asyncio.Task, since: float) -> list[dict]:
+        name = task.get_name()
+        return [i for i in self.incidents if i["task"] == name and i["at"] >= since]
+
+    def metrics(self) -> dict:
+        lags = sorted(self.lags)
+
+        def pct(q: float) -> float | None:
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))], 2) if lags else None
+
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "debug": self.debug,
+            "test_mode": self.fail_ms is not None,
+            **self.stats,
+            "lag_ms": {
+                "last": round(self.lags[-1], 2) if self.lags else None,
+                "mean": round(sum(lags) / len(lags), 2) if lags else None,
+                "p50": pct(0.5),
+                "p99": pct(0.99),
+                "max": round(lags[-1], 2) if lags else None,
+            },
+            "recent_incidents": list(self.incidents)[-10:],
+        }
+
+
+loop_monitor = LoopMonitor()
+
+
+class LoopMonitorMiddleware:
+    """
+    ASGI middleware: связывает задачу asyncio с обрабатываемым запросом, чтобы
+    блокировку можно было отнести к эндпоинту. В тестовом режиме ответ
+    придерживается до конца обработки и заменяется на 500, если запрос
+    блокировал цикл событий дольше LOOP_LAG_FAIL_MS.
+    """
+
+    def __init__(self, app, monitor: LoopMonitor = loop_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.monitor.debug:
+            return await self.app(scope, receive, send)
+        task = asyncio.current_task()
+        self.monitor.routes[task] = f"{scope['method']} {scope['path']}"
+        try:
+            if self.monitor.fail_ms is None:
+                return await self.app(scope, receive, send)
+            since = time.time()
+            messages = []
+
+            async def hold(message):
+                messages.append(message)
+
+            await self.app(scope, receive, hold)
+            blocked = self.monitor.incidents_for(task, since)
+            if blocked:
+                return await _blocked_response(send, scope, blocked)
+            for message in messages:
+                await send(message)
+        finally:
+            self.monitor.routes.pop(task, None)
+
+
+async def _blocked_response(send, scope, blocked: list[dict]):
+    worst = max(i["blocked_ms"] for i in blocked)
+    body = json.dumps({
+        "detail": f"{scope['method']} {scope['path']} заблокировал цикл событий на {worst} мс",
+        "blocked": blocked,
+    }, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 500,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,45 @@
+"""
+Отправка писем через очередь фоновых задач.
+
+queue_email() ставит задачу send_email; само письмо отправляет воркер
+через SMTP (smtplib в отдельном потоке). Для локальной проверки достаточно
+запустить заглушку `python smtp_stub.py` - она печатает полученные письма.
+
+Настройки: SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_STARTTLS, MAIL_FROM.
+"""
+import asyncio
+import os
+import smtplib
+from email.message import EmailMessage
+
+import jobs
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in ("1", "true", "yes")
+MAIL_FROM = os.getenv("MAIL_FROM", "noreply@costume-rental.local")
+
+
+def _send(to: str, subject: str, body: str):
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD or "")
+        smtp.send_message(message)
+
+
+@jobs.handler("send_email", concurrency=2, max_attempts=6, timeout=60.0)
+async def send_email(to: str, subject: str, body: str):
+    await asyncio.to_thread(_send, to, subject, body)
+
+
+async def queue_email(to: str, subject: str, body: str, session=None) -> int:
+    return await jobs.enqueue("send_email", {"to": to, "subject": subject, "body": body}, session=session)
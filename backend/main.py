@@ -2,37 +2,65 @@ from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from datetime import datetime
-import google.generativeai as genai
 import os
+import asyncio
 import re
 import traceback
 from dotenv import load_dotenv
 import logging
 from contextlib import asynccontextmanager
-from knowledge_base import knowledge_base
-from database import create_tables, get_async_session
+from knowledge_base import kb_index, kb_sync, bump_version, preprocess_text, seed_knowledge_base, load_knowledge_base, SECTIONS
+from database import create_tables, get_async_session, engine
 from models import User
 from auth import fastapi_users, auth_backend, current_active_user
 from schemas import UserRead, UserCreate
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, union_all
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from fastapi import status as http_status
-from models import Order, Costume, Reservation, Profile
-from datetime import date
+from models import Order, Costume, Reservation, Profile, KnowledgeEntry, KnowledgeCandidate, ChatMessage, AnalyticsEvent, OrderHistory, ReservationHistory
+from datetime import date, timedelta
 from typing import List, Optional
 from fastapi import UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import shutil
 from pathlib import Path
 import uuid
+import json
+import analytics
+import reports
+import search
+import catalog_io
+import exports
+import jobs
+import maintenance
+import kb_candidates
+import llm
+from startup import warmup
+import singleflight
+import profiling
+import statements
+from statements import order_union
+from singleflight import SingleFlight
+from mailer import queue_email
+import zipfile
+from occupancy import occupancy_cache, month_bitmaps, calendar_payload, parse_month
+from rate_limit import RateLimitMiddleware
+from loop_monitor import LoopMonitorMiddleware, loop_monitor
+from replicas import StickyWritesMiddleware, get_read_session, read_router
+from chat_history import chat_history
+from serializers import (
+    JSONBytesResponse, ORDER_COLUMNS, ORDER_ADMIN_COLUMNS, COSTUME_COLUMNS,
+    RESERVATION_ADMIN_COLUMNS, order_encoder, order_admin_encoder, costume_encoder, reservation_encoder,
+    reservation_admin_encoder, costume_row, ORDER_HISTORY_ADMIN_COLUMNS, RESERVATION_HISTORY_ADMIN_COLUMNS,
+)
 
 
 # Создаем абсолютный путь к директории uploads относительно текущего файла
 BASE_DIR = Path(__file__).parent
-UPLOAD_DIR = BASE_DIR / "uploads"
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(BASE_DIR / "uploads")))
 
 pwd_helper = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -40,12 +68,80 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+# ========== ОТЛОЖЕННЫЙ ПРОГРЕВ (выполняется после открытия порта) ==========
+
+@warmup.step("superuser")
+async def warmup_superuser():
+    super_email = os.getenv("SUPERUSER_EMAIL", "akunishnikova04@bk.ru")
+    super_password = os.getenv("SUPERUSER_PASSWORD", "rTpAMA!qo65B")
+    
+    async for session in get_async_session():
+        result = await session.execute(select(User).where(User.email == super_email))
+        su = result.scalar_one_or_none()
+        
+        if su is None:
+            # bcrypt - заметная нагрузка на CPU, не держим им цикл событий
+            hashed_password = await asyncio.to_thread(pwd_helper.hash, super_password)
+            new_user = User(
+                email=super_email,
+                hashed_password=hashed_password,  
+                is_active=True,      
+                is_superuser=True,  
+                is_verified=True,    
+            )
+            
+            session.add(new_user)
+           
+            await session.commit()
+            logger.info(f"Создан суперпользователь: {super_email}")
+            
+        else:
+            updated = False
+            
+            if not su.is_superuser or not su.is_active or not su.is_verified:
+                su.is_superuser = True
+                su.is_active = True
+                su.is_verified = True
+                updated = True  
+            
+            force_pwd = os.getenv("SUPERUSER_FORCE_PASSWORD", "false").lower() in ("1", "true", "yes")
+            if force_pwd:
+                su.hashed_password = await asyncio.to_thread(pwd_helper.hash, super_password)
+                updated = True
+            if updated:
+                await session.commit()  
+                logger.info(f"Суперпользователь обновлен: {super_email}")
+
+
+@warmup.step("jobs")
+async def warmup_jobs():
+    if await maintenance.ensure_scheduled():
+        logger.info("Задача обслуживания БД поставлена в очередь")
+    if jobs.JOBS_WORKER == "inline":
+        jobs.worker.start()
+
+
+@warmup.step("statements")
+async def warmup_statements():
+    # Компиляция горячих запросов (statements.py) до первого запроса пользователя
+    async for session in get_async_session():
+        logger.info(f"Прогрето запросов: {await statements.warm(session)}")
+
+
+@warmup.step("llm")
+async def warmup_llm():
+    # Импорт google.generativeai в отдельном потоке, чтобы первый вопрос в чат его не ждал
+    await llm_chain.warmup()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # ========== КОД ПРИ ЗАПУСКЕ ПРИЛОЖЕНИЯ ==========
-    
-    
-    from models import User, Profile, Order, Costume, Reservation
+    # Здесь только то, без чего запросы обрабатываются неправильно;
+    # остальное - в шагах прогрева выше
+
+    # Первым: блокирующие вызовы при запуске тоже попадают в статистику
+    loop_monitor.start()
     
     logger.info("Создание таблиц базы данных...")
     try:
@@ -55,52 +151,49 @@ async def lifespan(app: FastAPI):
         logger.error(f"Ошибка создания таблиц: {str(e)}")
         raise  
 
-   
-    super_email = os.getenv("SUPERUSER_EMAIL", "akunishnikova04@bk.ru")
-    super_password = os.getenv("SUPERUSER_PASSWORD", "rTpAMA!qo65B")
-    
+    try:
+        if engine.dialect.name == "sqlite":
+            async with engine.begin() as conn:
+                await search.create_index(conn)
+    except Exception as e:
+        logger.error(f"Не удалось подготовить поисковый индекс: {e}")
+
+    # Агрегаты строятся до приема запросов: бронирование, пришедшее раньше,
+    # записало бы первую строку и ensure_built счел бы таблицы уже построенными
     try:
         async for session in get_async_session():
-            result = await session.execute(select(User).where(User.email == super_email))
-            su = result.scalar_one_or_none()
-            
-            if su is None:
-                hashed_password = pwd_helper.hash(super_password)
-                new_user = User(
-                    email=super_email,
-                    hashed_password=hashed_password,  
-                    is_active=True,      
-                    is_superuser=True,  
-                    is_verified=True,    
-                )
-                
-                session.add(new_user)
-               
-                await session.commit()
-                await session.refresh(new_user)
-                logger.info(f"Создан суперпользователь: {super_email}")
-                
-            else:
-                updated = False
-                
-                if not su.is_superuser or not su.is_active or not su.is_verified:
-                    su.is_superuser = True
-                    su.is_active = True
-                    su.is_verified = True
-                    updated = True  
-                
-                force_pwd = os.getenv("SUPERUSER_FORCE_PASSWORD", "false").lower() in ("1", "true", "yes")
-                if force_pwd:
-                    su.hashed_password = pwd_helper.hash(super_password)
-                    updated = True
-                if updated:
-                    await session.commit()  
-                    await session.refresh(su)  
-                    logger.info(f"Суперпользователь обновлен: {super_email}")
-                    
+            if await reports.ensure_built(session):
+                logger.info("Сводные таблицы отчетов построены по существующим данным")
     except Exception as e:
-        logger.error(f"Не удалось создать/обновить суперпользователя: {e}")
+        logger.error(f"Не удалось построить сводные таблицы отчетов: {e}")
+
+    # База знаний и поисковый индекс - тоже до приема запросов: без них /chat
+    # уходил бы мимо базы знаний в LLM, а поиск работал бы по пустому индексу
+    async for session in get_async_session():
+        if await seed_knowledge_base(session):
+            logger.info("База знаний перенесена в БД из knowledge_base.py")
+        version = await load_knowledge_base(session)
+        logger.info(f"База знаний загружена (версия {version})")
+
+    try:
+        async for session in get_async_session():
+            if await search.ensure_index(session):
+                logger.info("Поисковый индекс каталога перестроен")
+    except Exception as e:
+        logger.error(f"Не удалось перестроить поисковый индекс: {e}")
+
+    chat_history.start()
+    analytics.events.start()
+    kb_sync.start()
+    warmup.start()
     yield
+    # ========== КОД ПРИ ОСТАНОВКЕ ПРИЛОЖЕНИЯ ==========
+    await warmup.stop()
+    await kb_sync.stop()
+    await jobs.worker.stop()
+    await chat_history.stop()
+    await analytics.events.stop()
+    await loop_monitor.stop()
     
 
 
@@ -112,6 +205,29 @@ app = FastAPI(lifespan=lifespan)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
+def _write_upload(src, path: Path):
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(src, buffer)
+
+async def save_upload(image: UploadFile, path: Path):
+    # Запись файла блокирует цикл событий - выполняется в потоке
+    await asyncio.to_thread(_write_upload, image.file, path)
+
+# ========== КОНТРОЛЬ БЛОКИРОВОК ЦИКЛА СОБЫТИЙ ==========
+
+# Самый внутренний: блокировку в обработчике относит к его запросу (см. loop_monitor.py)
+app.add_middleware(LoopMonitorMiddleware)
+
+# ========== ЧТЕНИЕ С РЕПЛИК ==========
+
+# После запроса на изменение чтения пользователя идут на основную БД (см. replicas.py)
+app.add_middleware(StickyWritesMiddleware)
+
+# ========== ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ ==========
+
+# Добавляется до CORS, чтобы ответы 429/503 тоже получали CORS-заголовки
+app.add_middleware(RateLimitMiddleware)
+
 # ========== НАСТРОЙКА CORS (Cross-Origin Resource Sharing) ==========
 
 app.add_middleware(
@@ -125,20 +241,15 @@ app.add_middleware(
 
 # ========== ИНИЦИАЛИЗАЦИЯ GEMINI AI ==========
 
-gemini_api_key = os.getenv("GEMINI_API_KEY")
+# Цепочка моделей с выключателями (llm.py). Клиенты создаются лениво:
+# google.generativeai импортируется при первом запросе или на шаге прогрева "llm"
+llm_chain = llm.create_chain()
+# Одинаковые вопросы, заданные одновременно, получают ответ одного вызова модели
+llm_flight = SingleFlight("llm")
 
-
-if not gemini_api_key:
-    logger.warning("GEMINI_API_KEY не найден в переменных окружения. Gemini будет отключен.")
-    model = None  
-else:
-    try:
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-flash-2.5')
-        logger.info("Gemini успешно инициализирован")
-    except Exception as e:
-        logger.error(f"Ошибка инициализации Gemini: {str(e)}")
-        model = None
+def chat_key(text: str) -> tuple:
+    # "Сколько стоит?" и "сколько  стоит" - один и тот же вопрос
+    return tuple(preprocess_text(text).split())
 
 # ========== PYDANTIC МОДЕЛИ ДЛЯ ВАЛИДАЦИИ ДАННЫХ ==========
 
@@ -147,64 +258,10 @@ class Message(BaseModel):
 
 # ========== ФУНКЦИИ ДЛЯ РАБОТЫ С БАЗОЙ ЗНАНИЙ ==========
 
-def preprocess_text(text: str) -> str:
-    text = text.lower().strip()
-    
-    # re.sub(pattern, replacement, string) - заменяет все совпадения регулярного выражения
-    # r'[^\w\s]' - регулярное выражение:
-    #   [^...] - любой символ, НЕ входящий в набор
-    #   \w - буквы, цифры, подчеркивания (word characters)
-    #   \s - пробельные символы (пробел, табуляция, перенос строки)
-    #   [^\w\s] - любой символ, который НЕ буква/цифра/пробел (т.е. знаки препинания)
-    # Заменяем все знаки препинания на пробел
-    # "Привет, мир!" -> "Привет  мир "
-    text = re.sub(r'[^\w\s]', ' ', text)
-    
-    # r'\s+' - регулярное выражение для одного или более пробельных символов подряд
-    # Заменяем множественные пробелы на один пробел
-    # "Привет    мир" -> "Привет мир"
-    text = re.sub(r'\s+', ' ', text)
-    
-    return text
-
 def find_in_knowledge_base(user_input: str) -> str:
-    user_input = preprocess_text(user_input)
-    
-    # ========== ПРОВЕРКА ПРИВЕТСТВИЙ ==========
-
-    greeting_words = ['привет', 'здравствуй', 'здравствуйте', 'начать', 'start', 'hello', 'hi']
-    if any(word in user_input for word in greeting_words) and len(user_input.split()) < 4:
-        return knowledge_base["приветствия"]["default"]
-    
-    # ========== ПРОВЕРКА ОБЩИХ ВОПРОСОВ ==========
-
-    general_questions = ['что ты умеешь', 'что можешь', 'твои возможности', 'функции']
-    if any(question in user_input for question in general_questions):
-        return "Я могу отвечать на вопросы о работе ателье. Попробуйте спросить о чем-то конкретном!"
-    
-    # ========== ПОИСК ТОЧНОГО СОВПАДЕНИЯ ТЕРМИНОВ ==========
-
-    for term, definition in knowledge_base["термины"].items():
-        if term in user_input:
-            return f"📚 {term.upper()}: {definition}"
-    
-    # ========== ПОИСК ПО КЛЮЧЕВЫМ СЛОВАМ В ВОПРОСАХ ==========
-
-    
-    best_match = None  
-    max_matches = 0   
-    
-    for question, answer in knowledge_base["вопросы"].items():
-        question_words = set(preprocess_text(question).split())
-        input_words = set(user_input.split())
-        matches = len(question_words.intersection(input_words))
-        if matches > max_matches and matches > 0:
-            max_matches = matches
-            best_match = answer
-   
-    if best_match:
-        return best_match
-    return None
+    # Поиск идет по индексу в памяти, который строится из таблицы knowledge_entries
+    # и обновляется точечно при редактировании базы знаний администратором
+    return kb_index.find(user_input)
 
 # ========== ПОДКЛЮЧЕНИЕ РОУТЕРОВ FASTAPI USERS ==========
 
@@ -251,7 +308,7 @@ async def simple_register(req: RegisterRequest):
                     status_code=http_status.HTTP_409_CONFLICT, 
                     detail="Этот email уже зарегистрирован"
                 )
-            hashed_password = pwd_helper.hash(req.password)
+            hashed_password = await asyncio.to_thread(pwd_helper.hash, req.password)
             
             
             new_user = User(
@@ -264,7 +321,13 @@ async def simple_register(req: RegisterRequest):
             
             
             session.add(new_user)
-            
+            # Приветственное письмо попадет в очередь в той же транзакции, что и пользователь
+            await queue_email(
+                req.email,
+                "Добро пожаловать в прокат костюмов",
+                "Вы успешно зарегистрировались. Теперь можно оформлять заказы и бронировать костюмы.",
+                session=session,
+            )
             
             await session.commit()
             
@@ -299,52 +362,28 @@ app.include_router(
 # Доступен всем пользователям, даже неавторизованным
 @app.post("/chat")
 async def chat_endpoint(message: Message):
-    logger.info(f"Получен вопрос: {message.text}")
+    logger.debug(f"Получен вопрос: {message.text}")
     kb_response = find_in_knowledge_base(message.text)
     
     if kb_response:
-        logger.info("Ответ найден в базе знаний")
+        logger.debug("Ответ найден в базе знаний")
+        analytics.record("chat", None, endpoint="/chat", question=message.text, source="kb")
         return {"response": kb_response}
-    if model is not None:
-        try:
-            logger.info("Используем Gemini для генерации ответа")
-            prompt = f"""Ты - помощник для клиентов в ателье 'Новый стиль'.
-            
-           Основные услуги ателье "Новый Стиль":
-           1. Ремонт одежды
-           2. Пошив одежды
-           3. Вышивка
-           4. Печать на кружках и предметах одежды
-
-           Общая информация и преимущества "Нового Стиля":
-
-            •  Расположение: Удобное расположение на улице Гагарина 36/1, легко добраться.
-            •  Мастера: Команда опытных и квалифицированных мастеров, которые любят свою работу.
-            •  Качество: Гарантия высокого качества всех предоставляемых услуг. Мы используем профессиональное оборудование и материалы.
-            •  Индивидуальный подход: Внимательное отношение к каждому клиенту и его пожеланиям.
-            •  Консультации: Всегда готовы проконсультировать по вопросам выбора материалов, дизайна, возможностей ремонта или пошива.
-            •  Сроки: Сроки выполнения работ обсуждаются индивидуально и зависят от сложности заказа и текущей загрузки.
-            •  Цены: Конкурентные цены, подробный прайс-лист можно уточнить при личном визите или по телефону.
-
-            
-            Если вопрос не по работе или ты не знаешь ответ - вежливо откажись отвечать.
-            
-            Вопрос: {message.text}
-            
-            Краткий ответ:"""
-            response = model.generate_content(prompt)
-
-            if response.text:
-                logger.info("Успешный ответ от Gemini")
-                return {"response": response.text}
-            else:
-                logger.warning("Пустой ответ от Gemini")
-                raise Exception("Пустой ответ")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к Gemini: {str(e)}")
-            
-    
+    if llm_chain.providers:
+        logger.debug("Используем LLM для генерации ответа")
+        prompt = llm.build_prompt(message.text)
+        # Цепочка моделей с выключателями укладывается в LLM_DEADLINE (см. llm.py)
+        answer = await llm_flight.do(chat_key(message.text), lambda: llm_chain.generate(prompt))
+        if answer is not None:
+            logger.debug(f"Ответ от {answer.provider}")
+            analytics.record("chat", None, endpoint="/chat", question=message.text, source="llm",
+                             model=answer.provider, llm_latency_ms=answer.latency_ms)
+            return {"response": answer.text}
+
+    retrieved = kb_index.retrieve(message.text)
+    if retrieved:
+        analytics.record("chat", None, endpoint="/chat", question=message.text, source="kb_retrieval")
+        return {"response": retrieved}
     
     fallback_responses = [
         "Извините, я не нашел ответа на этот вопрос в базе знаний. Попробуйте переформулировать вопрос.",
@@ -354,6 +393,7 @@ async def chat_endpoint(message: Message):
     
     
     import random
+    analytics.record("chat", None, endpoint="/chat", question=message.text, source="fallback")
     return {"response": random.choice(fallback_responses)}
 
 # Защищенный эндпоинт чата для авторизованных пользователей
@@ -363,50 +403,33 @@ async def chat_endpoint_authenticated(
     message: Message,
     user: User = Depends(current_active_user)
 ):
-    logger.info(f"Получен вопрос от пользователя {user.email}: {message.text}")
+    logger.debug(f"Получен вопрос от пользователя {user.email}: {message.text}")
+    history = await chat_history.context(user.id)
+    await chat_history.append(user.id, "user", message.text)
     kb_response = find_in_knowledge_base(message.text)
     
     if kb_response:
-        logger.info("Ответ найден в базе знаний")
+        logger.debug("Ответ найден в базе знаний")
+        analytics.record("chat", user.id, endpoint="/chat/authenticated", question=message.text, source="kb")
+        await chat_history.append(user.id, "assistant", kb_response)
         return {"response": kb_response}
-    if model is not None:
-        try:
-            logger.info("Используем Gemini для генерации ответа")
-            prompt = f"""Ты - помощник для клиентов в ателье 'Новый стиль'.
-            
-           Основные услуги ателье "Новый Стиль":
-           1. Ремонт одежды
-           2. Пошив одежды
-           3. Вышивка
-           4. Печать на кружках и предметах одежды
-
-           Общая информация и преимущества "Нового Стиля":
-
-            •  Расположение: Удобное расположение на улице Гагарина 36/1, легко добраться.
-            •  Мастера: Команда опытных и квалифицированных мастеров, которые любят свою работу.
-            •  Качество: Гарантия высокого качества всех предоставляемых услуг. Мы используем профессиональное оборудование и материалы.
-            •  Индивидуальный подход: Внимательное отношение к каждому клиенту и его пожеланиям.
-            •  Консультации: Всегда готовы проконсультировать по вопросам выбора материалов, дизайна, возможностей ремонта или пошива.
-            •  Сроки: Сроки выполнения работ обсуждаются индивидуально и зависят от сложности заказа и текущей загрузки.
-            •  Цены: Конкурентные цены, подробный прайс-лист можно уточнить при личном визите или по телефону.
-
-            
-            Если вопрос не по работе или ты не знаешь ответ - вежливо откажись отвечать.
-            
-            Вопрос: {message.text}
-            
-            Краткий ответ:"""
-            
-            response = model.generate_content(prompt)
-            if response.text:
-                logger.info("Успешный ответ от Gemini")
-                return {"response": response.text}
-            else:
-                logger.warning("Пустой ответ от Gemini")
-                raise Exception("Пустой ответ")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к Gemini: {str(e)}")
+    if llm_chain.providers:
+        logger.debug("Используем LLM для генерации ответа")
+        prompt = llm.build_prompt(message.text, history or "нет")
+        # Ключ включает историю: с разной историей одинаковый вопрос значит разное
+        answer = await llm_flight.do((chat_key(message.text), history), lambda: llm_chain.generate(prompt))
+        if answer is not None:
+            logger.debug(f"Ответ от {answer.provider}")
+            analytics.record("chat", user.id, endpoint="/chat/authenticated", question=message.text, source="llm",
+                             model=answer.provider, llm_latency_ms=answer.latency_ms)
+            await chat_history.append(user.id, "assistant", answer.text)
+            return {"response": answer.text}
+
+    retrieved = kb_index.retrieve(message.text)
+    if retrieved:
+        analytics.record("chat", user.id, endpoint="/chat/authenticated", question=message.text, source="kb_retrieval")
+        await chat_history.append(user.id, "assistant", retrieved)
+        return {"response": retrieved}
     fallback_responses = [
         "Извините, я не нашел ответа на этот вопрос в базе знаний. Попробуйте переформулировать вопрос или обратитесь к кураторам в бот.",
         "Этот вопрос пока не добавлен в мою базу знаний. Вы можете задать его кураторам через бот.",
@@ -414,7 +437,57 @@ async def chat_endpoint_authenticated(
     ]
     
     import random
-    return {"response": random.choice(fallback_responses)}
+    analytics.record("chat", user.id, endpoint="/chat/authenticated", question=message.text, source="fallback")
+    fallback = random.choice(fallback_responses)
+    await chat_history.append(user.id, "assistant", fallback)
+    return {"response": fallback}
+
+# Вопрос, на который виджет ответил сам по индексу базы знаний (GET /knowledge-base/index):
+# ответ сервер не формирует, только учитывает вопрос в аналитике
+@app.post("/chat/local", status_code=http_status.HTTP_204_NO_CONTENT)
+async def chat_local_answer(message: Message):
+    analytics.record("chat", None, endpoint="/chat/local", question=message.text, source="kb_local")
+    return Response(status_code=http_status.HTTP_204_NO_CONTENT)
+
+class ChatMessageOut(BaseModel):
+    id: int
+    role: str
+    text: str
+    created_at: str | None = None
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatMessageOut]
+    next_before_id: int | None = None
+
+# История чата пользователя для виджета (от новых к старым, постранично по id)
+@app.get("/chat/history", response_model=ChatHistoryPage)
+async def chat_history_endpoint(
+    limit: int = 20,
+    before_id: int | None = None,
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    limit = max(1, min(limit, 100))
+    # Дописываем в БД сообщения, которые еще ждут фоновой записи
+    await chat_history.flush()
+    q = (
+        select(ChatMessage.id, ChatMessage.role, ChatMessage.text, ChatMessage.created_at)
+        .where(ChatMessage.user_id == user.id)
+        .order_by(ChatMessage.id.desc())
+        .limit(limit + 1)
+    )
+    if before_id is not None:
+        q = q.where(ChatMessage.id < before_id)
+    rows = (await session.execute(q)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ChatHistoryPage(
+        items=[
+            ChatMessageOut(id=r.id, role=r.role, text=r.text, created_at=str(r.created_at) if r.created_at else None)
+            for r in rows
+        ],
+        next_before_id=rows[-1].id if has_more else None,
+    )
 
 # ========== PYDANTIC МОДЕЛИ ДЛЯ ЗАЯВОК ==========
 
@@ -487,12 +560,12 @@ async def create_order(
         
         # Если это заказ на бронирование костюма, проверяем конфликты дат
         if order.costume_id is not None and order.date_from is not None and order.date_to is not None:
-            costume = await session.get(Costume, order.costume_id)
+            available = await session.scalar(statements.COSTUME_AVAILABLE, {"costume_id": order.costume_id})
             
-            if not costume:
+            if available is None:
                 raise HTTPException(status_code=404, detail="Костюм не найден")
             
-            if not costume.available:
+            if not available:
                 raise HTTPException(status_code=400, detail="Костюм недоступен для бронирования")
             
             # Проверяем валидность дат
@@ -502,42 +575,45 @@ async def create_order(
             
             
             # Проверяем конфликты с существующими заказами на бронирование
-            q_orders = select(Order).where(
-                Order.costume_id == order.costume_id,
-                Order.date_from.isnot(None),
-                Order.date_to.isnot(None),
-                Order.date_from <= order.date_to,
-                Order.date_to >= order.date_from
-            )
-            result_orders = await session.execute(q_orders)
-            conflict_order = result_orders.scalars().first()
-            if conflict_order:
+            conflict_order = await session.scalar(statements.ORDER_CONFLICT, {
+                "costume_id": order.costume_id, "date_from": order.date_from, "date_to": order.date_to,
+            })
+            if conflict_order is not None:
                 raise HTTPException(
                     status_code=409, 
                     detail="Выбранные даты недоступны (пересечение с существующим заказом на бронирование)"
                 )
         elif order.costume_id is not None:
             # Если костюм указан, но даты нет - просто проверяем существование костюма
-            costume = await session.get(Costume, order.costume_id)
-            if not costume:
+            available = await session.scalar(statements.COSTUME_AVAILABLE, {"costume_id": order.costume_id})
+            if available is None:
                 raise HTTPException(status_code=404, detail="Костюм не найден")
         
-        db_order = Order(
-            user_id=user.id,                   
-            title=order.title,                  
-            status=order.status,                
-            costume_id=order.costume_id,
-            phone=order.phone,
-            date_from=order.date_from,
-            date_to=order.date_to
-        )
-        session.add(db_order)
+        # INSERT ... RETURNING сразу отдает id и created_at - без SELECT после commit
+        result = await session.execute(statements.INSERT_ORDER, {
+            "user_id": user.id,
+            "title": order.title,
+            "status": order.status,
+            "costume_id": order.costume_id,
+            "phone": order.phone,
+            "date_from": order.date_from,
+            "date_to": order.date_to,
+        })
+        db_order = result.one()
+        await reports.bump_order_status(session, reports.today_utc(), db_order.status, 1)
+        if db_order.costume_id is not None and db_order.date_from is not None and db_order.date_to is not None:
+            await reports.bump_costume_days(session, db_order.costume_id, db_order.date_from, db_order.date_to, 1)
         await session.commit()
-        await session.refresh(db_order)
         
-        logger.info(f"Заказ успешно создан: ID={db_order.id}, User ID={db_order.user_id}, Title={db_order.title}")
+        if db_order.costume_id is not None:
+            invalidate_availability(db_order.costume_id, db_order.date_from, db_order.date_to)
+        logger.info(f"Заказ успешно создан: ID={db_order.id}, User ID={user.id}, Title={db_order.title}")
+        analytics.record(
+            "booking", user.id, action="order_created", order_id=db_order.id,
+            costume_id=db_order.costume_id, date_from=db_order.date_from, date_to=db_order.date_to,
+        )
         
-        return db_order
+        return JSONBytesResponse(order_encoder.encode_one(db_order), status_code=http_status.HTTP_201_CREATED)
         
     except HTTPException:
         raise
@@ -557,30 +633,11 @@ async def get_my_orders(
    
     try:
         logger.info(f"Получение заявок для пользователя {user.id} ({user.email})")
-        result = await session.execute(
-            select(Order)
-            .where(Order.user_id == user.id)
-            .order_by(Order.created_at.desc())
-        )
-        orders = result.scalars().all()
+        result = await session.execute(statements.MY_ORDERS, {"user_id": user.id})
+        orders = result.all()
         
         logger.info(f"Найдено заявок: {len(orders)}")
-        orders_list = [
-            OrderOut(
-                id=order.id,
-                title=order.title,
-                status=order.status,
-                created_at=str(order.created_at) if order.created_at else "",
-                costume_id=order.costume_id,
-                phone=order.phone,
-                date_from=order.date_from,
-                date_to=order.date_to
-            )
-            for order in orders  
-        ]
-        
-        logger.info(f"Заявки успешно возвращены для пользователя {user.id}")
-        return orders_list
+        return JSONBytesResponse(order_encoder.encode_many(orders))
         
     except HTTPException:
         raise
@@ -599,42 +656,136 @@ def require_admin(user: User = Depends(current_active_user)):
         raise HTTPException(status_code=403, detail="Только для администратора")
     return user
 
-@app.get("/orders/all", response_model=List[OrderAdminOut])
-async def get_all_orders_admin(user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
-    q = (
-        select(Order, User, Costume)
+def admin_orders_query(where=lambda model: ()):
+    """Заказы вместе с архивом (order_history); where(model) - условия для каждой из таблиц."""
+    return union_all(
+        select(*ORDER_ADMIN_COLUMNS)
         .join(User, User.id == Order.user_id)
         .outerjoin(Costume, Costume.id == Order.costume_id)
-        .order_by(Order.created_at.desc())
+        .where(*where(Order)),
+        select(*ORDER_HISTORY_ADMIN_COLUMNS)
+        .join(User, User.id == OrderHistory.user_id)
+        .outerjoin(Costume, Costume.id == OrderHistory.costume_id)
+        .where(*where(OrderHistory)),
     )
-    result = await session.execute(q)
-    items = []
-    for order, u, c in result.all():
-        items.append(OrderAdminOut(
-            id=order.id,
-            user_id=u.id,
-            user_email=u.email,
-            title=order.title,
-            status=order.status,
-            created_at=str(order.created_at),
-            costume_id=order.costume_id,
-            costume_title=(c.title if c else None),
-            phone=order.phone,
-            date_from=order.date_from,
-            date_to=order.date_to
-        ))
-    return items
+
+@app.get("/orders/all", response_model=List[OrderAdminOut])
+async def get_all_orders_admin(user: User = Depends(require_admin), session: AsyncSession = Depends(get_read_session)):
+    q = admin_orders_query()
+    result = await session.execute(order_union(q, "created_at", descending=True))
+    return JSONBytesResponse(order_admin_encoder.encode_many(result.all()))
+
+# ========== ПОТОКОВАЯ ВЫГРУЗКА ЗАКАЗОВ И БРОНИРОВАНИЙ ==========
+
+def export_response(stmt, encoder, name: str, format: str, gzip: bool):
+    try:
+        chunks, media_type, ext = exports.export_stream(stmt, encoder, format, gzip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="format должен быть csv или ndjson")
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={name}.{ext}"},
+    )
+
+@app.get("/orders/export")
+async def export_orders(format: str = "ndjson", date_from: date | None = None, date_to: date | None = None, gzip: bool = False, user: User = Depends(require_admin)):
+    """Все заказы (с email и названием костюма), фильтр по дате создания включительно."""
+    if date_from and date_to and date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
+    def where(model):
+        conditions = []
+        if date_from:
+            conditions.append(model.created_at >= date_from)
+        if date_to:
+            conditions.append(model.created_at < date_to + timedelta(days=1))
+        return conditions
+    q = admin_orders_query(where)
+    q = order_union(q, "id")
+    analytics.record("admin", user.id, action="orders_exported", format=format, gzip=gzip)
+    return export_response(q, order_admin_encoder, "orders", format, gzip)
+
+# ========== ПАКЕТНАЯ СМЕНА СТАТУСОВ ЗАКАЗОВ ==========
+
+class OrderStatusBatchItem(OrderStatusUpdate):
+    id: int
+
+class OrderStatusBatchUpdate(BaseModel):
+    items: List[OrderStatusBatchItem]
+
+BATCH_MAX_ITEMS = 1000
+
+# Объявлен до /orders/{order_id}/status, иначе "batch" попадет в order_id
+@app.patch("/orders/batch/status")
+async def update_order_status_batch(payload: OrderStatusBatchUpdate, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    """
+    Меняет статусы многих заказов за один запрос и одну транзакцию:
+    по одному UPDATE ... WHERE id IN (...) на каждый целевой статус.
+    Возвращает результат по каждому id.
+    """
+    if len(payload.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Не более {BATCH_MAX_ITEMS} заказов за раз")
+    results = {}
+    wanted = {}
+    for item in payload.items:
+        try:
+            item.validate_status()
+        except HTTPException as e:
+            results[item.id] = {"id": item.id, "ok": False, "error": e.detail}
+            continue
+        wanted[item.id] = item.status
+
+    if wanted:
+        rows = await session.execute(
+            select(Order.id, Order.status, Order.created_at).where(Order.id.in_(wanted.keys()))
+        )
+        by_status: dict[str, list[int]] = {}
+        for order_id, old_status, created_at in rows.all():
+            new_status = wanted[order_id]
+            results[order_id] = {"id": order_id, "ok": True, "old_status": old_status, "status": new_status}
+            if old_status == new_status:
+                continue
+            by_status.setdefault(new_status, []).append(order_id)
+            day = created_at.date() if created_at else reports.today_utc()
+            await reports.bump_order_status(session, day, old_status, -1)
+            await reports.bump_order_status(session, day, new_status, 1)
+        for new_status, ids in by_status.items():
+            await session.execute(
+                update(Order).where(Order.id.in_(ids)).values(status=new_status)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+        for order_id in wanted:
+            if order_id not in results:
+                results[order_id] = {"id": order_id, "ok": False, "error": "Заказ не найден"}
+        changed = sum(len(ids) for ids in by_status.values())
+        analytics.record("admin", user.id, action="order_status_batch", requested=len(payload.items), changed=changed)
+
+    return {"results": [results[item.id] for item in payload.items]}
 
 @app.patch("/orders/{order_id}/status", response_model=OrderOut)
 async def update_order_status(order_id: int, payload: OrderStatusUpdate, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
     payload.validate_status()
-    order = await session.get(Order, order_id)
-    if not order:
+    # Старый статус нужен для сводных таблиц; новое состояние заказа возвращает UPDATE ... RETURNING
+    current = (await session.execute(
+        select(Order.status, Order.created_at).where(Order.id == order_id)
+    )).one_or_none()
+    if current is None:
         raise HTTPException(status_code=404, detail="Заказ не найден")
-    order.status = payload.status
+    old_status, created_at = current
+    result = await session.execute(
+        update(Order).where(Order.id == order_id).values(status=payload.status)
+        .returning(*ORDER_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    order = result.one()
+    if old_status != payload.status:
+        day = created_at.date() if created_at else reports.today_utc()
+        await reports.bump_order_status(session, day, old_status, -1)
+        await reports.bump_order_status(session, day, payload.status, 1)
     await session.commit()
-    await session.refresh(order)
-    return order
+    analytics.record("admin", user.id, action="order_status_changed", order_id=order_id, old=old_status, new=payload.status)
+    return JSONBytesResponse(order_encoder.encode_one(order))
 
 
 # ========== ЭНДПОИНТ ДЛЯ ПОЛУЧЕНИЯ ПРОФИЛЯ ПОЛЬЗОВАТЕЛЯ ==========
@@ -753,8 +904,7 @@ async def upload_profile_photo(
 
     safe_name = f"user_{user.id}_{image.filename}"
     out_path = UPLOAD_DIR / safe_name
-    with open(out_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
+    await save_upload(image, out_path)
     result = await session.execute(
         select(Profile).where(Profile.user_id == user.id)
     )
@@ -766,6 +916,14 @@ async def upload_profile_photo(
     await session.commit()
     return {"photo_url": f"/uploads/{safe_name}"}
 
+# ========== ГОТОВНОСТЬ К ПРИЕМУ ЗАПРОСОВ ==========
+
+@app.get("/ready")
+async def ready():
+    # 200 после завершения прогрева, до этого 503 - для проверки готовности балансировщиком
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/")
 async def root():
     return {
@@ -823,26 +981,145 @@ async def create_costume(
     # Генерируем уникальное имя файла для избежания конфликтов
     unique_filename = f"{uuid.uuid4()}{ext}"
     out_path = UPLOAD_DIR / unique_filename
-    with open(out_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
-    costume = Costume(title=title, description=description, price=price, available=available, image_filename=unique_filename)
-    session.add(costume)
+    await save_upload(image, out_path)
+    result = await session.execute(
+        insert(Costume).values(
+            title=title, description=description, price=price, available=available, image_filename=unique_filename,
+        ).returning(*COSTUME_COLUMNS)
+    )
+    costume = result.one()
+    await search.index_costume(session, costume)
     await session.commit()
-    await session.refresh(costume)
-    return {**costume.__dict__, "image_url": f"/uploads/{costume.image_filename}"}
+    invalidate_catalog(costume.id)
+    analytics.record("admin", user.id, action="costume_created", costume_id=costume.id)
+    return JSONBytesResponse(costume_encoder.encode_one(costume))
+
+catalog_flight = SingleFlight("catalog")
+
+def invalidate_catalog(costume_id: int | None = None):
+    """Вызывается после изменения костюмов."""
+    catalog_flight.forget("all")
+    read_router.stick("catalog", *([f"costume:{costume_id}"] if costume_id is not None else []))
+
+async def load_catalog() -> bytes:
+    async with read_router.session("catalog") as session:
+        result = await session.execute(select(*COSTUME_COLUMNS))
+        return costume_encoder.encode_many(result.all())
 
 @app.get("/costumes", response_model=list[CostumeOut])
-async def list_costumes(session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(Costume))
-    costumes = result.scalars().all()
-    return [{**c.__dict__, "image_url": f"/uploads/{c.image_filename}"} for c in costumes]
+async def list_costumes():
+    # Одновременные запросы каталога делят один SELECT и одно кодирование
+    return JSONBytesResponse(await catalog_flight.do("all", load_catalog))
+
+# ========== ПОИСК ПО КАТАЛОГУ ==========
+
+class CostumeSearchOut(BaseModel):
+    total: int
+    items: list[CostumeOut]
+    facets: dict
+
+# Объявлен до /costumes/{costume_id}, иначе "search" попадет в costume_id
+@app.get("/costumes/search", response_model=CostumeSearchOut)
+async def search_costumes(
+    q: str | None = None,
+    price_min: int | None = None,
+    price_max: int | None = None,
+    available: bool | None = None,
+    free_from: date | None = None,
+    free_to: date | None = None,
+    limit: int = 20,
+    offset: int = 0,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Поиск по названию и описанию с фасетами по цене и доступности.
+    free_from/free_to оставляют только костюмы, свободные во весь период.
+    """
+    if (free_from is None) != (free_to is None):
+        raise HTTPException(status_code=400, detail="Укажите обе даты free_from и free_to")
+    if free_from is not None and free_to < free_from:
+        raise HTTPException(status_code=400, detail="free_to не может быть раньше free_from")
+    result = await search.search_costumes(
+        session, q=q, price_min=price_min, price_max=price_max, available=available,
+        free_from=free_from, free_to=free_to, limit=max(1, min(limit, 100)), offset=max(0, offset),
+    )
+    result["items"] = [costume_encoder.to_dict(costume_row(c)) for c in result["items"]]
+    return result
+
+# ========== МАССОВЫЙ ИМПОРТ И ЭКСПОРТ КАТАЛОГА ==========
+
+@app.post("/costumes/import")
+async def import_costumes(
+    manifest: UploadFile = File(...),
+    images: UploadFile = File(None),
+    user: User = Depends(require_admin),
+):
+    """
+    Массовая загрузка костюмов: манифест .csv или .jsonl (title, description, price,
+    available, image) и zip-архив с изображениями, на которые ссылается поле image.
+    """
+    if not manifest.filename.lower().endswith((".csv", ".jsonl", ".ndjson")):
+        raise HTTPException(status_code=400, detail="Манифест должен быть .csv или .jsonl")
+    if images is not None and not images.filename.lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Изображения передаются zip-архивом")
+    try:
+        report = await catalog_io.import_costumes(manifest.file, manifest.filename, images.file if images else None, UPLOAD_DIR)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Не удалось прочитать файл: {e}")
+    invalidate_catalog()
+    logger.info(f"Импорт каталога: {report['imported']} шт., {report['items_per_second']} шт/с, ошибок {report['failed']}")
+    analytics.record("admin", user.id, action="costumes_imported", imported=report["imported"], failed=report["failed"])
+    return report
+
+@app.get("/costumes/export")
+async def export_costumes(format: str = "jsonl", user: User = Depends(require_admin)):
+    if format == "csv":
+        return StreamingResponse(
+            catalog_io.export_csv(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=costumes.csv"},
+        )
+    if format == "jsonl":
+        return StreamingResponse(
+            catalog_io.export_jsonl(),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=costumes.jsonl"},
+        )
+    raise HTTPException(status_code=400, detail="format должен быть csv или jsonl")
+
+# ========== КАЛЕНДАРЬ ЗАНЯТОСТИ КОСТЮМОВ ==========
+
+# Объявлен до /costumes/{costume_id}, иначе "calendar" попадет в costume_id
+@app.get("/costumes/calendar")
+async def costumes_calendar(ids: str, month: str | None = None, session: AsyncSession = Depends(get_async_session)):
+    """Занятость нескольких костюмов за месяц: ids=1,2,3&month=YYYY-MM."""
+    try:
+        costume_ids = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids должен быть списком чисел через запятую")
+    if not costume_ids or len(costume_ids) > 200:
+        raise HTTPException(status_code=400, detail="Укажите от 1 до 200 костюмов")
+    year, mon = parse_month(month)
+    bitmaps = await month_bitmaps(session, costume_ids, year, mon)
+    unknown = [costume_id for costume_id in costume_ids if costume_id not in bitmaps]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Костюмы не найдены: {', '.join(map(str, unknown))}")
+    return [calendar_payload(costume_id, year, mon, bitmaps[costume_id]) for costume_id in costume_ids]
+
+@app.get("/costumes/{costume_id}/calendar")
+async def costume_calendar(costume_id: int, month: str | None = None, session: AsyncSession = Depends(get_async_session)):
+    year, mon = parse_month(month)
+    bitmaps = await month_bitmaps(session, [costume_id], year, mon)
+    if costume_id not in bitmaps:
+        raise HTTPException(status_code=404, detail="Костюм не найден")
+    return calendar_payload(costume_id, year, mon, bitmaps[costume_id])
 
 @app.get("/costumes/{costume_id}", response_model=CostumeOut)
-async def get_costume(costume_id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_costume(costume_id: int, session: AsyncSession = Depends(get_read_session)):
     costume = await session.get(Costume, costume_id)
     if not costume:
         raise HTTPException(status_code=404, detail="Костюм не найден")
-    return {**costume.__dict__, "image_url": f"/uploads/{costume.image_filename}"}
+    return JSONBytesResponse(costume_encoder.encode_one(costume_row(costume)))
 
 @app.put("/costumes/{costume_id}", response_model=CostumeOut)
 async def update_costume(
@@ -855,37 +1132,46 @@ async def update_costume(
     user: User = Depends(require_admin),
     session: AsyncSession = Depends(get_async_session),
 ):
-    costume = await session.get(Costume, costume_id)
-    if not costume:
-        raise HTTPException(status_code=404, detail="Костюм не найден")
-    costume.title = title
-    costume.description = description
-    costume.price = price
-    costume.available = available
+    values = {"title": title, "description": description, "price": price, "available": available}
+    old_filename = None
     if image is not None:
         ext = os.path.splitext(image.filename)[1].lower()
         if ext not in [".jpg", ".jpeg", ".png"]:
             raise HTTPException(status_code=400, detail="Недопустимый формат файла. Только .jpg, .png")
+        # Старое имя файла читаем только при замене изображения
+        current = (await session.execute(select(Costume.image_filename).where(Costume.id == costume_id))).one_or_none()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Костюм не найден")
+        old_filename = current.image_filename
         
         # Генерируем уникальное имя файла для избежания конфликтов
         unique_filename = f"{uuid.uuid4()}{ext}"
-        out_path = UPLOAD_DIR / unique_filename
-        
-        # Удаляем старое изображение, если оно существует
-        if costume.image_filename:
-            old_path = UPLOAD_DIR / costume.image_filename
-            if old_path.exists():
-                try:
-                    old_path.unlink()
-                except Exception:
-                    pass  # Игнорируем ошибки удаления
-        
-        with open(out_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        costume.image_filename = unique_filename
+        await save_upload(image, UPLOAD_DIR / unique_filename)
+        values["image_filename"] = unique_filename
+
+    # Без изображения - один UPDATE ... RETURNING, отсутствие строки означает 404
+    result = await session.execute(
+        update(Costume).where(Costume.id == costume_id).values(**values)
+        .returning(*COSTUME_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    costume = result.one_or_none()
+    if costume is None:
+        raise HTTPException(status_code=404, detail="Костюм не найден")
+    await search.index_costume(session, costume)
     await session.commit()
-    await session.refresh(costume)
-    return {**costume.__dict__, "image_url": f"/uploads/{costume.image_filename}"}
+    invalidate_catalog(costume_id)
+
+    # Удаляем старое изображение только после успешного commit
+    if old_filename:
+        old_path = UPLOAD_DIR / old_filename
+        if old_path.exists():
+            try:
+                old_path.unlink()
+            except Exception:
+                pass  # Игнорируем ошибки удаления
+    analytics.record("admin", user.id, action="costume_updated", costume_id=costume.id)
+    return JSONBytesResponse(costume_encoder.encode_one(costume))
 
 @app.delete("/costumes/{costume_id}")
 async def delete_costume(costume_id: int, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
@@ -893,7 +1179,12 @@ async def delete_costume(costume_id: int, user: User = Depends(require_admin), s
     if not costume:
         raise HTTPException(status_code=404, detail="Костюм не найден")
     await session.delete(costume)
+    await reports.forget_costume(session, costume_id)
+    await search.unindex_costume(session, costume_id)
     await session.commit()
+    invalidate_availability(costume_id)
+    invalidate_catalog(costume_id)
+    analytics.record("admin", user.id, action="costume_deleted", costume_id=costume_id)
     return {"ok": True}
 
 class ReservationOut(BaseModel):
@@ -914,26 +1205,24 @@ class ReservationCreate(BaseModel):
         if self.date_to < self.date_from:
             raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
 
-@app.get("/costumes/{costume_id}/availability")
-async def costume_availability(costume_id: int, session: AsyncSession = Depends(get_async_session), from_date: date | None = None, to_date: date | None = None):
-    """
-    Проверяет доступность костюма на указанные даты.
-    Проверяет как старые бронирования (Reservations), так и заказы на бронирование (Orders с costume_id и датами).
-    """
+availability_flight = SingleFlight("availability")
+
+def invalidate_availability(costume_id: int, date_from: date | None = None, date_to: date | None = None):
+    """Вызывается после записи бронирований костюма."""
+    occupancy_cache.invalidate(costume_id, date_from, date_to)
+    # Запрос, пришедший после записи, не должен присоединиться к чтению, начатому до нее
+    availability_flight.forget_where(lambda key: key[0] == costume_id)
+    # Реплика еще может не видеть запись: чтения этого костюма - с основной БД
+    read_router.stick(f"costume:{costume_id}")
+
+async def load_availability(costume_id: int, from_date: date | None, to_date: date | None) -> list[dict]:
     conflicts = []
     
-    try:
+    q_reservations, q_orders, params = statements.availability(costume_id, from_date, to_date)
+    async with read_router.session(f"costume:{costume_id}") as session:
         # Проверяем старые бронирования (Reservations)
-        q_reservations = select(Reservation).where(Reservation.costume_id == costume_id)
-        if from_date is not None and to_date is not None:
-            q_reservations = q_reservations.where(
-                Reservation.date_from <= to_date, 
-                Reservation.date_to >= from_date
-            )
-        result_reservations = await session.execute(q_reservations)
-        reservations = result_reservations.scalars().all()
-        
-        for res in reservations:
+        result_reservations = await session.execute(q_reservations, params)
+        for res in result_reservations:
             conflicts.append({
                 "id": res.id,
                 "type": "reservation",
@@ -942,31 +1231,31 @@ async def costume_availability(costume_id: int, session: AsyncSession = Depends(
             })
         
         # Проверяем заказы на бронирование (Orders с costume_id и датами)
-        q_orders = select(Order).where(
-            Order.costume_id == costume_id
-        ).where(
-            Order.date_from.isnot(None)
-        ).where(
-            Order.date_to.isnot(None)
-        )
-        if from_date is not None and to_date is not None:
-            q_orders = q_orders.where(
-                Order.date_from <= to_date,
-                Order.date_to >= from_date
-            )
-        result_orders = await session.execute(q_orders)
-        orders = result_orders.scalars().all()
-        
-        for order in orders:
+        result_orders = await session.execute(q_orders, params)
+        for order in result_orders:
             conflicts.append({
                 "id": order.id,
                 "type": "order",
                 "date_from": str(order.date_from),
                 "date_to": str(order.date_to)
             })
-        
-        return conflicts
-        
+    
+    return conflicts
+
+@app.get("/costumes/{costume_id}/availability")
+async def costume_availability(costume_id: int, from_date: date | None = None, to_date: date | None = None):
+    """
+    Проверяет доступность костюма на указанные даты.
+    Проверяет как старые бронирования (Reservations), так и заказы на бронирование (Orders с costume_id и датами).
+    Одинаковые одновременные проверки выполняются одним чтением (singleflight.py).
+    """
+    if from_date is None or to_date is None:
+        # Период учитывается, только если заданы обе даты
+        from_date = to_date = None
+    try:
+        return await availability_flight.do(
+            (costume_id, from_date, to_date), lambda: load_availability(costume_id, from_date, to_date)
+        )
     except Exception as e:
         logger.error(f"Ошибка при проверке доступности костюма {costume_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка проверки доступности: {str(e)}")
@@ -974,34 +1263,29 @@ async def costume_availability(costume_id: int, session: AsyncSession = Depends(
 @app.post("/reservations", response_model=ReservationOut, status_code=http_status.HTTP_201_CREATED)
 async def create_reservation(payload: ReservationCreate, user: User = Depends(current_active_user), session: AsyncSession = Depends(get_async_session)):
     payload.validate()
-    costume = await session.get(Costume, payload.costume_id)
-    if not costume or not costume.available:
+    available = await session.scalar(statements.COSTUME_AVAILABLE, {"costume_id": payload.costume_id})
+    if not available:
         raise HTTPException(status_code=404, detail="Костюм недоступен или не найден")
 
-    q = select(Reservation).where(
-        Reservation.costume_id == payload.costume_id,
-        Reservation.date_from <= payload.date_to,
-        Reservation.date_to >= payload.date_from,
-    )
-    result = await session.execute(q)
-    conflict = result.scalars().first()
-    if conflict:
+    dates = {"costume_id": payload.costume_id, "date_from": payload.date_from, "date_to": payload.date_to}
+    conflict = await session.scalar(statements.RESERVATION_CONFLICT, dates)
+    if conflict is not None:
         raise HTTPException(status_code=409, detail="Выбранные даты недоступны (пересечение с существующим бронированием)")
-    res = Reservation(
-        user_id=user.id,
-        costume_id=payload.costume_id,
-        date_from=payload.date_from,
-        date_to=payload.date_to,
-    )
-    session.add(res)
+    result = await session.execute(statements.INSERT_RESERVATION, {"user_id": user.id, **dates})
+    res = result.one()
+    await reports.bump_costume_days(session, res.costume_id, res.date_from, res.date_to, 1)
     await session.commit()
-    await session.refresh(res)
-    return res
+    invalidate_availability(res.costume_id, res.date_from, res.date_to)
+    analytics.record(
+        "booking", user.id, action="reservation_created", reservation_id=res.id,
+        costume_id=res.costume_id, date_from=res.date_from, date_to=res.date_to,
+    )
+    return JSONBytesResponse(reservation_encoder.encode_one(res), status_code=http_status.HTTP_201_CREATED)
 
 @app.get("/reservations/me", response_model=list[ReservationOut])
 async def my_reservations(user: User = Depends(current_active_user), session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(Reservation).where(Reservation.user_id == user.id).order_by(Reservation.date_from.desc()))
-    return result.scalars().all()
+    result = await session.execute(statements.MY_RESERVATIONS, {"user_id": user.id})
+    return JSONBytesResponse(reservation_encoder.encode_many(result.all()))
 
 class ReservationAdminOut(BaseModel):
     id: int
@@ -1013,36 +1297,499 @@ class ReservationAdminOut(BaseModel):
     date_to: date
     created_at: str | None = None
 
-@app.get("/reservations/all", response_model=List[ReservationAdminOut])
-async def all_reservations_admin(user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
-    q = (
-        select(Reservation, User, Costume)
+def admin_reservations_query(where=lambda model: ()):
+    """Бронирования вместе с архивом (reservation_history)."""
+    return union_all(
+        select(*RESERVATION_ADMIN_COLUMNS)
         .join(User, User.id == Reservation.user_id)
         .join(Costume, Costume.id == Reservation.costume_id)
-        .order_by(Reservation.date_from.desc())
+        .where(*where(Reservation)),
+        select(*RESERVATION_HISTORY_ADMIN_COLUMNS)
+        .join(User, User.id == ReservationHistory.user_id)
+        .join(Costume, Costume.id == ReservationHistory.costume_id)
+        .where(*where(ReservationHistory)),
     )
-    result = await session.execute(q)
-    items = []
-    for r, u, c in result.all():
-        items.append(ReservationAdminOut(
-            id=r.id,
-            user_id=u.id,
-            user_email=u.email,
-            costume_id=c.id,
-            costume_title=c.title,
-            date_from=r.date_from,
-            date_to=r.date_to,
-            created_at=str(r.created_at) if r.created_at else None,
-        ))
-    return items
+
+@app.get("/reservations/all", response_model=List[ReservationAdminOut])
+async def all_reservations_admin(user: User = Depends(require_admin), session: AsyncSession = Depends(get_read_session)):
+    q = admin_reservations_query()
+    result = await session.execute(order_union(q, "date_from", descending=True))
+    return JSONBytesResponse(reservation_admin_encoder.encode_many(result.all()))
+
+@app.get("/reservations/export")
+async def export_reservations(format: str = "ndjson", date_from: date | None = None, date_to: date | None = None, gzip: bool = False, user: User = Depends(require_admin)):
+    """Все бронирования, период которых пересекается с [date_from, date_to]."""
+    if date_from and date_to and date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
+    def where(model):
+        conditions = []
+        if date_from:
+            conditions.append(model.date_to >= date_from)
+        if date_to:
+            conditions.append(model.date_from <= date_to)
+        return conditions
+    q = admin_reservations_query(where)
+    q = order_union(q, "id")
+    analytics.record("admin", user.id, action="reservations_exported", format=format, gzip=gzip)
+    return export_response(q, reservation_admin_encoder, "reservations", format, gzip)
 
 @app.delete("/reservations/{reservation_id}")
 async def delete_reservation_admin(reservation_id: int, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
     res = await session.get(Reservation, reservation_id)
     if not res:
         raise HTTPException(status_code=404, detail="Бронь не найдена")
+    await reports.bump_costume_days(session, res.costume_id, res.date_from, res.date_to, -1)
     await session.delete(res)
     await session.commit()
+    invalidate_availability(res.costume_id, res.date_from, res.date_to)
+    analytics.record("admin", user.id, action="reservation_deleted", reservation_id=reservation_id)
+    return {"ok": True}
+
+class ReservationBatchDelete(BaseModel):
+    ids: List[int]
+
+@app.post("/reservations/batch/delete")
+async def delete_reservations_batch(payload: ReservationBatchDelete, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    """Удаляет многие брони одним DELETE ... WHERE id IN (...) в одной транзакции."""
+    if len(payload.ids) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Не более {BATCH_MAX_ITEMS} броней за раз")
+    ids = set(payload.ids)
+    rows = (await session.execute(
+        select(Reservation.id, Reservation.costume_id, Reservation.date_from, Reservation.date_to)
+        .where(Reservation.id.in_(ids))
+    )).all()
+    for _, costume_id, date_from, date_to in rows:
+        await reports.bump_costume_days(session, costume_id, date_from, date_to, -1)
+    found = {r.id for r in rows}
+    if found:
+        await session.execute(
+            delete(Reservation).where(Reservation.id.in_(found)).execution_options(synchronize_session=False)
+        )
+    await session.commit()
+    for _, costume_id, date_from, date_to in rows:
+        invalidate_availability(costume_id, date_from, date_to)
+    analytics.record("admin", user.id, action="reservation_batch_deleted", deleted=len(found))
+    return {"results": [
+        {"id": rid, "ok": True} if rid in found else {"id": rid, "ok": False, "error": "Бронь не найдена"}
+        for rid in payload.ids
+    ]}
+
+# ========== УПРАВЛЕНИЕ БАЗОЙ ЗНАНИЙ (ТОЛЬКО АДМИН) ==========
+
+class KnowledgeEntryIn(BaseModel):
+    section: str
+    key: str
+    answer: str
+
+    def validate_section(self):
+        if self.section not in SECTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Недопустимый раздел. Возможные: {list(SECTIONS)}"
+            )
+
+class KnowledgeEntryOut(BaseModel):
+    id: int
+    section: str
+    key: str
+    answer: str
+    class Config:
+        from_attributes = True
+
+@app.get("/knowledge-base", response_model=List[KnowledgeEntryOut])
+async def list_knowledge_entries(section: str | None = None, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    q = select(KnowledgeEntry).order_by(KnowledgeEntry.id)
+    if section is not None:
+        q = q.where(KnowledgeEntry.section == section)
+    result = await session.execute(q)
+    return result.scalars().all()
+
+@app.get("/knowledge-base/version")
+async def knowledge_base_version():
+    return {"version": kb_index.version}
+
+@app.get("/knowledge-base/index")
+async def knowledge_base_index(request: Request):
+    """
+    Индекс базы знаний для чат-виджета: приветствия, термины и частые вопросы
+    виджет находит у себя и не отправляет на /chat. Публичный - те же ответы
+    /chat отдает любому. Браузер перепроверяет индекс по ETag (no-cache), и пока
+    база знаний не менялась, получает 304 без тела.
+    """
+    body, etag = kb_index.export_json()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=http_status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONBytesResponse(body, headers=headers)
+
+@app.post("/knowledge-base", response_model=KnowledgeEntryOut, status_code=http_status.HTTP_201_CREATED)
+async def create_knowledge_entry(payload: KnowledgeEntryIn, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    payload.validate_section()
+    key = payload.key.strip().lower()
+    result = await session.execute(
+        select(KnowledgeEntry).where(KnowledgeEntry.section == payload.section, KnowledgeEntry.key == key)
+    )
+    if result.scalar_one_or_none():
+        raise HTTPException(status_code=409, detail="Такая запись уже есть в базе знаний")
+    entry = KnowledgeEntry(section=payload.section, key=key, answer=payload.answer)
+    session.add(entry)
+    await bump_version(session)
+    await session.commit()
+    await session.refresh(entry)
+    kb_index.upsert(entry.section, entry.key, entry.answer)
+    logger.info(f"База знаний: добавлена запись {entry.id} (версия {kb_index.version})")
+    analytics.record("admin", user.id, action="kb_entry_created", entry_id=entry.id)
+    return entry
+
+@app.put("/knowledge-base/{entry_id}", response_model=KnowledgeEntryOut)
+async def update_knowledge_entry(entry_id: int, payload: KnowledgeEntryIn, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    payload.validate_section()
+    entry = await session.get(KnowledgeEntry, entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Запись базы знаний не найдена")
+    key = payload.key.strip().lower()
+    result = await session.execute(
+        select(KnowledgeEntry.id).where(
+            KnowledgeEntry.section == payload.section, KnowledgeEntry.key == key, KnowledgeEntry.id != entry_id
+        )
+    )
+    if result.first() is not None:
+        raise HTTPException(status_code=409, detail="Такая запись уже есть в базе знаний")
+    old_section, old_key = entry.section, entry.key
+    entry.section = payload.section
+    entry.key = key
+    entry.answer = payload.answer
+    await bump_version(session)
+    await session.commit()
+    await session.refresh(entry)
+    if (old_section, old_key) != (entry.section, entry.key):
+        kb_index.remove(old_section, old_key)
+    kb_index.upsert(entry.section, entry.key, entry.answer)
+    logger.info(f"База знаний: обновлена запись {entry.id} (версия {kb_index.version})")
+    analytics.record("admin", user.id, action="kb_entry_updated", entry_id=entry.id)
+    return entry
+
+@app.delete("/knowledge-base/{entry_id}")
+async def delete_knowledge_entry(entry_id: int, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    entry = await session.get(KnowledgeEntry, entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Запись базы знаний не найдена")
+    section, key = entry.section, entry.key
+    await session.delete(entry)
+    await bump_version(session)
+    await session.commit()
+    kb_index.remove(section, key)
+    logger.info(f"База знаний: удалена запись {entry_id} (версия {kb_index.version})")
+    analytics.record("admin", user.id, action="kb_entry_deleted", entry_id=entry_id)
+    return {"ok": True}
+
+@app.post("/knowledge-base/reload")
+async def reload_knowledge_base(user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    # Полная перезагрузка индекса из БД, не дожидаясь kb_sync (например, если записи
+    # меняли напрямую в БД)
+    version = await load_knowledge_base(session)
+    return {"ok": True, "version": version}
+
+# Ответы на частые вопросы, заготовленные LLM заранее (см. kb_candidates.py)
+
+class KnowledgeCandidateOut(BaseModel):
+    id: int
+    key: str
+    answer: str
+    examples: List[str]
+    hits: int
+    model: Optional[str]
+    status: str
+    created_at: datetime
+    reviewed_at: Optional[datetime]
+
+class KnowledgeCandidateGenerate(BaseModel):
+    top: int = kb_candidates.TOP_CLUSTERS
+    days: int = kb_candidates.LOOKBACK_DAYS
+    min_hits: int = kb_candidates.MIN_HITS
+
+class KnowledgeCandidateApprove(BaseModel):
+    # Администратор может поправить вопрос и ответ перед добавлением в базу знаний
+    key: Optional[str] = None
+    answer: Optional[str] = None
+
+def candidate_out(candidate: KnowledgeCandidate) -> KnowledgeCandidateOut:
+    return KnowledgeCandidateOut(
+        id=candidate.id,
+        key=candidate.key,
+        answer=candidate.answer,
+        examples=json.loads(candidate.examples),
+        hits=candidate.hits,
+        model=candidate.model,
+        status=candidate.status,
+        created_at=candidate.created_at,
+        reviewed_at=candidate.reviewed_at,
+    )
+
+async def pending_candidate(session: AsyncSession, candidate_id: int) -> KnowledgeCandidate:
+    candidate = await session.get(KnowledgeCandidate, candidate_id)
+    if not candidate:
+        raise HTTPException(status_code=404, detail="Кандидат не найден")
+    if candidate.status != "pending":
+        raise HTTPException(status_code=409, detail="Кандидат уже рассмотрен")
+    return candidate
+
+@app.get("/knowledge-base/candidates", response_model=List[KnowledgeCandidateOut])
+async def list_knowledge_candidates(
+    status: str = "pending",
+    limit: int = 100,
+    user: User = Depends(require_admin),
+    session: AsyncSession = Depends(get_async_session)
+):
+    limit = max(1, min(limit, 500))
+    result = await session.execute(
+        select(KnowledgeCandidate)
+        .where(KnowledgeCandidate.status == status)
+        .order_by(KnowledgeCandidate.hits.desc(), KnowledgeCandidate.id)
+        .limit(limit)
+    )
+    return [candidate_out(c) for c in result.scalars().all()]
+
+@app.post("/knowledge-base/candidates/generate", status_code=http_status.HTTP_202_ACCEPTED)
+async def generate_knowledge_candidates(payload: KnowledgeCandidateGenerate, user: User = Depends(require_admin)):
+    """Ставит в очередь разбор пропущенных вопросов и заготовку ответов для самых частых."""
+    job_id = await jobs.enqueue("kb_candidates", payload.model_dump())
+    analytics.record("admin", user.id, action="kb_candidates_requested", job_id=job_id)
+    return {"job_id": job_id}
+
+@app.post("/knowledge-base/candidates/{candidate_id}/approve", response_model=KnowledgeEntryOut)
+async def approve_knowledge_candidate(
+    candidate_id: int,
+    payload: KnowledgeCandidateApprove,
+    user: User = Depends(require_admin),
+    session: AsyncSession = Depends(get_async_session)
+):
+    candidate = await pending_candidate(session, candidate_id)
+    key = (payload.key or candidate.key).strip().lower()
+    answer = payload.answer or candidate.answer
+    result = await session.execute(
+        select(KnowledgeEntry).where(KnowledgeEntry.section == "вопросы", KnowledgeEntry.key == key)
+    )
+    if result.scalar_one_or_none():
+        raise HTTPException(status_code=409, detail="Такая запись уже есть в базе знаний")
+    entry = (await session.execute(
+        insert(KnowledgeEntry).values(section="вопросы", key=key, answer=answer).returning(KnowledgeEntry)
+    )).scalar_one()
+    candidate.answer = answer
+    candidate.status = "approved"
+    candidate.reviewed_at = jobs.utcnow()
+    await bump_version(session)
+    await session.commit()
+    kb_index.upsert(entry.section, entry.key, entry.answer)
+    logger.info(f"База знаний: кандидат {candidate_id} одобрен как запись {entry.id} (версия {kb_index.version})")
+    analytics.record("admin", user.id, action="kb_candidate_approved", candidate_id=candidate_id, entry_id=entry.id)
+    return entry
+
+@app.post("/knowledge-base/candidates/{candidate_id}/reject")
+async def reject_knowledge_candidate(candidate_id: int, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    candidate = await pending_candidate(session, candidate_id)
+    candidate.status = "rejected"
+    candidate.reviewed_at = jobs.utcnow()
+    await session.commit()
+    analytics.record("admin", user.id, action="kb_candidate_rejected", candidate_id=candidate_id)
+    return {"ok": True}
+
+# ========== АНАЛИТИКА И АУДИТ (ТОЛЬКО АДМИН) ==========
+
+@app.get("/analytics/stats")
+async def analytics_stats(user: User = Depends(require_admin)):
+    return {
+        "sink": analytics.ANALYTICS_SINK,
+        "pending": analytics.events.pending(),
+        **analytics.events.stats,
+    }
+
+@app.get("/analytics/events")
+async def analytics_events(
+    kind: str | None = None,
+    limit: int = 100,
+    before_id: int | None = None,
+    user: User = Depends(require_admin),
+    session: AsyncSession = Depends(get_async_session)
+):
+    limit = max(1, min(limit, 1000))
+    q = select(AnalyticsEvent).order_by(AnalyticsEvent.id.desc()).limit(limit)
+    if kind is not None:
+        q = q.where(AnalyticsEvent.kind == kind)
+    if before_id is not None:
+        q = q.where(AnalyticsEvent.id < before_id)
+    result = await session.execute(q)
+    return [
+        {
+            "id": e.id,
+            "kind": e.kind,
+            "user_id": e.user_id,
+            "payload": json.loads(e.payload) if e.payload else None,
+            "created_at": str(e.created_at),
+        }
+        for e in result.scalars().all()
+    ]
+
+# ========== ФОНОВЫЕ ЗАДАЧИ (ТОЛЬКО АДМИН) ==========
+
+@app.get("/jobs/stats")
+async def jobs_stats(user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    return await jobs.job_stats(session)
+
+@app.post("/jobs/{job_id}/retry")
+async def jobs_retry(job_id: int, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    if not await jobs.retry_job(session, job_id):
+        raise HTTPException(status_code=404, detail="Задача не найдена или не в статусе failed")
+    return {"ok": True}
+
+@app.post("/maintenance/run")
+async def maintenance_run(vacuum: bool = False, user: User = Depends(require_admin)):
+    """Внеплановое архивирование прошедших бронирований и ANALYZE (VACUUM по флагу)."""
+    report = await maintenance.run_maintenance(vacuum=vacuum)
+    analytics.record("admin", user.id, action="maintenance_run", **report)
+    return report
+
+# ========== МЕТРИКИ LLM И ОБЪЕДИНЕНИЯ ЗАПРОСОВ (ТОЛЬКО АДМИН) ==========
+
+@app.get("/llm/metrics")
+async def llm_metrics(user: User = Depends(require_admin)):
+    """Состояние выключателей и счетчики вызовов каждой модели цепочки."""
+    return llm_chain.metrics()
+
+@app.get("/singleflight/stats")
+async def singleflight_stats(user: User = Depends(require_admin)):
+    """Сколько одинаковых одновременных вычислений объединено (saved) по каждой группе."""
+    return singleflight.stats()
+
+# ========== ПРОФИЛИРОВАНИЕ РАБОТАЮЩЕГО ПРОЦЕССА (ТОЛЬКО АДМИН) ==========
+# Подробности - в profiling.py. Все снимки выполняются в отдельных потоках,
+# цикл событий продолжает обслуживать запросы
+
+def require_profiling():
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Профилирование отключено (PROFILING_ENABLED)")
+
+def collapsed_response(profile: dict) -> Response:
+    return Response(
+        profile["collapsed"],
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": "attachment; filename=cpu-profile.collapsed",
+            "X-Profile-Samples": str(profile["samples"]),
+            "X-Profile-Seconds": str(profile["seconds"]),
+        },
+    )
+
+@app.post("/debug/profile/cpu", dependencies=[Depends(require_profiling)])
+async def debug_profile_cpu(
+    seconds: float = 10.0,
+    interval_ms: float = 10.0,
+    idle: bool = False,
+    format: str = "collapsed",
+    user: User = Depends(require_admin)
+):
+    """
+    Выборочный профиль CPU за seconds секунд (не больше 60). format=collapsed -
+    файл для flamegraph.pl/speedscope, json - то же со сводкой. idle=true -
+    учитывать и простаивающие потоки.
+    """
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format: collapsed или json")
+    try:
+        profile = await profiling.cpu_profiler.profile(seconds, interval_ms / 1000, idle)
+    except profiling.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Профиль CPU уже снимается, дождитесь его окончания")
+    analytics.record("admin", user.id, action="cpu_profile", seconds=profile["seconds"], samples=profile["samples"])
+    return profile if format == "json" else collapsed_response(profile)
+
+@app.get("/debug/profile/cpu/last", dependencies=[Depends(require_profiling)])
+async def debug_profile_cpu_last(user: User = Depends(require_admin)):
+    if profiling.cpu_profiler.last is None:
+        raise HTTPException(status_code=404, detail="Профиль CPU еще не снимался")
+    return collapsed_response(profiling.cpu_profiler.last)
+
+@app.get("/debug/memory", dependencies=[Depends(require_profiling)])
+async def debug_memory_status(user: User = Depends(require_admin)):
+    return profiling.memory_tracker.status()
+
+@app.post("/debug/memory/start", dependencies=[Depends(require_profiling)])
+async def debug_memory_start(frames: int = profiling.TRACEMALLOC_FRAMES, user: User = Depends(require_admin)):
+    """Включает tracemalloc. Пока он включен, выделение памяти медленнее - не забудьте /debug/memory/stop."""
+    analytics.record("admin", user.id, action="tracemalloc_start")
+    return profiling.memory_tracker.start(max(1, min(frames, 50)))
+
+@app.post("/debug/memory/snapshot", dependencies=[Depends(require_profiling)])
+async def debug_memory_snapshot(top: int = 20, group_by: str = "lineno", user: User = Depends(require_admin)):
+    """Снимок памяти; со второго снимка - разница с предыдущим (где выросла память)."""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by: lineno, filename или traceback")
+    try:
+        return await profiling.memory_tracker.snapshot(max(1, min(top, 200)), group_by)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="tracemalloc не запущен, сначала POST /debug/memory/start")
+
+@app.post("/debug/memory/stop", dependencies=[Depends(require_profiling)])
+async def debug_memory_stop(user: User = Depends(require_admin)):
+    return profiling.memory_tracker.stop()
+
+@app.get("/debug/tasks", dependencies=[Depends(require_profiling)])
+async def debug_tasks(limit: int = 20, user: User = Depends(require_admin)):
+    """Стеки всех задач asyncio - на чем сейчас ждут обработчики запросов."""
+    tasks = profiling.dump_tasks(max(1, min(limit, 100)))
+    return {"count": len(tasks), "tasks": tasks}
+
+@app.get("/debug/threads", dependencies=[Depends(require_profiling)])
+async def debug_threads(limit: int = 30, user: User = Depends(require_admin)):
+    """Стеки всех потоков: пул LLM, asyncio.to_thread, воркеры."""
+    threads = profiling.dump_threads(max(1, min(limit, 100)))
+    return {"count": len(threads), "threads": threads}
+
+# ========== ЗАДЕРЖКА ЦИКЛА СОБЫТИЙ (ТОЛЬКО АДМИН) ==========
+
+@app.get("/loop/metrics")
+async def loop_metrics(user: User = Depends(require_admin)):
+    """
+    Задержка планирования цикла событий (p50/p99/max) и число блокировок дольше
+    порога; в отладочном режиме - стеки последних блокировок.
+    """
+    return loop_monitor.metrics()
+
+# ========== РЕПЛИКИ БД (ТОЛЬКО АДМИН) ==========
+
+@app.get("/db/replicas")
+async def db_replicas(user: User = Depends(require_admin)):
+    """Число реплик и сколько чтений ушло на реплики, на основную БД и по прилипанию."""
+    return read_router.status()
+
+# ========== ОТЧЕТЫ (ТОЛЬКО АДМИН) ==========
+
+def report_period(date_from: date | None, date_to: date | None) -> tuple[date, date]:
+    # По умолчанию - последние 7 дней, включая сегодня
+    date_to = date_to or reports.today_utc()
+    date_from = date_from or (date_to - timedelta(days=6))
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
+    if (date_to - date_from).days > 3660:
+        raise HTTPException(status_code=400, detail="Слишком большой период отчета")
+    return date_from, date_to
+
+@app.get("/reports/orders-by-status")
+async def report_orders_by_status(date_from: date | None = None, date_to: date | None = None, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    return await reports.orders_by_status(session, *report_period(date_from, date_to))
+
+@app.get("/reports/costume-utilization")
+async def report_costume_utilization(date_from: date | None = None, date_to: date | None = None, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    return await reports.utilization_report(session, *report_period(date_from, date_to))
+
+@app.get("/reports/revenue")
+async def report_revenue(date_from: date | None = None, date_to: date | None = None, user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    return await reports.revenue_report(session, *report_period(date_from, date_to))
+
+@app.post("/reports/rebuild")
+async def report_rebuild(user: User = Depends(require_admin), session: AsyncSession = Depends(get_async_session)):
+    # Полный пересчет сводных таблиц, если они разошлись с данными (например, после ручной правки БД)
+    await reports.rebuild(session)
     return {"ok": True}
 
 if __name__ == "__main__":
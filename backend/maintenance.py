@@ -0,0 +1,144 @@
+"""
+Плановое обслуживание БД: архивирование прошедших бронирований и ANALYZE/VACUUM.
+
+Бронирования (reservations), закончившиеся больше ARCHIVE_AFTER_DAYS дней назад,
+и завершенные заказы с прошедшими датами переносятся в reservation_history и
+order_history пачками по ARCHIVE_BATCH строк: INSERT ... SELECT и DELETE по
+одному списку id в одной короткой транзакции. Между пачками цикл событий
+освобождается, так что запросы API не ждут всей чистки.
+
+Сводные таблицы отчетов не меняются: архивные строки в них уже учтены,
+а reports.rebuild() читает и архив.
+
+Заодно удаляются старые завершенные фоновые задачи (jobs.purge_finished).
+
+После чистки выполняется ANALYZE (SQLite: PRAGMA optimize), чтобы планировщик
+знал актуальную статистику индексов; VACUUM - не чаще раза в VACUUM_INTERVAL.
+
+Задача maintenance выполняется очередью jobs и после завершения сама ставит
+себя на следующий запуск через MAINTENANCE_INTERVAL секунд.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select, text
+
+import jobs
+from database import AsyncSessionLocal, engine
+from models import Job, Order, OrderHistory, Reservation, ReservationHistory
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH = 500
+ARCHIVED_ORDER_STATUSES = ("завершена",)
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+VACUUM_INTERVAL = timedelta(days=1)
+
+
+def _archive_plan(cutoff: date):
+    """(исходная модель, модель архива, условие "пора в архив", колонки для INSERT ... SELECT)."""
+    return [
+        (
+            Reservation, ReservationHistory,
+            [Reservation.date_to < cutoff],
+            [Reservation.id, Reservation.user_id, Reservation.costume_id,
+             Reservation.date_from, Reservation.date_to, Reservation.created_at],
+        ),
+        (
+            Order, OrderHistory,
+            [Order.date_to.isnot(None), Order.date_to < cutoff, Order.status.in_(ARCHIVED_ORDER_STATUSES)],
+            [Order.id, Order.user_id, Order.costume_id, Order.title, Order.phone,
+             Order.date_from, Order.date_to, Order.status, Order.created_at],
+        ),
+    ]
+
+
+async def archive_expired(today: date | None = None, batch_size: int = ARCHIVE_BATCH) -> dict:
+    cutoff = (today or date.today()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived_at = jobs.utcnow()
+    moved = {}
+    for model, history, condition, columns in _archive_plan(cutoff):
+        total = 0
+        # id архивных строк не переиспользуются: orders и reservations - с AUTOINCREMENT (models.py)
+        while True:
+            async with AsyncSessionLocal() as session:
+                ids = (await session.execute(
+                    select(model.id).where(*condition).order_by(model.id).limit(batch_size)
+                )).scalars().all()
+                if not ids:
+                    break
+                names = [c.key for c in columns]
+                await session.execute(
+                    insert(history).from_select(
+                        names + ["archived_at"],
+                        select(*columns, literal(archived_at, history.archived_at.type)).where(model.id.in_(ids)),
+                    )
+                )
+                await session.execute(
+                    delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+                await session.commit()
+            total += len(ids)
+            await asyncio.sleep(0)
+        moved[model.__tablename__] = total
+    return moved
+
+
+async def optimize(vacuum: bool = False) -> dict:
+    done = {}
+    if engine.dialect.name != "sqlite":
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+        return {"analyze": True}
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        started = time.perf_counter()
+        await conn.execute(text("ANALYZE"))
+        await conn.execute(text("PRAGMA optimize"))
+        done["analyze_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if vacuum:
+            started = time.perf_counter()
+            await conn.execute(text("VACUUM"))
+            done["vacuum_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return done
+
+
+async def run_maintenance(vacuum: bool = False) -> dict:
+    started = time.perf_counter()
+    report = {"archived": await archive_expired(), "jobs_purged": await jobs.purge_finished()}
+    report.update(await optimize(vacuum=vacuum))
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Обслуживание БД: {report}")
+    return report
+
+
+# Повторы не нужны: при ошибке задача просто ждет следующего планового запуска
+@jobs.handler("maintenance", concurrency=1, max_attempts=1, timeout=1800.0)
+async def maintenance_job(vacuum_after: str | None = None):
+    now = jobs.utcnow()
+    next_vacuum = datetime.fromisoformat(vacuum_after) if vacuum_after else now
+    vacuum = now >= next_vacuum
+    try:
+        await run_maintenance(vacuum=vacuum)
+        if vacuum:
+            next_vacuum = now + VACUUM_INTERVAL
+    except Exception as e:
+        logger.error(f"Ошибка обслуживания БД: {e}")
+    await jobs.enqueue("maintenance", {"vacuum_after": next_vacuum.isoformat()}, delay=MAINTENANCE_INTERVAL)
+
+
+async def ensure_scheduled() -> bool:
+    """Ставит задачу обслуживания в очередь, если ее там еще нет (вызывается при старте)."""
+    async with AsyncSessionLocal() as session:
+        pending = (await session.execute(
+            select(Job.id).where(Job.kind == "maintenance", Job.status.in_(("queued", "running"))).limit(1)
+        )).first()
+    if pending:
+        return False
+    first_vacuum = jobs.utcnow() + VACUUM_INTERVAL
+    await jobs.enqueue("maintenance", {"vacuum_after": first_vacuum.isoformat()})
+    return True
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Date, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from database import Base
 from sqlalchemy.orm import relationship
@@ -39,11 +39,22 @@ class Costume(Base):
     orders = relationship("Order", back_populates="costume")
 
 
+# Составные индексы под основные запросы (проверяются test_query_plans.py):
+#   (costume_id, date_from, date_to) - поиск пересечений дат по костюму;
+#   (user_id, created_at) / (user_id, date_from) - списки "мои заказы/брони" с сортировкой.
+# Отдельные индексы по user_id и costume_id не нужны: их заменяют первые колонки составных.
+
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_costume_dates", "costume_id", "date_from", "date_to"),
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        # id не переиспользуются после удаления строк: иначе новая строка получила бы id архивной
+        {"sqlite_autoincrement": True},
+    )
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    costume_id = Column(Integer, ForeignKey("costumes.id"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    costume_id = Column(Integer, ForeignKey("costumes.id"), nullable=True)
     title = Column(String, nullable=False)
     phone = Column(String, nullable=True)
     date_from = Column(Date, nullable=True)
@@ -56,11 +67,137 @@ class Order(Base):
 
 class Reservation(Base):
     __tablename__ = "reservations"
+    __table_args__ = (
+        Index("ix_reservations_costume_dates", "costume_id", "date_from", "date_to"),
+        Index("ix_reservations_user_date_from", "user_id", "date_from"),
+        {"sqlite_autoincrement": True},
+    )
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    costume_id = Column(Integer, ForeignKey("costumes.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    costume_id = Column(Integer, ForeignKey("costumes.id"), nullable=False)
     date_from = Column(Date, nullable=False)
     date_to = Column(Date, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user = relationship("User", backref="reservations")
     costume = relationship("Costume", backref="reservations")
+
+
+class KnowledgeEntry(Base):
+    __tablename__ = "knowledge_entries"
+    __table_args__ = (UniqueConstraint("section", "key", name="uq_knowledge_section_key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    section = Column(String, nullable=False, index=True)
+    key = Column(String, nullable=False)
+    answer = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class KnowledgeBaseVersion(Base):
+    # Счетчик изменений базы знаний (одна строка, id = 1): увеличивается в той же
+    # транзакции, что и запись knowledge_entries (см. knowledge_base.bump_version)
+    __tablename__ = "knowledge_base_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class KnowledgeCandidate(Base):
+    # Ответ на частый вопрос, заготовленный LLM заранее (см. kb_candidates.py);
+    # после одобрения администратором становится записью knowledge_entries
+    __tablename__ = "knowledge_candidates"
+    __table_args__ = (Index("ix_knowledge_candidates_status_hits", "status", "hits"),)
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False, unique=True)  # вопрос в виде ключа раздела "вопросы"
+    answer = Column(String, nullable=False)
+    examples = Column(String, nullable=False)  # JSON: частые формулировки вопроса
+    hits = Column(Integer, nullable=False, default=0)  # сколько раз вопрос задавали
+    model = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending")  # pending, approved, rejected
+    created_at = Column(DateTime, nullable=False)
+    reviewed_at = Column(DateTime, nullable=True)
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_user_id_id", "user_id", "id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    role = Column(String, nullable=False)  # "user" или "assistant"
+    text = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AnalyticsEvent(Base):
+    __tablename__ = "analytics_events"
+    __table_args__ = (Index("ix_analytics_events_kind_id", "kind", "id"),)  # фильтр по kind + keyset по id
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True, index=True)
+    payload = Column(String, nullable=True)  # JSON
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# ========== АГРЕГАТЫ ДЛЯ ОТЧЕТОВ ==========
+# Обновляются в той же транзакции, что и заказ/бронирование (см. reports.py)
+
+class OrderDailyStat(Base):
+    __tablename__ = "order_daily_stats"
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class CostumeDailyBooking(Base):
+    __tablename__ = "costume_daily_bookings"
+    costume_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    bookings = Column(Integer, nullable=False, default=0)
+
+
+# ========== ФОНОВЫЕ ЗАДАЧИ ==========
+# Очередь задач хранится в БД, поэтому переживает перезапуск и доступна отдельному воркеру (см. jobs.py)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_kind_run_at", "status", "kind", "run_at"),)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(String, nullable=False)  # JSON
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False)  # UTC; не раньше этого времени
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# ========== АРХИВ ЗАВЕРШЕННЫХ БРОНИРОВАНИЙ ==========
+# Прошедшие бронирования и завершенные заказы переносятся сюда (см. maintenance.py),
+# чтобы запросы пересечения дат работали по небольшим "горячим" таблицам.
+# id сохраняется прежним.
+
+class OrderHistory(Base):
+    __tablename__ = "order_history"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    costume_id = Column(Integer, nullable=True, index=True)
+    title = Column(String, nullable=False)
+    phone = Column(String, nullable=True)
+    date_from = Column(Date, nullable=True)
+    date_to = Column(Date, nullable=True)
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class ReservationHistory(Base):
+    __tablename__ = "reservation_history"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    costume_id = Column(Integer, nullable=False, index=True)
+    date_from = Column(Date, nullable=False)
+    date_to = Column(Date, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime, nullable=False)
@@ -0,0 +1,168 @@
+"""
+Календарь занятости костюмов по месяцам.
+
+Занятость месяца считается одним запросом (UNION ALL бронирований и
+заказов с датами) и кодируется компактно:
+    bitmap - шестнадцатеричная строка, бит i означает, что день i+1 занят;
+    runs   - список отрезков [первый_день, длина] подряд занятых дней.
+Результат кэшируется по (costume_id, месяц) и сбрасывается при записи
+бронирований этого костюма. TTL ограничивает устаревание, если запись
+прошла через другой воркер. У каждого костюма есть версия, invalidate()
+увеличивает ее: месяц, прочитанный до сброса, в кэш уже не попадает.
+"""
+import calendar
+import time
+from collections import OrderedDict
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import select, union_all
+
+from models import Costume, Order, Reservation
+
+CACHE_TTL = 60.0
+CACHE_MAX_ITEMS = 20_000
+
+
+def parse_month(month: str | None) -> tuple[int, int]:
+    if month is None:
+        today = date.today()
+        return today.year, today.month
+    try:
+        year, mon = month.split("-")
+        year, mon = int(year), int(mon)
+        if not 1 <= mon <= 12 or not 1 <= year <= 9999:
+            raise ValueError
+        return year, mon
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Месяц должен быть в формате YYYY-MM")
+
+
+def month_bounds(year: int, mon: int) -> tuple[date, date]:
+    return date(year, mon, 1), date(year, mon, calendar.monthrange(year, mon)[1])
+
+
+def months_between(date_from: date, date_to: date):
+    year, mon = date_from.year, date_from.month
+    while (year, mon) <= (date_to.year, date_to.month):
+        yield year, mon
+        year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+
+
+def encode_runs(bits: int, days: int) -> list[list[int]]:
+    runs = []
+    day = 0
+    while day < days:
+        if bits >> day & 1:
+            start = day
+            while day < days and bits >> day & 1:
+                day += 1
+            runs.append([start + 1, day - start])
+        else:
+            day += 1
+    return runs
+
+
+class OccupancyCache:
+    def __init__(self, ttl: float = CACHE_TTL, max_items: int = CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: OrderedDict[tuple, tuple[float, int]] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, costume_id: int, year: int, mon: int) -> int | None:
+        item = self._items.get((costume_id, year, mon))
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            return None
+        self._items.move_to_end((costume_id, year, mon))
+        return item[1]
+
+    def version(self, costume_id: int) -> int:
+        return self._versions.get(costume_id, 0)
+
+    def put(self, costume_id: int, year: int, mon: int, bits: int, version: int):
+        # Пока шло чтение, бронирования костюма изменились - результат уже устарел
+        if self.version(costume_id) != version:
+            return
+        self._items[(costume_id, year, mon)] = (time.monotonic(), bits)
+        self._items.move_to_end((costume_id, year, mon))
+        if len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def invalidate(self, costume_id: int, date_from: date | None = None, date_to: date | None = None):
+        """Сбрасывает месяцы, затронутые бронированием; без дат - все месяцы костюма."""
+        self._versions[costume_id] = self.version(costume_id) + 1
+        if date_from is None or date_to is None:
+            for key in [k for k in self._items if k[0] == costume_id]:
+                del self._items[key]
+            return
+        for year, mon in months_between(date_from, date_to):
+            self._items.pop((costume_id, year, mon), None)
+
+
+occupancy_cache = OccupancyCache()
+
+
+async def month_bitmaps(session, costume_ids: list[int], year: int, mon: int) -> dict[int, int]:
+    """
+    Битовые маски занятости месяца для набора костюмов (недостающие считаются одним
+    запросом). Несуществующих костюмов в результате нет.
+    """
+    result: dict[int, int] = {}
+    missing = []
+    for costume_id in costume_ids:
+        bits = occupancy_cache.get(costume_id, year, mon)
+        if bits is None:
+            missing.append(costume_id)
+        else:
+            occupancy_cache.hits += 1
+            result[costume_id] = bits
+    if not missing:
+        return result
+    occupancy_cache.misses += len(missing)
+    versions = {costume_id: occupancy_cache.version(costume_id) for costume_id in missing}
+
+    # В кэше только существующие костюмы (удаление костюма сбрасывает его месяцы)
+    missing = list(await session.scalars(select(Costume.id).where(Costume.id.in_(missing))))
+    if not missing:
+        return result
+    first, last = month_bounds(year, mon)
+    bookings = union_all(
+        select(Reservation.costume_id, Reservation.date_from, Reservation.date_to).where(
+            Reservation.costume_id.in_(missing),
+            Reservation.date_from <= last,
+            Reservation.date_to >= first,
+        ),
+        select(Order.costume_id, Order.date_from, Order.date_to).where(
+            Order.costume_id.in_(missing),
+            Order.date_from.isnot(None),
+            Order.date_to.isnot(None),
+            Order.date_from <= last,
+            Order.date_to >= first,
+        ),
+    )
+    bits_by_costume = {costume_id: 0 for costume_id in missing}
+    rows = await session.execute(bookings)
+    for costume_id, date_from, date_to in rows.all():
+        start = max(date_from, first).day - 1
+        end = min(date_to, last).day  # не включительно
+        # Единицы в битах [start, end)
+        bits_by_costume[costume_id] |= ((1 << (end - start)) - 1) << start
+    for costume_id, bits in bits_by_costume.items():
+        occupancy_cache.put(costume_id, year, mon, bits, versions[costume_id])
+        result[costume_id] = bits
+    return result
+
+
+def calendar_payload(costume_id: int, year: int, mon: int, bits: int) -> dict:
+    days = calendar.monthrange(year, mon)[1]
+    return {
+        "costume_id": costume_id,
+        "month": f"{year:04d}-{mon:02d}",
+        "days": days,
+        "bitmap": format(bits, "x"),
+        "runs": encode_runs(bits, days),
+        "booked_days": bin(bits).count("1"),
+    }
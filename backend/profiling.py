@@ -0,0 +1,246 @@
+"""
+Профилирование работающего процесса без перезапуска (эндпоинты /debug/*, только админ).
+
+CPU: выборочный профилировщик. Отдельный поток каждые interval секунд
+снимает стеки всех потоков (sys._current_frames) и считает одинаковые
+стеки. Код приложения не инструментируется, поэтому накладные расходы
+почти не зависят от нагрузки: при 100 выборках в секунду - доли процента.
+Профиль ограничен по времени (не больше MAX_PROFILE_SECONDS), одновременно
+выполняется только один. Результат - свернутые стеки (collapsed stacks):
+строка "поток;функция (файл:строка);... N", которую принимают
+flamegraph.pl, speedscope и inferno.
+
+Память: tracemalloc включается по запросу (пока он включен, выделения
+памяти дороже примерно на треть, поэтому после разбора его нужно выключить).
+Каждый снимок сравнивается с предыдущим - видно, какие строки кода
+набрали память между снимками. Хранится только последний снимок.
+
+Задачи asyncio и потоки: текущие стеки всех задач цикла событий и всех
+потоков - видно, на чем висят запросы.
+"""
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+TRACEMALLOC_FRAMES = 10
+
+# Функции, в которых поток ждет работы (пул потоков, очередь aiosqlite, select
+# цикла событий): такие выборки не показывают, на что тратится CPU
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("core.py", "_connection_worker_thread"),
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+# ========== CPU ==========
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    # Точка с запятой - разделитель формата, пробел отделяет счетчик
+    return ";".join(label.replace(";", ",") for label in reversed(labels))
+
+
+class CPUProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, seconds: float, interval: float, idle: bool) -> dict:
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_at = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_at:
+                time.sleep(next_at - now)
+            next_at += interval
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stacks[_collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+            samples += 1
+        elapsed = time.perf_counter() - started
+        return {
+            "seconds": round(elapsed, 3),
+            "interval_ms": round(interval * 1000, 3),
+            "samples": samples,
+            "stacks": len(stacks),
+            "collapsed": "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+            "finished_at": time.time(),
+        }
+
+    async def profile(self, seconds: float, interval: float = 0.01, idle: bool = False) -> dict:
+        """Снимает профиль в отдельном потоке; цикл событий все это время обслуживает запросы."""
+        seconds = min(max(seconds, interval), MAX_PROFILE_SECONDS)
+        interval = max(interval, MIN_INTERVAL)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            result = await asyncio.to_thread(self._sample, seconds, interval, idle)
+        finally:
+            self._lock.release()
+        self.last = result
+        return result
+
+
+cpu_profiler = CPUProfiler()
+
+
+# ========== ПАМЯТЬ ==========
+
+class MemoryTracker:
+    def __init__(self):
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._snapshot_at: float | None = None
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._snapshot = None
+        return self.status()
+
+    def stop(self) -> dict:
+        tracemalloc.stop()
+        self._snapshot = None
+        self._snapshot_at = None
+        return self.status()
+
+    def status(self) -> dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+            "snapshot_at": self._snapshot_at,
+        }
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        # Выделения самого tracemalloc, исходников для отчета и импорта модулей - не интересны
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    @staticmethod
+    def _stat_row(stat, diff: bool) -> dict:
+        frame = stat.traceback[0]
+        row = {
+            "file": frame.filename,
+            "line": frame.lineno,
+            "code": linecache.getline(frame.filename, frame.lineno).strip(),
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        if diff:
+            row["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+            row["count_diff"] = stat.count_diff
+        return row
+
+    async def snapshot(self, top: int = 20, key_type: str = "lineno") -> dict:
+        """
+        Снимок памяти и разница с предыдущим снимком (если он был).
+        Снимок и сравнение выполняются в потоке - на большом процессе это секунды.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc не запущен")
+        snapshot = await asyncio.to_thread(self._take)
+        previous, previous_at = self._snapshot, self._snapshot_at
+        self._snapshot, self._snapshot_at = snapshot, time.time()
+        if previous is None:
+            stats = await asyncio.to_thread(snapshot.statistics, key_type)
+            rows = [self._stat_row(s, diff=False) for s in stats[:top]]
+        else:
+            stats = await asyncio.to_thread(snapshot.compare_to, previous, key_type)
+            rows = [self._stat_row(s, diff=True) for s in stats[:top]]
+        return {
+            **self.status(),
+            "compared_to": previous_at,
+            "total_kb": round(sum(s.size for s in stats) / 1024, 1),
+            "top": rows,
+        }
+
+
+memory_tracker = MemoryTracker()
+
+
+# ========== ЗАДАЧИ ASYNCIO И ПОТОКИ ==========
+
+def _format_frames(frames) -> list[str]:
+    return [
+        f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        for frame in frames
+    ]
+
+
+def dump_tasks(limit: int = 20) -> list[dict]:
+    """Стеки всех задач текущего цикла событий (вызывается из цикла)."""
+    current = asyncio.current_task()
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "current": task is current,
+            "cancelling": task.cancelling() if hasattr(task, "cancelling") else None,
+            "stack": _format_frames(task.get_stack(limit=limit)),
+        })
+    tasks.sort(key=lambda t: t["name"])
+    return tasks
+
+
+def dump_threads(limit: int = 30) -> list[dict]:
+    names = {t.ident: (t.name, t.daemon) for t in threading.enumerate()}
+    threads = []
+    for thread_id, frame in sys._current_frames().items():
+        frames = []
+        while frame is not None and len(frames) < limit:
+            frames.append(frame)
+            frame = frame.f_back
+        name, daemon = names.get(thread_id, (str(thread_id), None))
+        threads.append({"id": thread_id, "name": name, "daemon": daemon, "stack": _format_frames(reversed(frames))})
+    return threads
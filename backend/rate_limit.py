@@ -0,0 +1,200 @@
+"""
+Ограничение частоты запросов (token bucket) и контроль одновременных запросов.
+
+Дорогие эндпоинты (/chat - вызовы Gemini, /auth/* - хеширование bcrypt)
+защищаются до того, как начнется тяжелая работа: middleware отвечает
+429 или 503 с заголовком Retry-After еще до чтения тела запроса.
+
+Хранилище состояния:
+    memory - словарь в памяти процесса (один воркер);
+    sqlite - общий файл SQLite, который видят все воркеры на одной машине.
+Выбирается переменной окружения RATE_LIMIT_BACKEND.
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from auth import token_user_id
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: int        # максимальный размер "ведра" (допустимый всплеск)
+    refill_per_sec: float  # скорость пополнения токенов
+
+
+# Бюджеты по маршрутам: (метод, путь) -> лимит на одного клиента
+ROUTE_LIMITS = {
+    ("POST", "/chat"): Limit(capacity=10, refill_per_sec=10 / 60),
+    ("POST", "/chat/authenticated"): Limit(capacity=20, refill_per_sec=20 / 60),
+    ("POST", "/chat/local"): Limit(capacity=30, refill_per_sec=30 / 60),
+    ("POST", "/auth/login"): Limit(capacity=5, refill_per_sec=5 / 60),
+    ("POST", "/auth/register"): Limit(capacity=3, refill_per_sec=3 / 60),
+    ("POST", "/auth/register-simple"): Limit(capacity=3, refill_per_sec=3 / 60),
+}
+
+
+class MemoryBackend:
+    """Token bucket в памяти процесса."""
+
+    def __init__(self, max_keys: int = 100_000):
+        # Порядок - от давно не обращавшихся клиентов к недавним
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._max_keys = max_keys
+
+    async def acquire(self, key: str, limit: Limit) -> float:
+        """Возвращает 0, если запрос разрешен, иначе - сколько секунд ждать."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(limit.capacity), now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_sec)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.refill_per_sec
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # Словарь не растет бесконечно: вытесняется ведро, к которому дольше всех не обращались.
+        # Общий сброс позволил бы обнулить чужие лимиты, заполнив словарь случайными ключами
+        while len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBackend:
+    """
+    Token bucket в общем файле SQLite - для нескольких воркеров uvicorn/gunicorn.
+    Обновление ведра выполняется в транзакции BEGIN IMMEDIATE, поэтому
+    воркеры не могут одновременно потратить один и тот же токен.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _acquire_sync(self, key: str, limit: Limit) -> float:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (float(limit.capacity), now)
+            tokens = min(limit.capacity, tokens + max(0.0, now - updated) * limit.refill_per_sec)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / limit.refill_per_sec
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    async def acquire(self, key: str, limit: Limit) -> float:
+        return await asyncio.to_thread(self._acquire_sync, key, limit)
+
+
+def create_backend():
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if kind == "sqlite":
+        default_path = str(Path(__file__).parent / "rate_limit.db")
+        return SQLiteBackend(os.getenv("RATE_LIMIT_SQLITE_PATH", default_path))
+    return MemoryBackend()
+
+
+def client_key(scope) -> str:
+    """
+    Ключ клиента: пользователь из действительного токена, иначе IP-адрес.
+    Подпись токена проверяется: со случайной строкой в Authorization клиент
+    получал бы новое ведро на каждый запрос и обходил лимит по IP.
+    """
+    headers = dict(scope.get("headers") or [])
+    user_id = token_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+    if user_id is not None:
+        return f"user:{user_id}"
+    if os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes"):
+        forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")[0].strip()
+        if forwarded:
+            return "ip:" + forwarded
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware: проверяет бюджет клиента и общее число одновременных
+    дорогих запросов до передачи запроса в приложение.
+    """
+
+    def __init__(self, app, backend=None, limits=None, max_concurrent: int | None = None):
+        self.app = app
+        self.backend = backend or create_backend()
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(
+            os.getenv("RATE_LIMIT_MAX_CONCURRENT", "32")
+        )
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.in_flight = 0
+        self.rejected = {"rate_limited": 0, "overloaded": 0}
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get((scope["method"], scope["path"].rstrip("/") or "/"))
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        # Глобальный лимит одновременных дорогих запросов
+        if self.in_flight >= self.max_concurrent:
+            self.rejected["overloaded"] += 1
+            return await _reject(send, 503, 1, "Сервер перегружен, попробуйте позже")
+
+        wait = await self.backend.acquire(f"{scope['path']}|{client_key(scope)}", limit)
+        if wait > 0:
+            self.rejected["rate_limited"] += 1
+            return await _reject(send, 429, wait, "Слишком много запросов, попробуйте позже")
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,135 @@
+"""
+Разделение чтения и записи: чтения каталога, доступности и админских списков
+идут на реплики, запись - на основную БД.
+
+Реплики задаются в DATABASE_REPLICA_URLS (database.py). Если список пуст,
+все сессии открываются на основной БД - поведение как без этого модуля.
+Реплики выбираются по кругу.
+
+Реплика отстает от основной БД, поэтому после записи чтения ненадолго
+(REPLICA_STICKY_SECONDS) прилипают к основной БД - так пользователь сразу
+видит свою запись:
+
+- "user:<id>" - пользователь, выполнивший запрос на изменение (POST/PUT/
+  PATCH/DELETE с токеном, StickyWritesMiddleware): его чтения идут на
+  основную БД;
+- "costume:<id>" - костюм, бронирования или карточка которого изменились:
+  доступность и карточку этого костюма читают с основной БД все; иначе
+  кэши (occupancy.py, singleflight) заполнились бы с отстающей реплики;
+- "catalog" - каталог после изменения костюмов.
+
+Прилипание хранится в памяти процесса: при нескольких процессах запрос
+после записи может попасть в другой процесс, поэтому окно должно быть
+больше обычного отставания реплики, а балансировщик - держать клиента на
+одном процессе.
+"""
+import itertools
+import logging
+import os
+import time
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from auth import token_user_id
+from database import AsyncSessionLocal, replica_engines
+
+logger = logging.getLogger(__name__)
+
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class ReadRouter:
+    def __init__(self, engines, sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.sessionmakers = [
+            async_sessionmaker(e, class_=AsyncSession, expire_on_commit=False, autoflush=False) for e in engines
+        ]
+        self.sticky_seconds = sticky_seconds
+        # Ключ прилипания -> время (monotonic), до которого чтения идут на основную БД
+        self._sticky: dict[str, float] = {}
+        self._next = itertools.count()
+        self.stats = {"primary": 0, "replica": 0, "sticky": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sessionmakers)
+
+    def stick(self, *keys: str):
+        if not self.enabled:
+            return
+        until = time.monotonic() + self.sticky_seconds
+        for key in keys:
+            self._sticky[key] = until
+
+    def is_sticky(self, keys) -> bool:
+        now = time.monotonic()
+        if len(self._sticky) > 10_000:
+            self._sticky = {k: until for k, until in self._sticky.items() if until > now}
+        return any(self._sticky.get(key, 0) > now for key in keys)
+
+    def session(self, *keys: str) -> AsyncSession:
+        """Сессия для чтения: реплика, если ни один из ключей не прилип к основной БД."""
+        if not self.enabled:
+            self.stats["primary"] += 1
+            return AsyncSessionLocal()
+        if self.is_sticky(keys):
+            self.stats["sticky"] += 1
+            return AsyncSessionLocal()
+        self.stats["replica"] += 1
+        return self.sessionmakers[next(self._next) % len(self.sessionmakers)]()
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.sessionmakers),
+            "sticky_seconds": self.sticky_seconds,
+            "sticky_keys": sum(1 for until in self._sticky.values() if until > now),
+            **self.stats,
+        }
+
+
+read_router = ReadRouter(replica_engines)
+
+
+# ========== КЛЮЧИ ПРИЛИПАНИЯ ЗАПРОСА ==========
+
+def request_keys(request: Request) -> list[str]:
+    keys = []
+    user_id = token_user_id(request.headers.get("authorization") or "")
+    if user_id is not None:
+        keys.append(f"user:{user_id}")
+    costume_id = request.path_params.get("costume_id")
+    if costume_id is not None:
+        keys.append(f"costume:{costume_id}")
+    return keys
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """Зависимость для эндпоинтов, которые только читают."""
+    async with read_router.session(*request_keys(request)) as session:
+        yield session
+
+
+class StickyWritesMiddleware:
+    """ASGI middleware: после запроса на изменение чтения пользователя прилипают к основной БД."""
+
+    def __init__(self, app, router: ReadRouter = read_router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or not self.router.enabled:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        user_id = token_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+        if user_id is None:
+            return await self.app(scope, receive, send)
+
+        async def send_and_stick(message):
+            # К началу ответа запись уже зафиксирована; следующий запрос клиента идет после него
+            if message["type"] == "http.response.start":
+                self.router.stick(f"user:{user_id}")
+            await send(message)
+
+        await self.app(scope, receive, send_and_stick)
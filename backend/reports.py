@@ -0,0 +1,197 @@
+"""
+Отчеты для администратора на основе инкрементальных агрегатов.
+
+Вместо полного сканирования orders/reservations при каждом отчете
+поддерживаются две сводные таблицы:
+    order_daily_stats      - число заказов по (день создания, статус);
+    costume_daily_bookings - число бронирований костюма на каждый день.
+Они обновляются в той же транзакции, что и сама запись (создание заказа,
+смена статуса, создание/удаление брони), поэтому отчеты читают только
+небольшие сводные таблицы и не зависят от объема истории.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Costume, CostumeDailyBooking, Order, OrderDailyStat, OrderHistory, Reservation, ReservationHistory
+
+# Защита от случайных "бронирований на годы": агрегат растет на одну строку в день
+MAX_BOOKING_DAYS = 366
+
+
+def _insert(session, table):
+    if session.bind.dialect.name == "postgresql":
+        return pg_insert(table)
+    return sqlite_insert(table)
+
+
+def _days(date_from: date, date_to: date):
+    days = min((date_to - date_from).days + 1, MAX_BOOKING_DAYS)
+    return [date_from + timedelta(days=i) for i in range(max(days, 0))]
+
+
+def today_utc() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+async def bump_order_status(session, day: date, status: str, delta: int):
+    stmt = _insert(session, OrderDailyStat.__table__).values(day=day, status=status, count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "status"],
+        set_={"count": OrderDailyStat.__table__.c.count + delta},
+    )
+    await session.execute(stmt)
+
+
+async def bump_costume_days(session, costume_id: int, date_from: date, date_to: date, delta: int):
+    days = _days(date_from, date_to)
+    if not days:
+        return
+    stmt = _insert(session, CostumeDailyBooking.__table__).values(
+        [{"costume_id": costume_id, "day": d, "bookings": delta} for d in days]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["costume_id", "day"],
+        set_={"bookings": CostumeDailyBooking.__table__.c.bookings + delta},
+    )
+    await session.execute(stmt)
+
+
+async def forget_costume(session, costume_id: int):
+    await session.execute(delete(CostumeDailyBooking).where(CostumeDailyBooking.costume_id == costume_id))
+
+
+async def rebuild(session):
+    """Полный пересчет агрегатов по исходным таблицам (первый запуск или ручной ремонт)."""
+    await session.execute(delete(OrderDailyStat))
+    await session.execute(delete(CostumeDailyBooking))
+
+    # Архивные строки (maintenance.py) тоже учитываются
+    result = await session.execute(union_all(
+        select(Order.created_at, Order.status),
+        select(OrderHistory.created_at, OrderHistory.status),
+    ))
+    order_counts: dict[tuple, int] = {}
+    for created_at, status in result.all():
+        day = created_at.date() if created_at else today_utc()
+        order_counts[(day, status)] = order_counts.get((day, status), 0) + 1
+    if order_counts:
+        await session.execute(
+            OrderDailyStat.__table__.insert(),
+            [{"day": d, "status": s, "count": c} for (d, s), c in order_counts.items()],
+        )
+
+    bookings: dict[tuple, int] = {}
+    result = await session.execute(union_all(
+        select(Reservation.costume_id, Reservation.date_from, Reservation.date_to),
+        select(ReservationHistory.costume_id, ReservationHistory.date_from, ReservationHistory.date_to),
+        select(Order.costume_id, Order.date_from, Order.date_to).where(
+            Order.costume_id.isnot(None), Order.date_from.isnot(None), Order.date_to.isnot(None)
+        ),
+        select(OrderHistory.costume_id, OrderHistory.date_from, OrderHistory.date_to).where(
+            OrderHistory.costume_id.isnot(None), OrderHistory.date_from.isnot(None), OrderHistory.date_to.isnot(None)
+        ),
+    ))
+    rows = result.all()
+    for costume_id, date_from, date_to in rows:
+        for d in _days(date_from, date_to):
+            bookings[(costume_id, d)] = bookings.get((costume_id, d), 0) + 1
+    if bookings:
+        await session.execute(
+            CostumeDailyBooking.__table__.insert(),
+            [{"costume_id": c, "day": d, "bookings": n} for (c, d), n in bookings.items()],
+        )
+    await session.commit()
+
+
+async def ensure_built(session) -> bool:
+    """Строит агрегаты, если сводные таблицы пусты, а исходные данные уже есть."""
+    has_stats = (await session.execute(select(OrderDailyStat.day).limit(1))).first()
+    has_bookings = (await session.execute(select(CostumeDailyBooking.day).limit(1))).first()
+    if has_stats or has_bookings:
+        return False
+    has_orders = (await session.execute(select(Order.id).limit(1))).first()
+    has_reservations = (await session.execute(select(Reservation.id).limit(1))).first()
+    if not has_orders and not has_reservations:
+        return False
+    await rebuild(session)
+    return True
+
+
+# ========== ЗАПРОСЫ ОТЧЕТОВ ==========
+
+async def orders_by_status(session, date_from: date, date_to: date):
+    result = await session.execute(
+        select(OrderDailyStat.day, OrderDailyStat.status, OrderDailyStat.count)
+        .where(OrderDailyStat.day >= date_from, OrderDailyStat.day <= date_to, OrderDailyStat.count != 0)
+        .order_by(OrderDailyStat.day, OrderDailyStat.status)
+    )
+    days = []
+    totals: dict[str, int] = {}
+    for day, status, count in result.all():
+        days.append({"day": str(day), "status": status, "count": count})
+        totals[status] = totals.get(status, 0) + count
+    return {"date_from": str(date_from), "date_to": str(date_to), "totals": totals, "days": days}
+
+
+async def costume_utilization(session, date_from: date, date_to: date):
+    total_days = (date_to - date_from).days + 1
+    booked = (
+        select(
+            CostumeDailyBooking.costume_id,
+            func.count().label("booked_days"),
+            func.sum(CostumeDailyBooking.bookings).label("rental_days"),
+        )
+        .where(
+            CostumeDailyBooking.day >= date_from,
+            CostumeDailyBooking.day <= date_to,
+            CostumeDailyBooking.bookings > 0,
+        )
+        .group_by(CostumeDailyBooking.costume_id)
+        .subquery()
+    )
+    result = await session.execute(
+        select(Costume.id, Costume.title, Costume.price, booked.c.booked_days, booked.c.rental_days)
+        .outerjoin(booked, booked.c.costume_id == Costume.id)
+        .order_by(Costume.id)
+    )
+    return total_days, result.all()
+
+
+async def utilization_report(session, date_from: date, date_to: date):
+    total_days, rows = await costume_utilization(session, date_from, date_to)
+    items = []
+    for costume_id, title, price, booked_days, rental_days in rows:
+        booked_days = booked_days or 0
+        items.append({
+            "costume_id": costume_id,
+            "title": title,
+            "booked_days": booked_days,
+            "total_days": total_days,
+            "utilization_pct": round(100 * booked_days / total_days, 1) if total_days > 0 else 0.0,
+        })
+    items.sort(key=lambda i: i["utilization_pct"], reverse=True)
+    return {"date_from": str(date_from), "date_to": str(date_to), "items": items}
+
+
+async def revenue_report(session, date_from: date, date_to: date):
+    """Оценка выручки: цена костюма × число арендных дней в периоде."""
+    _, rows = await costume_utilization(session, date_from, date_to)
+    items = []
+    total = 0
+    for costume_id, title, price, booked_days, rental_days in rows:
+        if not rental_days:
+            continue
+        revenue = price * rental_days
+        total += revenue
+        items.append({
+            "costume_id": costume_id,
+            "title": title,
+            "price": price,
+            "rental_days": rental_days,
+            "revenue": revenue,
+        })
+    items.sort(key=lambda i: i["revenue"], reverse=True)
+    return {"date_from": str(date_from), "date_to": str(date_to), "total": total, "items": items}
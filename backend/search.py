@@ -0,0 +1,224 @@
+"""
+Полнотекстовый поиск по каталогу костюмов.
+
+SQLite: виртуальная таблица FTS5 costume_search (rowid = costumes.id), в
+которую пишется уже обработанный стеммером текст названия и описания.
+Запрос проходит через тот же стеммер, каждое слово ищется как префикс,
+результаты ранжируются по bm25.
+PostgreSQL: to_tsvector('russian', ...) @@ plainto_tsquery('russian', ...).
+
+Стемминг: встроенный упрощенный стеммер (отбрасывание типичных окончаний).
+
+Индекс обновляется в той же транзакции, что и create/update/delete костюма.
+При старте ensure_index() сверяет индекс с каталогом и перестраивает его,
+если они разошлись.
+"""
+import re
+
+from sqlalchemy import and_, exists, func, literal_column, or_, select, table, text
+
+from models import Costume, Order, Reservation
+
+# Окончания, от длинных к коротким
+_ENDINGS = sorted({
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ого", "его", "ому", "ему",
+    "ыми", "ими", "ая", "яя", "ое", "ее", "ие", "ые", "ой", "ей", "ий", "ый",
+    "ую", "юю", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ия", "ья",
+    "ть", "ешь", "ет", "ете", "ют", "ут", "ит", "ат", "ят", "ал", "ала",
+    "али", "ило", "ость", "ости", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 2:
+            word = word[: -len(ending)]
+            break
+    # Мягкий знак и суффиксы -ск-/-к- ("пиратский", "пиратка" -> "пират")
+    word = word.rstrip("ь")
+    for suffix in ("ск", "к"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)]
+    return word
+
+
+def stem_text(value: str | None) -> str:
+    if not value:
+        return ""
+    return " ".join(stem(w) for w in _WORD_RE.findall(value))
+
+
+def fts_query(query: str) -> str | None:
+    """Строка MATCH для FTS5: все слова запроса как префиксы (неявное AND)."""
+    stems = [stem(w) for w in _WORD_RE.findall(query)]
+    stems = [s for s in stems if s]
+    if not stems:
+        return None
+    return " ".join(f'"{s}"*' for s in stems)
+
+
+def _is_sqlite(session) -> bool:
+    return session.bind.dialect.name == "sqlite"
+
+
+# ========== ПОДДЕРЖКА ИНДЕКСА ==========
+
+async def create_index(conn):
+    """Создает таблицу FTS5 (вызывается при старте для SQLite)."""
+    await conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS costume_search USING fts5("
+        "title, description, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+
+
+async def index_costume(session, costume: Costume):
+    if not _is_sqlite(session):
+        return
+    await session.execute(text("DELETE FROM costume_search WHERE rowid = :id"), {"id": costume.id})
+    await session.execute(
+        text("INSERT INTO costume_search (rowid, title, description) VALUES (:id, :title, :description)"),
+        {"id": costume.id, "title": stem_text(costume.title), "description": stem_text(costume.description)},
+    )
+
+
+async def unindex_costume(session, costume_id: int):
+    if not _is_sqlite(session):
+        return
+    await session.execute(text("DELETE FROM costume_search WHERE rowid = :id"), {"id": costume_id})
+
+
+async def rebuild_index(session):
+    if not _is_sqlite(session):
+        return
+    await session.execute(text("DELETE FROM costume_search"))
+    result = await session.execute(select(Costume.id, Costume.title, Costume.description))
+    rows = [
+        {"id": cid, "title": stem_text(title), "description": stem_text(description)}
+        for cid, title, description in result.all()
+    ]
+    if rows:
+        await session.execute(
+            text("INSERT INTO costume_search (rowid, title, description) VALUES (:id, :title, :description)"),
+            rows,
+        )
+    await session.commit()
+
+
+async def ensure_index(session):
+    """
+    Перестраивает индекс, если он разошелся с каталогом. Сравнивается текст
+    каждого костюма после стеммера, а не число записей: костюм могли изменить
+    в обход приложения, пока оно было остановлено, или мог измениться стеммер.
+    """
+    if not _is_sqlite(session):
+        return False
+    result = await session.execute(text("SELECT rowid, title, description FROM costume_search"))
+    indexed = {cid: (title, description) for cid, title, description in result.all()}
+    result = await session.execute(select(Costume.id, Costume.title, Costume.description))
+    expected = {cid: (stem_text(title), stem_text(description)) for cid, title, description in result.all()}
+    if indexed == expected:
+        return False
+    await rebuild_index(session)
+    return True
+
+
+# ========== ПОИСК ==========
+
+PRICE_BUCKETS = [(0, 999), (1000, 2999), (3000, 4999), (5000, None)]
+
+
+def _busy_between(free_from, free_to):
+    """Условие "у костюма есть бронь или заказ, пересекающий период"."""
+    return or_(
+        exists().where(
+            Reservation.costume_id == Costume.id,
+            Reservation.date_from <= free_to,
+            Reservation.date_to >= free_from,
+        ),
+        exists().where(
+            Order.costume_id == Costume.id,
+            Order.date_from.isnot(None),
+            Order.date_to.isnot(None),
+            Order.date_from <= free_to,
+            Order.date_to >= free_from,
+        ),
+    )
+
+
+async def search_costumes(session, q: str | None = None, price_min: int | None = None,
+                          price_max: int | None = None, available: bool | None = None,
+                          free_from=None, free_to=None, limit: int = 20, offset: int = 0):
+    filters = []
+    rank = None
+    stmt = select(Costume)
+
+    if q and q.strip():
+        if _is_sqlite(session):
+            match = fts_query(q)
+            if match is None:
+                return {"total": 0, "items": [], "facets": {
+                    "price": [{"min": low, "max": high, "count": 0} for low, high in PRICE_BUCKETS],
+                    "available": {"true": 0, "false": 0},
+                }}
+            fts = (
+                select(
+                    literal_column("rowid").label("costume_id"),
+                    literal_column("bm25(costume_search, 10.0, 1.0)").label("rank"),
+                )
+                .select_from(table("costume_search"))
+                .where(text("costume_search MATCH :match"))
+                .subquery()
+            )
+            stmt = stmt.join(fts, fts.c.costume_id == Costume.id)
+            rank = fts.c.rank
+            params = {"match": match}
+        else:
+            document = func.to_tsvector("russian", func.concat_ws(" ", Costume.title, Costume.description))
+            query = func.plainto_tsquery("russian", q)
+            filters.append(document.op("@@")(query))
+            rank = -func.ts_rank(document, query)
+            params = {}
+    else:
+        params = {}
+
+    if price_min is not None:
+        filters.append(Costume.price >= price_min)
+    if price_max is not None:
+        filters.append(Costume.price <= price_max)
+    if available is not None:
+        filters.append(Costume.available == available)
+    if free_from is not None and free_to is not None:
+        filters.append(~_busy_between(free_from, free_to))
+
+    if filters:
+        stmt = stmt.where(and_(*filters))
+
+    # Фасеты считаются по отфильтрованному набору одним агрегирующим запросом
+    matched = stmt.with_only_columns(Costume.id, Costume.price, Costume.available).subquery()
+    facet_columns = [func.count().label("total")]
+    for low, high in PRICE_BUCKETS:
+        cond = matched.c.price >= low if high is None else and_(matched.c.price >= low, matched.c.price <= high)
+        facet_columns.append(func.sum(func.cast(cond, Costume.price.type)))
+    facet_columns.append(func.sum(func.cast(matched.c.available, Costume.price.type)))
+    facet_row = (await session.execute(select(*facet_columns).select_from(matched), params)).one()
+    total = facet_row[0] or 0
+
+    order = [rank, Costume.id] if rank is not None else [Costume.id]
+    result = await session.execute(stmt.order_by(*order).limit(limit).offset(offset), params)
+    items = result.scalars().all()
+
+    available_count = facet_row[-1] or 0
+    return {
+        "total": total,
+        "items": items,
+        "facets": {
+            "price": [
+                {"min": low, "max": high, "count": facet_row[i + 1] or 0}
+                for i, (low, high) in enumerate(PRICE_BUCKETS)
+            ],
+            "available": {"true": available_count, "false": total - available_count},
+        },
+    }
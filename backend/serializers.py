@@ -0,0 +1,151 @@
+"""
+Быстрая сериализация списков для ответов API.
+
+Вместо цепочки "ORM-объект -> Pydantic-модель -> повторная проверка
+через response_model -> JSON" строки выбираются кортежами колонок
+(select(Order.id, Order.title, ...)) и сразу кодируются в байты JSON.
+
+Для каждого набора полей один раз, при импорте модуля, генерируется
+функция, которая превращает кортеж в dict без циклов и проверок по
+полям (RowEncoder). Кодирование выполняет orjson, если он установлен,
+иначе стандартный json.
+
+Данные берутся из нашей же БД, поэтому повторная валидация не нужна;
+response_model в декораторах оставлен только для документации OpenAPI.
+"""
+import json
+from datetime import date, datetime
+
+from fastapi.responses import Response
+
+from models import Costume, Order, OrderHistory, Reservation, ReservationHistory, User
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def str_or_none(value):
+    # Поля, которые исторически отдаются строкой str(datetime), например "2025-01-01 10:00:00"
+    return str(value) if value is not None else None
+
+
+def upload_url(filename):
+    return f"/uploads/{filename}"
+
+
+class RowEncoder:
+    """
+    Кодировщик кортежей колонок в JSON.
+
+    fields - список имен полей или пар (имя, функция-преобразователь);
+    порядок полей совпадает с порядком колонок в select(...).
+    """
+
+    def __init__(self, name: str, fields):
+        self.name = name
+        self.fields = [(f, None) if isinstance(f, str) else f for f in fields]
+        namespace = {}
+        parts = []
+        for i, (field, convert) in enumerate(self.fields):
+            if convert is None:
+                parts.append(f"{field!r}: row[{i}]")
+            else:
+                namespace[f"_c{i}"] = convert
+                parts.append(f"{field!r}: _c{i}(row[{i}])")
+        source = f"def to_dict(row):\n    return {{{', '.join(parts)}}}\n"
+        exec(compile(source, f"<RowEncoder {name}>", "exec"), namespace)
+        self.to_dict = namespace["to_dict"]
+
+    def encode_one(self, row) -> bytes:
+        return dumps(self.to_dict(row))
+
+    def encode_many(self, rows) -> bytes:
+        to_dict = self.to_dict
+        return dumps([to_dict(row) for row in rows])
+
+
+class JSONBytesResponse(Response):
+    """Ответ с уже закодированным JSON (FastAPI не сериализует его повторно)."""
+    media_type = "application/json"
+
+
+# ========== КОДИРОВЩИКИ ОТВЕТОВ ==========
+# Порядок колонок в *_COLUMNS совпадает с порядком полей соответствующего кодировщика
+
+ORDER_COLUMNS = (
+    Order.id, Order.title, Order.status, Order.created_at,
+    Order.costume_id, Order.phone, Order.date_from, Order.date_to,
+)
+order_encoder = RowEncoder("order", [
+    "id", "title", "status", "created_at", "costume_id", "phone", "date_from", "date_to",
+])
+
+ORDER_ADMIN_COLUMNS = (
+    Order.id, Order.user_id, User.email, Order.title, Order.status, Order.created_at,
+    Order.costume_id, Costume.title, Order.phone, Order.date_from, Order.date_to,
+)
+order_admin_encoder = RowEncoder("order_admin", [
+    "id", "user_id", "user_email", "title", "status", "created_at",
+    "costume_id", "costume_title", "phone", "date_from", "date_to",
+])
+
+COSTUME_COLUMNS = (
+    Costume.id, Costume.title, Costume.description, Costume.price, Costume.available, Costume.image_filename,
+)
+costume_encoder = RowEncoder("costume", [
+    "id", "title", "description", "price", "available", ("image_url", upload_url),
+])
+
+RESERVATION_COLUMNS = (
+    Reservation.id, Reservation.costume_id, Reservation.date_from, Reservation.date_to, Reservation.created_at,
+)
+reservation_encoder = RowEncoder("reservation", [
+    "id", "costume_id", "date_from", "date_to", ("created_at", str_or_none),
+])
+
+RESERVATION_ADMIN_COLUMNS = (
+    Reservation.id, User.id, User.email, Costume.id, Costume.title,
+    Reservation.date_from, Reservation.date_to, Reservation.created_at,
+)
+reservation_admin_encoder = RowEncoder("reservation_admin", [
+    "id", "user_id", "user_email", "costume_id", "costume_title",
+    "date_from", "date_to", ("created_at", str_or_none),
+])
+
+
+# Те же наборы колонок для архивных таблиц (maintenance.py) - для UNION ALL с "горячими"
+ORDER_HISTORY_COLUMNS = (
+    OrderHistory.id, OrderHistory.title, OrderHistory.status, OrderHistory.created_at,
+    OrderHistory.costume_id, OrderHistory.phone, OrderHistory.date_from, OrderHistory.date_to,
+)
+ORDER_HISTORY_ADMIN_COLUMNS = (
+    OrderHistory.id, OrderHistory.user_id, User.email, OrderHistory.title, OrderHistory.status,
+    OrderHistory.created_at, OrderHistory.costume_id, Costume.title, OrderHistory.phone,
+    OrderHistory.date_from, OrderHistory.date_to,
+)
+RESERVATION_HISTORY_COLUMNS = (
+    ReservationHistory.id, ReservationHistory.costume_id, ReservationHistory.date_from,
+    ReservationHistory.date_to, ReservationHistory.created_at,
+)
+RESERVATION_HISTORY_ADMIN_COLUMNS = (
+    ReservationHistory.id, User.id, User.email, Costume.id, Costume.title,
+    ReservationHistory.date_from, ReservationHistory.date_to, ReservationHistory.created_at,
+)
+
+
+def costume_row(c: Costume) -> tuple:
+    return (c.id, c.title, c.description, c.price, c.available, c.image_filename)
@@ -0,0 +1,86 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Если несколько запросов одновременно просят одно и то же (один вопрос в чат
+во время акции, одна и та же проверка доступности костюма), вычисление
+выполняется один раз: первый запрос запускает его отдельной задачей, а
+остальные с тем же ключом ждут ту же задачу и получают тот же результат
+(или то же исключение). Это не кэш: как только вычисление завершилось,
+ключ освобождается и следующий запрос считает заново.
+
+Вычисление идет в отдельной задаче, поэтому отмена одного из ожидающих
+(клиент закрыл соединение) не прерывает его для остальных. По той же
+причине функция не должна использовать сессию БД конкретного запроса -
+только собственную (AsyncSessionLocal).
+
+Результат общий для всех ожидающих - его нельзя изменять на месте.
+
+    catalog_flight = SingleFlight("catalog")
+    body = await catalog_flight.do("all", load_catalog)
+    ...
+    catalog_flight.forget("all")    # после записи в каталог
+
+Счетчики всех групп - stats() (GET /singleflight/stats): calls - сколько
+запросов пришло, executed - сколько раз выполнялось вычисление, saved -
+сколько вычислений сэкономлено.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+GROUPS: dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[object, asyncio.Task] = {}
+        self.stats = {"calls": 0, "executed": 0, "saved": 0, "errors": 0, "max_waiters": 0}
+        self._waiters: dict[object, int] = {}
+        GROUPS[name] = self
+
+    async def do(self, key, func):
+        """Результат func() для key; func - функция без аргументов, возвращающая корутину."""
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        else:
+            self.stats["saved"] += 1
+            self._waiters[key] += 1
+            self.stats["max_waiters"] = max(self.stats["max_waiters"], self._waiters[key])
+        return await asyncio.shield(task)
+
+    def _done(self, key, task: asyncio.Task):
+        # После forget() под этим ключом может уже выполняться новое вычисление
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+        # Исключение забирается здесь, даже если все ожидающие уже отменены
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+
+    def forget(self, key):
+        """
+        Вызывается после записи: уже ждущие получат текущий результат, а новые
+        запросы с этим ключом запустят вычисление заново.
+        """
+        if self._inflight.pop(key, None) is not None:
+            self._waiters.pop(key, None)
+
+    def forget_where(self, predicate):
+        for key in [k for k in self._inflight if predicate(k)]:
+            self.forget(key)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+def stats() -> dict:
+    return {name: {**group.stats, "inflight": group.inflight} for name, group in GROUPS.items()}
@@ -0,0 +1,81 @@
+"""
+Заглушка SMTP-сервера для локальной проверки писем.
+
+Принимает письма на localhost:1025 (как ожидает mailer.py по умолчанию),
+печатает их в консоль и, если задан --outbox, сохраняет в .eml файлы.
+    python smtp_stub.py [--port 1025] [--outbox ./outbox]
+"""
+import argparse
+import asyncio
+import time
+from email import message_from_bytes, policy
+from pathlib import Path
+
+
+async def handle(reader, writer, outbox: Path | None):
+    def reply(line: str):
+        writer.write((line + "\r\n").encode())
+
+    reply("220 smtp-stub ready")
+    mail_from, rcpt_to = None, []
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line.decode(errors="replace").strip()
+        verb = command[:4].upper()
+        if verb in ("HELO", "EHLO"):
+            reply("250 smtp-stub")
+        elif verb == "MAIL":
+            mail_from, rcpt_to = command[10:], []
+            reply("250 OK")
+        elif verb == "RCPT":
+            rcpt_to.append(command[8:])
+            reply("250 OK")
+        elif verb == "DATA":
+            reply("354 End data with <CR><LF>.<CR><LF>")
+            await writer.drain()
+            lines = []
+            while True:
+                data = await reader.readline()
+                if data in (b".\r\n", b".\n", b""):
+                    break
+                lines.append(data[1:] if data.startswith(b"..") else data)
+            raw = b"".join(lines)
+            message = message_from_bytes(raw, policy=policy.default)
+            print(f"--- письмо от {mail_from} для {', '.join(rcpt_to)}: {message['Subject']}")
+            print(message.get_body(("plain",)).get_content() if message.get_body(("plain",)) else raw.decode(errors="replace"))
+            if outbox is not None:
+                (outbox / f"{time.time_ns()}.eml").write_bytes(raw)
+            reply("250 OK: queued")
+        elif verb in ("RSET", "NOOP"):
+            reply("250 OK")
+        elif verb == "QUIT":
+            reply("221 Bye")
+            await writer.drain()
+            break
+        else:
+            reply("502 Command not implemented")
+        await writer.drain()
+    writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--outbox", type=Path, default=None)
+    args = parser.parse_args()
+    if args.outbox is not None:
+        args.outbox.mkdir(parents=True, exist_ok=True)
+    server = await asyncio.start_server(lambda r, w: handle(r, w, args.outbox), args.host, args.port)
+    print(f"SMTP-заглушка слушает {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
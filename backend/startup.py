@@ -0,0 +1,84 @@
+"""
+Отложенный прогрев приложения.
+
+До открытия порта lifespan выполняет только то, без чего запросы
+обрабатываются неправильно: создание схемы БД, таблицы и индекс поиска,
+построение сводных таблиц отчетов, загрузка базы знаний. Остальное
+(суперпользователь, воркер задач, прогрев запросов, клиент LLM) регистрируется
+декоратором @warmup.step и выполняется фоновой задачей уже после старта
+сервера, шаги - по очереди в порядке регистрации.
+
+GET /ready отвечает 503, пока прогрев не закончится, - балансировщик
+не отправляет запросы на еще не прогретый экземпляр.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    def __init__(self):
+        self.steps: list[tuple[str, object]] = []
+        self.results: dict[str, dict] = {}
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def step(self, name: str):
+        def register(func):
+            self.steps.append((name, func))
+            return func
+        return register
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def start(self):
+        if self._task is None:
+            self.results = {}
+            self.started_at = time.perf_counter()
+            self.finished_at = None
+            self._task = asyncio.create_task(self._run(), name="warmup")
+
+    async def _run(self):
+        for name, func in self.steps:
+            started = time.perf_counter()
+            try:
+                await func()
+            except Exception as e:
+                # Ошибка шага не останавливает прогрев: остальные шаги от него не зависят
+                logger.error(f"Шаг прогрева {name} завершился ошибкой: {e}")
+                self.results[name] = {"ok": False, "ms": _ms_since(started), "error": str(e)}
+            else:
+                self.results[name] = {"ok": True, "ms": _ms_since(started)}
+        self.finished_at = time.perf_counter()
+        logger.info(f"Прогрев завершен за {_ms_since(self.started_at)} мс")
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self):
+        # Не отменяем: шаг, прерванный посреди записи, оставил бы БД заблокированной
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def status(self) -> dict:
+        done = self.results
+        return {
+            "ready": self.ready,
+            "warmup_ms": _ms_since(self.started_at, self.finished_at) if self.started_at else None,
+            "steps": done,
+            "pending": [name for name, _ in self.steps if name not in done],
+        }
+
+
+def _ms_since(started: float, finished: float | None = None) -> float:
+    return round(((finished or time.perf_counter()) - started) * 1000, 1)
+
+
+warmup = Warmup()
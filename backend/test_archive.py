@@ -0,0 +1,137 @@
+"""
+Проверка архивирования (maintenance.py) после удаления строк.
+
+Без AUTOINCREMENT SQLite выдает новой строке max(id) + 1: если удалить
+оставшиеся строки orders/reservations, новые записи получат id, которые
+уже лежат в архиве, и следующий перенос упадет на первичном ключе
+истории, а "мои заказы/брони" (UNION ALL с архивом) вернут повторы.
+
+Скрипт начинает со старой схемы (таблицы без AUTOINCREMENT, как в уже
+развернутых базах), проверяет миграцию в create_tables(), затем
+архивирует, удаляет горячие строки, добавляет новые и архивирует снова.
+
+Запуск из папки backend:
+    python test_archive.py
+Также собирается pytest.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Таблицы в том виде, в каком их создавали версии без AUTOINCREMENT
+LEGACY_SCHEMA = """
+CREATE TABLE orders (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, costume_id INTEGER,
+    title VARCHAR NOT NULL, phone VARCHAR, date_from DATE, date_to DATE,
+    status VARCHAR NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE INDEX ix_orders_id ON orders (id);
+CREATE TABLE reservations (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, costume_id INTEGER NOT NULL,
+    date_from DATE NOT NULL, date_to DATE NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE INDEX ix_reservations_id ON reservations (id);
+INSERT INTO orders (user_id, costume_id, title, date_from, date_to, status) VALUES
+    (1, 1, 'Старый 1', '2020-01-01', '2020-01-03', 'завершена'),
+    (1, 1, 'Старый 2', '2020-02-01', '2020-02-03', 'завершена');
+INSERT INTO reservations (user_id, costume_id, date_from, date_to) VALUES
+    (1, 1, '2020-01-01', '2020-01-03'),
+    (1, 1, '2020-02-01', '2020-02-03');
+"""
+
+SCRIPT = """
+import asyncio, json, logging
+from datetime import date
+logging.disable(logging.CRITICAL)
+from sqlalchemy import delete, insert, text
+import maintenance, statements
+from database import AsyncSessionLocal, create_tables
+from models import Order, Reservation
+
+TODAY = date(2030, 1, 1)
+EXPIRED = {"date_from": date(2020, 3, 1), "date_to": date(2020, 3, 3)}
+FUTURE = {"date_from": date(2031, 1, 1), "date_to": date(2031, 1, 3)}
+
+async def add(session, order_dates, reservation_dates):
+    order = await session.scalar(insert(Order).values(
+        user_id=1, costume_id=1, title="Заказ", status="завершена", **order_dates
+    ).returning(Order.id))
+    reservation = await session.scalar(insert(Reservation).values(
+        user_id=1, costume_id=1, **reservation_dates
+    ).returning(Reservation.id))
+    return order, reservation
+
+async def main():
+    results = {}
+    await create_tables()
+    async with AsyncSessionLocal() as session:
+        results["schema"] = (await session.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE name IN ('orders', 'reservations')"
+        ))).all()
+        results["schema"] = {name: "AUTOINCREMENT" in sql for name, sql in results["schema"]}
+    results["first"] = await maintenance.archive_expired(today=TODAY)
+
+    # Горячие строки, которые не уходят в архив, удаляются (как DELETE администратора)
+    async with AsyncSessionLocal() as session:
+        kept = await add(session, FUTURE, FUTURE)
+        await session.commit()
+        await session.execute(delete(Order))
+        await session.execute(delete(Reservation))
+        await session.commit()
+        fresh = await add(session, EXPIRED, EXPIRED)
+        await session.commit()
+    results["kept_ids"] = kept
+    results["fresh_ids"] = fresh
+    results["second"] = await maintenance.archive_expired(today=TODAY)
+
+    async with AsyncSessionLocal() as session:
+        orders = (await session.execute(statements.MY_ORDERS, {"user_id": 1})).all()
+        reservations = (await session.execute(statements.MY_RESERVATIONS, {"user_id": 1})).all()
+    results["order_ids"] = [row.id for row in orders]
+    results["reservation_ids"] = [row.id for row in reservations]
+    print(json.dumps(results))
+
+asyncio.run(main())
+"""
+
+
+def run_script() -> dict:
+    with tempfile.TemporaryDirectory(prefix="archive-") as workdir:
+        db_path = os.path.join(workdir, "chat.db")
+        db = sqlite3.connect(db_path)
+        db.executescript(LEGACY_SCHEMA)
+        db.close()
+        env = dict(os.environ)
+        env.update({"PYTHONPATH": BACKEND_DIR, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}"})
+        proc = subprocess.run(
+            [sys.executable, "-c", SCRIPT], cwd=workdir, env=env, capture_output=True, text=True, timeout=120,
+        )
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_archive_after_deleting_hot_rows():
+    r = run_script()
+    assert r["schema"] == {"orders": True, "reservations": True}
+    # Все прошедшие строки переносятся, включая строку с максимальным id
+    assert r["first"] == {"reservations": 2, "orders": 2}
+    # После удаления горячих строк id продолжают расти и не совпадают с архивными
+    assert r["kept_ids"] == [3, 3]
+    assert r["fresh_ids"] == [4, 4]
+    assert r["second"] == {"reservations": 1, "orders": 1}
+    assert sorted(r["order_ids"]) == [1, 2, 4]
+    assert sorted(r["reservation_ids"]) == [1, 2, 4]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            started = time.perf_counter()
+            test()
+            print(f"OK  {name} ({time.perf_counter() - started:.1f} с)")
@@ -0,0 +1,177 @@
+"""
+Проверка цепочки LLM с выключателями на заглушке LLM-сервера (fake_llm_server.py).
+
+Сценарии:
+  - основная модель отвечает;
+  - основная модель падает: ответы идут от дешевой, после N ошибок выключатель
+    размыкается и основная модель больше не вызывается;
+  - через reset_timeout - один пробный запрос: успех замыкает выключатель,
+    ошибка снова размыкает;
+  - основная модель зависает: каждая попытка ограничена таймаутом;
+  - обе модели недоступны: /chat укладывается в дедлайн и отвечает из базы
+    знаний (приблизительный поиск) или заготовленной фразой.
+
+Запуск из папки backend:
+    python test_llm_breaker.py
+Также собирается pytest.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from fake_llm_server import FakeLLMServer
+from llm import CircuitBreaker, HTTPModel, LLMChain, Provider
+
+FAILURES = 3
+RESET = 0.5
+TIMEOUT = 0.3
+
+
+def make_chain(server: FakeLLMServer, deadline: float = 1.0) -> LLMChain:
+    return LLMChain([
+        Provider("primary", HTTPModel(server.model_url("primary")), TIMEOUT, CircuitBreaker(FAILURES, RESET)),
+        Provider("cheap", HTTPModel(server.model_url("cheap")), TIMEOUT, CircuitBreaker(FAILURES, RESET)),
+    ], deadline=deadline)
+
+
+def state(chain: LLMChain, name: str) -> str:
+    return next(p.breaker.state for p in chain.providers if p.name == name)
+
+
+def test_breaker_opens_and_recovers():
+    server = FakeLLMServer(port=0).start()
+    try:
+        chain = make_chain(server)
+
+        async def scenario():
+            answer = await chain.generate("вопрос")
+            assert answer.provider == "primary"
+
+            server.configure("primary", error_rate=1.0)
+            for _ in range(FAILURES):
+                assert (await chain.generate("вопрос")).provider == "cheap"
+            assert state(chain, "primary") == "open"
+
+            # Разомкнутый выключатель: основная модель не вызывается вовсе
+            calls = server.calls("primary")
+            started = time.perf_counter()
+            assert (await chain.generate("вопрос")).provider == "cheap"
+            assert server.calls("primary") == calls
+            assert time.perf_counter() - started < TIMEOUT
+
+            # Пробный запрос после reset_timeout неудачен - снова open
+            await asyncio.sleep(RESET)
+            assert (await chain.generate("вопрос")).provider == "cheap"
+            assert server.calls("primary") == calls + 1
+            assert state(chain, "primary") == "open"
+
+            # Модель восстановилась - пробный запрос замыкает выключатель
+            server.configure("primary", error_rate=0.0)
+            await asyncio.sleep(RESET)
+            assert (await chain.generate("вопрос")).provider == "primary"
+            assert state(chain, "primary") == "closed"
+
+            metrics = chain.metrics()["providers"][0]
+            assert metrics["opened"] == 2 and metrics["rejected"] >= 1
+
+        asyncio.run(scenario())
+    finally:
+        server.stop()
+
+
+def test_slow_model_is_bounded_by_timeout():
+    server = FakeLLMServer(port=0).start()
+    try:
+        chain = make_chain(server, deadline=2.0)
+        server.configure("primary", latency=5.0)
+
+        async def scenario():
+            for _ in range(FAILURES):
+                started = time.perf_counter()
+                answer = await chain.generate("вопрос")
+                assert answer.provider == "cheap"
+                assert time.perf_counter() - started < TIMEOUT + 0.3
+            assert state(chain, "primary") == "open"
+            assert chain.metrics()["providers"][0]["timeouts"] == FAILURES
+            started = time.perf_counter()
+            assert (await chain.generate("вопрос")).provider == "cheap"
+            assert time.perf_counter() - started < 0.2
+
+        asyncio.run(scenario())
+    finally:
+        server.stop()
+
+
+# Приложение запускается в отдельном процессе: путь к SQLite фиксируется при первом
+# импорте database.py, а test_query_plans.py импортирует main в своей временной папке
+CHAT_SCRIPT = """
+import json, logging, time
+logging.disable(logging.CRITICAL)
+from fastapi.testclient import TestClient
+import main
+
+results = []
+with TestClient(main.app) as client:
+    while client.get("/ready").status_code == 503:
+        time.sleep(0.05)
+    for text in ["пошиву костюмов"] * {attempts} + ["zq1 xv2"]:
+        started = time.perf_counter()
+        response = client.post("/chat", json={{"text": text}})
+        results.append({{"status": response.status_code, "text": response.json()["response"],
+                         "seconds": time.perf_counter() - started}})
+print(json.dumps({{"results": results, "metrics": main.llm_chain.metrics()}}, ensure_ascii=False))
+"""
+
+
+def test_chat_falls_back_when_all_models_fail():
+    server = FakeLLMServer(port=0).start()
+    server.configure("*", error_rate=1.0)
+    attempts = FAILURES + 2
+    deadline = 1.0
+    try:
+        with tempfile.TemporaryDirectory(prefix="llm-breaker-") as workdir:
+            env = dict(os.environ)
+            env.update({
+                "PYTHONPATH": BACKEND_DIR,
+                "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'chat.db')}",
+                "JOBS_WORKER": "external",
+                "LLM_CHAIN": f"{server.model_url('primary')},{server.model_url('cheap')}",
+                "LLM_TIMEOUT": str(TIMEOUT),
+                "LLM_DEADLINE": str(deadline),
+                "LLM_BREAKER_FAILURES": str(FAILURES),
+            })
+            proc = subprocess.run(
+                [sys.executable, "-c", CHAT_SCRIPT.format(attempts=attempts)],
+                cwd=workdir, env=env, capture_output=True, text=True, timeout=120,
+            )
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        report = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        server.stop()
+
+    *retrieval, canned = report["results"]
+    for result in retrieval:
+        assert result["status"] == 200
+        assert result["text"].startswith("Возможно, вы спрашиваете")
+        assert result["seconds"] < deadline + 0.3
+    assert canned["status"] == 200 and canned["text"]
+    # После FAILURES ошибок обе модели пропускаются без запросов
+    assert all(p["state"] == "open" for p in report["metrics"]["providers"])
+    assert server.calls("primary") == FAILURES
+    assert report["metrics"]["exhausted"] == attempts + 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            started = time.perf_counter()
+            test()
+            print(f"OK  {name} ({time.perf_counter() - started:.1f} с)")
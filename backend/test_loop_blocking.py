@@ -0,0 +1,147 @@
+"""
+Проверка, что обработчики не блокируют цикл событий (loop_monitor.py, тестовый режим).
+
+Приложение запускается с LOOP_LAG_FAIL_MS=FAIL_MS: запрос, во время которого
+цикл событий простоял дольше порога, получает 500 со стеком блокировки.
+Проходятся эндпоинты, где раньше были синхронные вызовы: регистрация и вход
+(хеширование пароля), загрузка изображений (запись файла), чат, каталог,
+заказы. Контрольные маршруты: /_test/block (time.sleep в async def) должен
+быть пойман, /_test/sleep (asyncio.sleep) - нет.
+
+Запуск из папки backend:
+    python test_loop_blocking.py
+Также собирается pytest.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAIL_MS = 100
+
+# Отдельный процесс: путь к SQLite фиксируется при первом импорте database.py
+SCRIPT = """
+import asyncio, io, json, logging, time
+logging.disable(logging.CRITICAL)
+from fastapi.testclient import TestClient
+import main
+
+@main.app.get("/_test/block")
+async def blocking_handler():
+    time.sleep({block_seconds})
+    return {{"ok": True}}
+
+@main.app.get("/_test/sleep")
+async def sleeping_handler():
+    await asyncio.sleep({block_seconds})
+    return {{"ok": True}}
+
+IMAGE = b"\\x89PNG\\r\\n\\x1a\\n" + b"0" * 200_000
+results = {{}}
+
+def check(name, response):
+    body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+    results[name] = {{"status": response.status_code, "body": body}}
+    return body
+
+with TestClient(main.app) as client:
+    while client.get("/ready").status_code == 503:
+        time.sleep(0.05)
+    check("block", client.get("/_test/block"))
+    check("sleep", client.get("/_test/sleep"))
+    check("register_simple", client.post("/auth/register-simple", json={{"email": "u1@example.com", "password": "secret123"}}))
+    user = check("login", client.post("/auth/login", data={{"username": "u1@example.com", "password": "secret123"}}))
+    check("login_unknown", client.post("/auth/login", data={{"username": "nobody@example.com", "password": "x"}}))
+    admin = client.post("/auth/login", data={{"username": "admin@example.com", "password": "admin-pass"}}).json()
+    user_h = {{"Authorization": f"Bearer {{user['access_token']}}"}}
+    admin_h = {{"Authorization": f"Bearer {{admin['access_token']}}"}}
+    costume = check("create_costume", client.post(
+        "/costumes", headers=admin_h,
+        data={{"title": "Костюм", "description": "тест", "price": "1000", "available": "true"}},
+        files={{"image": ("c.png", io.BytesIO(IMAGE), "image/png")}},
+    ))
+    check("update_costume", client.put(
+        f"/costumes/{{costume['id']}}", headers=admin_h,
+        data={{"title": "Костюм 2", "price": "1200", "available": "true"}},
+        files={{"image": ("c2.png", io.BytesIO(IMAGE), "image/png")}},
+    ))
+    check("profile_photo", client.post(
+        "/profile/photo", headers=user_h, files={{"image": ("me.png", io.BytesIO(IMAGE), "image/png")}},
+    ))
+    check("costumes", client.get("/costumes"))
+    check("availability", client.get(f"/costumes/{{costume['id']}}/availability"))
+    check("order", client.post("/orders", headers=user_h, json={{
+        "title": "Заказ", "phone": "+70000000000", "costume_id": costume["id"],
+        "date_from": "2031-01-10", "date_to": "2031-01-12",
+    }}))
+    check("my_orders", client.get("/orders/me", headers=user_h))
+    check("chat", client.post("/chat", json={{"text": "где находится ателье"}}))
+    check("chat_authenticated", client.post("/chat/authenticated", headers=user_h, json={{"text": "zq1 xv2"}}))
+    results["metrics"] = client.get("/loop/metrics", headers=admin_h).json()
+print(json.dumps(results, ensure_ascii=False))
+"""
+
+
+def run_app(block_seconds: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="loop-blocking-") as workdir:
+        uploads = os.path.join(workdir, "uploads")
+        os.makedirs(uploads)
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": BACKEND_DIR,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'chat.db')}",
+            "UPLOAD_DIR": uploads,
+            "JOBS_WORKER": "external",
+            "RATE_LIMIT_ENABLED": "false",
+            "LLM_CHAIN": "",
+            "GEMINI_API_KEY": "",
+            "SUPERUSER_EMAIL": "admin@example.com",
+            "SUPERUSER_PASSWORD": "admin-pass",
+            "LOOP_LAG_FAIL_MS": str(FAIL_MS),
+        })
+        # Файлом, а не через -c: в стеке блокировки нужен текст строк
+        script = os.path.join(workdir, "app_under_test.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(SCRIPT.format(block_seconds=block_seconds))
+        proc = subprocess.run(
+            [sys.executable, script],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=180,
+        )
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_handlers_do_not_block_event_loop():
+    results = run_app(block_seconds=FAIL_MS * 3 / 1000)
+
+    # Тестовый режим ловит блокировку и показывает, где она
+    blocked = results.pop("block")
+    assert blocked["status"] == 500
+    stack = "\n".join(blocked["body"]["blocked"][0]["stack"])
+    assert "blocking_handler" in stack and "time.sleep" in stack
+    assert blocked["body"]["blocked"][0]["route"] == "GET /_test/block"
+    assert results.pop("sleep")["status"] == 200
+
+    metrics = results.pop("metrics")
+    assert metrics["test_mode"] and metrics["incidents"] >= 1
+
+    failures = {
+        name: result["body"]["detail"] + "\n" + "\n".join(result["body"]["blocked"][0]["stack"][-6:])
+        for name, result in results.items()
+        if result["status"] == 500 and result["body"] and "blocked" in result["body"]
+    }
+    assert not failures, "\n\n".join(f"{name}: {text}" for name, text in failures.items())
+    for name, result in results.items():
+        assert result["status"] < 500, (name, result)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            started = time.perf_counter()
+            test()
+            print(f"OK  {name} ({time.perf_counter() - started:.1f} с)")
@@ -0,0 +1,335 @@
+"""
+Проверка планов запросов (EXPLAIN QUERY PLAN) для эндпоинтов main.py.
+
+Скрипт создает временную БД, запускает приложение в отдельном процессе
+(со своим окружением и своим database.engine), заполняет БД тестовыми
+данными, вызывает эндпоинты через TestClient и перехватывает все SQL-запросы,
+которые они выполняют. Для каждого запроса снимается EXPLAIN QUERY PLAN; если
+"горячий" эндпоинт читает большую таблицу полным сканированием (SCAN без
+индекса), скрипт завершается с кодом 1 - это можно использовать в CI.
+
+Каждый маршрут main.py должен быть в ENDPOINTS или в NO_QUERIES: новый
+маршрут без записи тоже считается ошибкой, чтобы его запросы не обошли проверку.
+
+Запуск из папки backend:
+    python test_query_plans.py        # только ошибки
+    python test_query_plans.py -v     # планы всех запросов
+Также собирается pytest (функция test_query_plans).
+"""
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Таблицы, которые растут вместе с числом заказов/сообщений
+HOT_TABLES = {
+    "orders", "reservations", "order_history", "reservation_history",
+    "chat_messages", "analytics_events", "costume_daily_bookings", "order_daily_stats", "jobs",
+}
+
+SUPERUSER = ("admin@example.com", "admin-password")
+USERS = 200
+COSTUMES = 300
+ORDERS = 5000
+RESERVATIONS = 5000
+
+CANDIDATES = 2
+JOBS = 2000
+
+# (метод, путь, аргументы запроса, допускается ли полное сканирование).
+# В пути подставляются {costume_id}, {order_id}, {reservation_id} и {job_id}, в теле - {costume_id}.
+# Полное сканирование допустимо только там, где по смыслу читается вся таблица.
+# Порядок важен: сначала чтения, потом изменения, в конце удаления
+ENDPOINTS = [
+    ("GET", "/", {}, False),
+    ("GET", "/ready", {}, False),
+    ("GET", "/costumes", {}, False),
+    ("GET", "/costumes/{costume_id}", {}, False),
+    ("GET", "/costumes/{costume_id}/availability?from_date=2026-03-01&to_date=2026-03-10", {}, False),
+    ("GET", "/costumes/{costume_id}/calendar?month=2026-03", {}, False),
+    ("GET", "/costumes/calendar?ids=1,2,3,4,5&month=2026-03", {}, False),
+    ("GET", "/costumes/search?q=костюм&free_from=2026-03-01&free_to=2026-03-05&limit=20", {}, False),
+    ("GET", "/costumes/export", {}, True),
+    ("GET", "/orders/me", {}, False),
+    ("GET", "/reservations/me", {}, False),
+    ("GET", "/orders/all", {}, True),
+    ("GET", "/reservations/all", {}, True),
+    ("GET", "/orders/export", {}, True),
+    ("GET", "/reservations/export", {}, True),
+    ("GET", "/profile", {}, False),
+    ("GET", "/chat/history?limit=20", {}, False),
+    ("GET", "/knowledge-base", {}, True),
+    ("GET", "/knowledge-base/version", {}, False),
+    ("GET", "/knowledge-base/index", {}, False),
+    ("GET", "/knowledge-base/candidates", {}, False),
+    ("GET", "/reports/orders-by-status?date_from=2026-01-01&date_to=2026-01-31", {}, False),
+    ("GET", "/reports/costume-utilization?date_from=2026-01-01&date_to=2026-01-31", {}, False),
+    ("GET", "/reports/revenue?date_from=2026-01-01&date_to=2026-01-31", {}, False),
+    ("GET", "/analytics/stats", {}, False),
+    ("GET", "/analytics/events?kind=booking&limit=50", {}, False),
+    ("GET", "/jobs/stats", {}, False),
+    ("GET", "/llm/metrics", {}, False),
+    ("GET", "/singleflight/stats", {}, False),
+    ("GET", "/loop/metrics", {}, False),
+    ("GET", "/db/replicas", {}, False),
+    ("POST", "/auth/register-simple", {"json": {"email": "plans@example.com", "password": "secret123"}}, False),
+    ("POST", "/chat", {"json": {"text": "привет"}}, False),
+    ("POST", "/chat/authenticated", {"json": {"text": "привет"}}, False),
+    ("POST", "/chat/local", {"json": {"text": "привет"}}, False),
+    ("PUT", "/profile", {"json": {"name": "План", "phone": "+70000000000"}}, False),
+    ("POST", "/profile/photo", {"files": {"image": ("p.png", b"png", "image/png")}}, False),
+    ("POST", "/reservations", {"json": {"costume_id": "{costume_id}", "date_from": "2030-01-01", "date_to": "2030-01-03"}}, False),
+    ("POST", "/orders", {"json": {"title": "План", "costume_id": "{costume_id}", "date_from": "2030-02-01", "date_to": "2030-02-03"}}, False),
+    ("PATCH", "/orders/{order_id}/status", {"json": {"status": "в обработке"}}, False),
+    ("PATCH", "/orders/batch/status", {"json": {"items": [
+        {"id": 2, "status": "завершена"}, {"id": 3, "status": "в обработке"},
+    ]}}, False),
+    ("POST", "/costumes", {
+        "data": {"title": "План", "description": "костюм", "price": "1000", "available": "true"},
+        "files": {"image": ("c.png", b"png", "image/png")},
+    }, False),
+    ("PUT", "/costumes/{costume_id}", {
+        "data": {"title": "План", "description": "костюм", "price": "1200", "available": "true"},
+    }, False),
+    ("POST", "/costumes/import", {
+        "files": {"manifest": ("m.jsonl", '{"title": "Импорт", "price": 100, "image": "i.png"}\n'.encode(), "application/json")},
+    }, False),
+    ("POST", "/knowledge-base", {"json": {"section": "вопросы", "key": "план запроса", "answer": "ответ"}}, False),
+    ("PUT", "/knowledge-base/1", {"json": {"section": "термины", "key": "ателье", "answer": "ответ"}}, False),
+    ("POST", "/knowledge-base/reload", {}, True),
+    ("POST", "/knowledge-base/candidates/generate", {"json": {}}, False),
+    ("POST", "/knowledge-base/candidates/1/approve", {"json": {}}, False),
+    ("POST", "/knowledge-base/candidates/2/reject", {}, False),
+    ("POST", "/jobs/{job_id}/retry", {}, False),
+    ("POST", "/reports/rebuild", {}, True),
+    ("DELETE", "/knowledge-base/2", {}, False),
+    ("DELETE", "/reservations/{reservation_id}", {}, False),
+    ("POST", "/reservations/batch/delete", {"json": {"ids": [2, 3, 4]}}, False),
+    # Костюм, созданный выше POST /costumes: у него нет бронирований
+    ("DELETE", f"/costumes/{COSTUMES + 1}", {}, False),
+    # Архивирует прошедшие бронирования - после всех запросов, которым они нужны
+    ("POST", "/maintenance/run", {}, True),
+]
+
+# Маршруты, которые не обращаются к БД (профилирование включается отдельно)
+NO_QUERIES = {
+    ("POST", "/debug/profile/cpu"),
+    ("GET", "/debug/profile/cpu/last"),
+    ("GET", "/debug/memory"),
+    ("POST", "/debug/memory/start"),
+    ("POST", "/debug/memory/snapshot"),
+    ("POST", "/debug/memory/stop"),
+    ("GET", "/debug/tasks"),
+    ("GET", "/debug/threads"),
+}
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+def seed(db_path: str, superuser_id: int):
+    rng = random.Random(42)
+    db = sqlite3.connect(db_path)
+    db.executemany(
+        "INSERT INTO users (email, hashed_password, is_active, is_superuser, is_verified) VALUES (?, 'x', 1, 0, 1)",
+        [(f"user{i}@example.com",) for i in range(USERS)],
+    )
+    user_ids = [row[0] for row in db.execute("SELECT id FROM users")]
+    db.executemany(
+        "INSERT INTO costumes (title, description, image_filename, price, available) VALUES (?, ?, 'x.jpg', ?, 1)",
+        [(f"Костюм {i}", f"Описание костюма {i}", rng.randint(300, 8000)) for i in range(COSTUMES)],
+    )
+    start = date(2025, 1, 1)
+
+    def period():
+        first = start + timedelta(days=rng.randint(0, 700))
+        return first, first + timedelta(days=rng.randint(0, 5))
+
+    orders = []
+    for _ in range(ORDERS):
+        first, last = period()
+        created = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 900_000))
+        orders.append((rng.choice(user_ids), rng.randint(1, COSTUMES), "Заказ", first, last,
+                       rng.choice(["новая", "в обработке", "завершена"]), created))
+    orders += [(superuser_id, 1, "Мой заказ", start, start, "новая", datetime(2025, 1, 1))]
+    db.executemany(
+        "INSERT INTO orders (user_id, costume_id, title, date_from, date_to, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(u, c, t, str(f), str(l), s, str(cr)) for u, c, t, f, l, s, cr in orders],
+    )
+    reservations = []
+    for _ in range(RESERVATIONS):
+        first, last = period()
+        reservations.append((rng.choice(user_ids + [superuser_id]), rng.randint(1, COSTUMES), str(first), str(last)))
+    db.executemany("INSERT INTO reservations (user_id, costume_id, date_from, date_to) VALUES (?, ?, ?, ?)", reservations)
+    db.executemany(
+        "INSERT INTO chat_messages (user_id, role, text, created_at) VALUES (?, 'user', 'привет', '2025-01-01')",
+        [(rng.choice(user_ids + [superuser_id]),) for _ in range(5000)],
+    )
+    db.executemany(
+        "INSERT INTO analytics_events (kind, user_id, payload, created_at) VALUES (?, NULL, '{}', '2025-01-01')",
+        [(rng.choice(["chat", "booking", "admin"]),) for _ in range(5000)],
+    )
+    db.executemany(
+        "INSERT INTO knowledge_candidates (key, answer, examples, hits, status, created_at) "
+        "VALUES (?, 'ответ', '[]', ?, 'pending', '2025-01-01')",
+        [(f"кандидат {i}", CANDIDATES - i) for i in range(CANDIDATES)],
+    )
+    db.executemany(
+        "INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_at, created_at, finished_at) "
+        "VALUES ('noop', '{}', ?, 1, 5, '2025-01-01', '2025-01-01', '2025-01-01')",
+        [(rng.choice(["done", "failed"]),) for _ in range(JOBS)],
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    scans = []
+    for line in plan:
+        match = _SCAN_RE.match(line)
+        if match and match.group(1) in HOT_TABLES and "INDEX" not in match.group(2):
+            scans.append(line)
+    return scans
+
+
+def explain(db_path: str, statement: str, parameters) -> list[str]:
+    db = sqlite3.connect(db_path)
+    try:
+        rows = db.execute("EXPLAIN QUERY PLAN " + statement, parameters or ()).fetchall()
+    finally:
+        db.close()
+    return [row[-1] for row in rows]
+
+
+def served_route(routes, method: str, path: str):
+    # Первый подходящий маршрут - тот, который Starlette и выберет
+    for route in routes:
+        if method in getattr(route, "methods", ()) and route.path_regex.match(path):
+            return route
+    return None
+
+
+def check(db_path: str, verbose: bool) -> list[str]:
+    """Выполняется в дочернем процессе: окружение уже указывает на временную БД."""
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import main
+    from database import engine
+
+    failures = []
+    app_routes = [r for r in main.app.routes if isinstance(r, APIRoute) and r.endpoint.__module__ == "main"]
+    covered = set(NO_QUERIES)
+    for method, path, _, _ in ENDPOINTS:
+        route = served_route(app_routes, method, path.split("?")[0])
+        if route is not None:
+            covered.add((method, route.path))
+    for route in app_routes:
+        for method in sorted(route.methods - {"HEAD", "OPTIONS"}):
+            if (method, route.path) not in covered:
+                failures.append(f"{method} {route.path}: маршрута нет в ENDPOINTS (или NO_QUERIES)")
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+            captured.append((statement, parameters))
+
+    with TestClient(main.app) as client:
+        # Суперпользователь создается на шаге прогрева, после старта приложения
+        while client.get("/ready").status_code == 503:
+            time.sleep(0.05)
+        superuser_id = sqlite3.connect(db_path).execute(
+            "SELECT id FROM users WHERE email = ?", (SUPERUSER[0],)
+        ).fetchone()[0]
+        seed(db_path, superuser_id)
+        # Упавшая задача для POST /jobs/{job_id}/retry
+        job_id = sqlite3.connect(db_path).execute("SELECT min(id) FROM jobs WHERE status = 'failed'").fetchone()[0]
+        token = client.post("/auth/login", data={"username": SUPERUSER[0], "password": SUPERUSER[1]}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            for method, path, kwargs, allow_scan in ENDPOINTS:
+                costume_id = random.Random(path).randint(1, COSTUMES)
+                url = path.format(costume_id=costume_id, order_id=1, reservation_id=1, job_id=job_id)
+                if "json" in kwargs:
+                    kwargs = {**kwargs, "json": {
+                        k: (costume_id if v == "{costume_id}" else v) for k, v in kwargs["json"].items()
+                    }}
+                captured.clear()
+                response = client.request(method, url, headers=headers, **kwargs)
+                if response.status_code >= 400:
+                    failures.append(f"{method} {url}: HTTP {response.status_code} {response.text[:200]}")
+                    continue
+                for statement, parameters in list(captured):
+                    plan = explain(db_path, statement, parameters)
+                    scans = full_scans(plan)
+                    if verbose or (scans and not allow_scan):
+                        print(f"\n{method} {url}\n  {' '.join(statement.split())[:300]}")
+                        for line in plan:
+                            print(f"    {line}")
+                    if scans and not allow_scan:
+                        failures.append(f"{method} {url}: полное сканирование {', '.join(scans)}")
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    return failures
+
+
+def run(verbose: bool = False) -> list[str]:
+    """
+    Запускает проверку в отдельном процессе: database.engine создается при первом
+    импорте, и в общем процессе pytest он мог бы уже смотреть на другую БД.
+    """
+    with tempfile.TemporaryDirectory(prefix="query-plans-") as workdir:
+        db_path = os.path.join(workdir, "chat_app.db")
+        uploads = os.path.join(workdir, "uploads")
+        os.makedirs(uploads)
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": BACKEND_DIR,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+            "UPLOAD_DIR": uploads,
+            "SUPERUSER_EMAIL": SUPERUSER[0],
+            "SUPERUSER_PASSWORD": SUPERUSER[1],
+            "JOBS_WORKER": "external",
+            "RATE_LIMIT_ENABLED": "false",
+            "LLM_CHAIN": "",
+            "GEMINI_API_KEY": "",
+        })
+        args = [sys.executable, os.path.abspath(__file__), "--child", db_path] + (["-v"] if verbose else [])
+        proc = subprocess.run(args, cwd=workdir, env=env, capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    *output, result = proc.stdout.strip().splitlines()
+    if output:
+        print("\n".join(output))
+    return json.loads(result)
+
+
+def test_query_plans():
+    failures = run()
+    assert not failures, "\n".join(failures)
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        import logging
+        logging.disable(logging.CRITICAL)
+        result = check(sys.argv[sys.argv.index("--child") + 1], verbose="-v" in sys.argv)
+        print(json.dumps(result, ensure_ascii=False))
+        sys.exit(0)
+    problems = run(verbose="-v" in sys.argv)
+    if problems:
+        print("\nОШИБКИ:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"\nOK: {len(ENDPOINTS)} эндпоинтов, полных сканирований горячих таблиц нет")
@@ -0,0 +1,160 @@
+"""
+Проверка разделения чтения и записи (replicas.py) на двух файлах SQLite.
+
+Основная БД - primary.db, реплика - replica.db. Репликацию заменяет снимок:
+после заполнения основной БД она копируется в реплику (sqlite3 backup), и
+дальше реплика "отстает" - новые записи в нее не попадают. Еще один костюм
+добавляется только в реплику: по нему видно, откуда прочитан ответ.
+
+Проверяется: каталог, карточка костюма и админские списки читаются с
+реплики; запись идет в основную БД; после своего бронирования пользователь
+и доступность забронированного костюма читаются с основной БД, пока не
+истечет окно прилипания, а потом снова с реплики.
+
+Запуск из папки backend:
+    python test_read_replicas.py
+Также собирается pytest.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STICKY_SECONDS = 1.0
+
+SCRIPT = """
+import json, logging, sqlite3, sys, time
+logging.disable(logging.CRITICAL)
+from fastapi.testclient import TestClient
+import main
+
+primary_path, replica_path, sticky = sys.argv[1], sys.argv[2], float(sys.argv[3])
+results = {}
+
+def check(name, response):
+    results[name] = {"status": response.status_code, "body": response.json()}
+    return results[name]["body"]
+
+with TestClient(main.app) as client:
+    while client.get("/ready").status_code == 503:
+        time.sleep(0.05)
+    client.post("/auth/register-simple", json={"email": "u1@example.com", "password": "secret123"})
+    user = client.post("/auth/login", data={"username": "u1@example.com", "password": "secret123"}).json()
+    admin = client.post("/auth/login", data={"username": "admin@example.com", "password": "admin-pass"}).json()
+    user_h = {"Authorization": f"Bearer {user['access_token']}"}
+    admin_h = {"Authorization": f"Bearer {admin['access_token']}"}
+    costume = client.post(
+        "/costumes", headers=admin_h,
+        data={"title": "Основной", "description": "тест", "price": "1000", "available": "true"},
+        files={"image": ("c.png", b"png", "image/png")},
+    ).json()
+    results["costume_id"] = costume["id"]
+
+    # Снимок основной БД становится репликой; дальше она отстает
+    source, target = sqlite3.connect(primary_path), sqlite3.connect(replica_path)
+    source.backup(target)
+    source.close()
+    target.execute(
+        "INSERT INTO costumes (title, description, image_filename, price, available) "
+        "VALUES ('Только на реплике', '', 'r.png', 1, 1)"
+    )
+    target.commit()
+    results["replica_costume_id"] = target.execute("SELECT max(id) FROM costumes").fetchone()[0]
+    target.close()
+    # Окно прилипания после создания костюма администратором
+    time.sleep(sticky * 1.2)
+
+    check("catalog", client.get("/costumes"))
+    check("replica_costume_anonymous", client.get(f"/costumes/{results['replica_costume_id']}"))
+    check("order", client.post("/orders", headers=user_h, json={
+        "title": "Заказ", "phone": "+70000000000", "costume_id": costume["id"],
+        "date_from": "2031-01-10", "date_to": "2031-01-12",
+    }))
+    # Сразу после бронирования: свои чтения и доступность костюма - с основной БД
+    check("replica_costume_user_sticky", client.get(f"/costumes/{results['replica_costume_id']}", headers=user_h))
+    check("availability_sticky", client.get(f"/costumes/{costume['id']}/availability"))
+    check("replica_costume_anonymous_after_write", client.get(f"/costumes/{results['replica_costume_id']}"))
+    check("orders_admin", client.get("/orders/all", headers=admin_h))
+    time.sleep(sticky * 1.2)
+    # Окно истекло: снова реплика, которая заказа еще не видит
+    check("replica_costume_user_after", client.get(f"/costumes/{results['replica_costume_id']}", headers=user_h))
+    check("availability_after", client.get(f"/costumes/{costume['id']}/availability"))
+    results["status"] = client.get("/db/replicas", headers=admin_h).json()
+print(json.dumps(results, ensure_ascii=False))
+"""
+
+
+def run_app(workdir: str) -> dict:
+    primary = os.path.join(workdir, "primary.db")
+    replica = os.path.join(workdir, "replica.db")
+    uploads = os.path.join(workdir, "uploads")
+    os.makedirs(uploads)
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{primary}",
+        "DATABASE_REPLICA_URLS": f"sqlite+aiosqlite:///{replica}",
+        "REPLICA_STICKY_SECONDS": str(STICKY_SECONDS),
+        "UPLOAD_DIR": uploads,
+        "JOBS_WORKER": "external",
+        "RATE_LIMIT_ENABLED": "false",
+        "LLM_CHAIN": "",
+        "GEMINI_API_KEY": "",
+        "SUPERUSER_EMAIL": "admin@example.com",
+        "SUPERUSER_PASSWORD": "admin-pass",
+    })
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT, primary, replica, str(STICKY_SECONDS)],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=180,
+    )
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def count_orders(path: str) -> int:
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT count(*) FROM orders").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_reads_go_to_replica_with_read_your_writes():
+    with tempfile.TemporaryDirectory(prefix="read-replicas-") as workdir:
+        r = run_app(workdir)
+        # Запись - только в основную БД
+        assert count_orders(os.path.join(workdir, "primary.db")) == 1
+        assert count_orders(os.path.join(workdir, "replica.db")) == 0
+
+    replica_title = "Только на реплике"
+    assert r["order"]["status"] == 201, r["order"]
+    # Чтения без записи - с реплики
+    assert replica_title in [c["title"] for c in r["catalog"]["body"]]
+    assert r["replica_costume_anonymous"]["status"] == 200
+    assert r["replica_costume_anonymous_after_write"]["status"] == 200
+    assert r["orders_admin"]["status"] == 200 and r["orders_admin"]["body"] == []
+
+    # Пользователь после своего бронирования читает основную БД: костюма с реплики там нет,
+    # а его заказ в доступности виден сразу
+    assert r["replica_costume_user_sticky"]["status"] == 404
+    assert [c["type"] for c in r["availability_sticky"]["body"]] == ["order"]
+
+    # Окно прилипания истекло - снова реплика
+    assert r["replica_costume_user_after"]["status"] == 200
+    assert r["availability_after"]["body"] == []
+
+    status = r["status"]
+    assert status["replicas"] == 1 and status["replica"] > 0 and status["sticky"] >= 2
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            started = time.perf_counter()
+            test()
+            print(f"OK  {name} ({time.perf_counter() - started:.1f} с)")
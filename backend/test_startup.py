@@ -0,0 +1,153 @@
+"""
+Бюджет холодного старта.
+
+1. `python -X importtime -c "import main"` (лучший из RUNS запусков):
+   время импорта main не должно превышать IMPORT_BUDGET_MS, а модули из
+   LAZY_MODULES (клиент Gemini) не должны загружаться при импорте вовсе.
+2. На пустой временной БД измеряется время от начала lifespan до открытия
+   порта (STARTUP_BUDGET_MS) и до завершения прогрева, т.е. до ответа 200
+   от GET /ready (WARMUP_BUDGET_MS).
+
+При превышении бюджета скрипт завершается с кодом 1 - это можно
+использовать в CI. Бюджеты переопределяются одноименными переменными
+окружения.
+
+Запуск из папки backend:
+    python test_startup.py        # итог
+    python test_startup.py -v     # плюс самые медленные импорты
+Также собирается pytest (функция test_startup).
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "500"))
+WARMUP_BUDGET_MS = float(os.getenv("WARMUP_BUDGET_MS", "5000"))
+RUNS = 3
+
+# Импортируются только при первом обращении или на шаге прогрева
+LAZY_MODULES = ["google.generativeai"]
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+STARTUP_SCRIPT = """
+import asyncio, json, logging, time
+logging.disable(logging.CRITICAL)
+import main
+from database import engine
+engine.echo = False
+
+async def run():
+    started = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        startup = time.perf_counter() - started
+        await main.warmup.wait()
+        warmup = time.perf_counter() - started
+        steps = main.warmup.status()["steps"]
+    print(json.dumps({"startup_ms": startup * 1000, "warmup_ms": warmup * 1000, "steps": steps}))
+
+asyncio.run(run())
+"""
+
+
+def child_env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'startup.db')}",
+        "JOBS_WORKER": "external",
+        # Ключ задан, чтобы проверить: клиент Gemini не импортируется, даже когда включен
+        "GEMINI_API_KEY": env.get("GEMINI_API_KEY", "startup-check"),
+    })
+    return env
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, int, int, str]]:
+    """Строки -X importtime: (собственное мкс, суммарное мкс, вложенность, модуль)."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            rows.append((int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    return rows
+
+
+def measure_import(workdir: str) -> list[tuple[int, int, int, str]]:
+    best = None
+    for _ in range(RUNS):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=workdir, env=child_env(workdir), capture_output=True, text=True, timeout=120,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"Ошибка импорта main:\n{proc.stderr[-2000:]}")
+        rows = parse_importtime(proc.stderr)
+        total = next(cumulative for _, cumulative, _, name in rows if name == "main")
+        if best is None or total < best[0]:
+            best = (total, rows)
+    return best[1]
+
+
+def measure_startup(workdir: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=workdir, env=child_env(workdir), capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Ошибка запуска приложения:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(verbose: bool = False) -> list[str]:
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        rows = measure_import(workdir)
+        startup = measure_startup(workdir)
+
+    import_ms = next(cumulative for _, cumulative, _, name in rows if name == "main") / 1000
+    imported = {name for _, _, _, name in rows}
+    print(f"Импорт main:        {import_ms:8.1f} мс (бюджет {IMPORT_BUDGET_MS:.0f})")
+    print(f"Старт до yield:     {startup['startup_ms']:8.1f} мс (бюджет {STARTUP_BUDGET_MS:.0f})")
+    print(f"Прогрев завершен:   {startup['warmup_ms']:8.1f} мс (бюджет {WARMUP_BUDGET_MS:.0f})")
+
+    if verbose:
+        # Прямые зависимости main, отсортированные по суммарному времени
+        print("\nСамые медленные импорты:")
+        direct = sorted((r for r in rows if r[2] == 1), key=lambda r: -r[1])
+        for _, cumulative, _, name in direct[:15]:
+            print(f"  {cumulative / 1000:8.1f} мс  {name}")
+        print("\nШаги прогрева:")
+        for name, result in startup["steps"].items():
+            print(f"  {result['ms']:8.1f} мс  {name}{'' if result['ok'] else '  ОШИБКА: ' + result['error']}")
+
+    for module in LAZY_MODULES:
+        if module in imported:
+            failures.append(f"{module} импортируется при импорте main (должен загружаться лениво)")
+    if import_ms > IMPORT_BUDGET_MS:
+        failures.append(f"импорт main {import_ms:.0f} мс > {IMPORT_BUDGET_MS:.0f} мс")
+    if startup["startup_ms"] > STARTUP_BUDGET_MS:
+        failures.append(f"старт до открытия порта {startup['startup_ms']:.0f} мс > {STARTUP_BUDGET_MS:.0f} мс")
+    if startup["warmup_ms"] > WARMUP_BUDGET_MS:
+        failures.append(f"прогрев {startup['warmup_ms']:.0f} мс > {WARMUP_BUDGET_MS:.0f} мс")
+    return failures
+
+
+def test_startup():
+    failures = run()
+    assert not failures, "\n".join(failures)
+
+
+if __name__ == "__main__":
+    problems = run(verbose="-v" in sys.argv)
+    if problems:
+        print("\nОШИБКИ:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nOK: холодный старт в пределах бюджета")
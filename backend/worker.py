@@ -0,0 +1,44 @@
+"""
+Отдельный процесс воркера фоновых задач.
+
+Запуск (API при этом стартует с JOBS_WORKER=external):
+    python worker.py
+"""
+import asyncio
+import logging
+import signal
+
+from database import create_tables
+from jobs import worker
+import mailer  # noqa: F401  регистрирует задачу send_email
+import auth  # noqa: F401  регистрирует задачи писем с токенами (сброс пароля, подтверждение)
+import maintenance  # регистрирует задачу maintenance
+import kb_candidates  # noqa: F401  регистрирует задачу kb_candidates
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    await create_tables()
+    await maintenance.ensure_scheduled()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    worker.start()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Остановка воркера, ожидание текущих задач...")
+        await worker.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -25,6 +25,38 @@ document.addEventListener('DOMContentLoaded', async function(){
     const reloadBtn = document.getElementById('reloadBtn');
 
     reloadBtn.addEventListener('click', loadOrders);
+
+    // Все измененные статусы отправляются одним пакетным запросом
+    const applyAllBtn = document.getElementById('applyAllBtn');
+    if (applyAllBtn) {
+        applyAllBtn.addEventListener('click', async () => {
+            const items = [];
+            tbody.querySelectorAll('select.status-select').forEach(select => {
+                if (select.value !== select.getAttribute('data-status')) {
+                    items.push({ id: Number(select.getAttribute('data-id')), status: select.value });
+                }
+            });
+            if (!items.length) return showError('Нет измененных статусов');
+            try {
+                const res = await fetch(`${API_URL}/orders/batch/status`, {
+                    method:'PATCH',
+                    headers:{ 'Content-Type':'application/json', 'Authorization': `Bearer ${AuthManager.getToken()}` },
+                    body: JSON.stringify({ items })
+                });
+                const txt = await res.text();
+                if (!res.ok) return showError('Ошибка обновления статусов: HTTP ' + res.status + ' ' + txt);
+                const failed = JSON.parse(txt).results.filter(r => !r.ok);
+                if (failed.length) {
+                    showError('Не обновлены заказы: ' + failed.map(r => `#${r.id} (${r.error})`).join(', '));
+                } else {
+                    showSuccess(`Статусы обновлены: ${items.length}`);
+                }
+                loadOrders();
+            } catch (e) {
+                showError('Ошибка обновления статусов: ' + e.message);
+            }
+        });
+    }
     statusFilter.addEventListener('change', loadOrders);
 
     async function loadOrders(){
@@ -76,7 +108,7 @@ document.addEventListener('DOMContentLoaded', async function(){
                 <td style="padding:8px; border:1px solid #ccc;">${dateStr}</td>
                 <td style="padding:8px; border:1px solid #ccc;">${o.status}</td>
                 <td style="padding:8px; border:1px solid #ccc;">
-                    <select data-id="${o.id}" class="status-select">
+                    <select data-id="${o.id}" data-status="${o.status}" class="status-select">
                         <option ${o.status==='новая'?'selected':''} value="новая">новая</option>
                         <option ${o.status==='в обработке'?'selected':''} value="в обработке">в обработке</option>
                         <option ${o.status==='завершена'?'selected':''} value="завершена">завершена</option>
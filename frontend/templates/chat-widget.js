@@ -2,7 +2,12 @@ class ChatWidget {
     constructor() {
         this.isOpen = false;
         this.apiUrl = 'http://localhost:8000';
+        this.historyLoaded = false;
+        // Индекс базы знаний для ответов без запроса к серверу (см. findLocalAnswer)
+        this.kbIndex = null;
+        this.kbIndexLoadedAt = 0;
         this.createWidget();
+        this.loadKnowledgeIndex();
     }
 
     createWidget() {
@@ -166,6 +171,16 @@ class ChatWidget {
             chatButton.style.transform = this.isOpen ? 'scale(1.1)' : 'scale(1)';
         }
         
+        // Индекс мог устареть, пока страница была открыта; без изменений сервер ответит 304
+        if (this.isOpen && Date.now() - this.kbIndexLoadedAt > 60000) {
+            this.loadKnowledgeIndex();
+        }
+
+        if (this.isOpen && !this.historyLoaded) {
+            this.historyLoaded = true;
+            this.loadHistory();
+        }
+        
         if (this.isOpen) {
             const messageInput = document.getElementById('messageInput');
             if (messageInput) {
@@ -213,6 +228,141 @@ class ChatWidget {
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     }
 
+    // Истекший токен (JWT живет час) не используется: с ним сервер ответит 401,
+    // а без входа чат продолжает работать через /chat
+    getToken() {
+        const token = typeof AuthManager !== 'undefined' ? AuthManager.getToken() : null;
+        if (token && this.tokenExpired(token)) {
+            this.forgetToken();
+            return null;
+        }
+        return token;
+    }
+
+    tokenExpired(token) {
+        try {
+            const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+            return typeof payload.exp === 'number' && payload.exp * 1000 <= Date.now();
+        } catch (error) {
+            return false;
+        }
+    }
+
+    forgetToken() {
+        if (typeof AuthManager !== 'undefined') {
+            AuthManager.removeToken();
+        }
+    }
+
+    // Загружает последнюю страницу истории диалога авторизованного пользователя
+    async loadHistory() {
+        const token = this.getToken();
+        if (!token) return;
+        try {
+            const response = await fetch(`${this.apiUrl}/chat/history?limit=20`, {
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+            if (!response.ok) return;
+            const data = await response.json();
+            // Сервер отдает сообщения от новых к старым
+            data.items.slice().reverse().forEach(item => {
+                this.addMessage(item.text, item.role === 'user' ? 'user' : 'bot');
+            });
+        } catch (error) {
+            console.error('Error loading chat history:', error);
+        }
+    }
+
+    // Загружает индекс базы знаний. Браузер кэширует его и перепроверяет по ETag,
+    // поэтому повторная загрузка без изменений базы знаний обходится ответом 304
+    async loadKnowledgeIndex() {
+        this.kbIndexLoadedAt = Date.now();
+        try {
+            const response = await fetch(`${this.apiUrl}/knowledge-base/index`);
+            if (!response.ok) return;
+            const index = await response.json();
+            index.questions = index.questions.map(([words, answer]) => [new Set(words), answer]);
+            this.kbIndex = index;
+        } catch (error) {
+            // Без индекса все вопросы просто уходят на сервер
+            console.error('Error loading knowledge base index:', error);
+        }
+    }
+
+    // То же, что preprocess_text в knowledge_base.py
+    preprocessText(text) {
+        return text.toLowerCase().trim()
+            .replace(/[^\p{L}\p{M}\p{N}_\s]/gu, ' ')
+            .replace(/\s+/g, ' ');
+    }
+
+    // Повторяет KnowledgeIndex._match на сервере; null - нужно спросить сервер
+    findLocalAnswer(text) {
+        const index = this.kbIndex;
+        if (!index) return null;
+        const userInput = this.preprocessText(text);
+        const words = userInput.split(' ').filter(Boolean);
+        const inputWords = new Set(words);
+
+        // Приветствия
+        if (index.greeting && words.length < 4 &&
+            index.greeting_words.some(word => userInput.includes(word))) {
+            return index.greeting;
+        }
+
+        // Общие вопросы о возможностях бота
+        if (index.general_questions.some(question => userInput.includes(question))) {
+            return index.general_answer;
+        }
+
+        // Точное совпадение термина
+        for (const [term, answer] of index.terms) {
+            if (userInput.includes(term)) {
+                return index.answers[answer];
+            }
+        }
+
+        // Вопрос с наибольшим числом общих слов
+        let bestMatch = null;
+        let maxMatches = 0;
+        for (const [questionWords, answer] of index.questions) {
+            let matches = 0;
+            inputWords.forEach(word => {
+                if (questionWords.has(word)) matches++;
+            });
+            if (matches > maxMatches) {
+                maxMatches = matches;
+                bestMatch = answer;
+            }
+        }
+        return bestMatch === null ? null : index.answers[bestMatch];
+    }
+
+    // Вопрос, отвеченный в браузере, все равно учитывается в аналитике сервера
+    // (по ней подбираются новые записи базы знаний); ответ этот запрос не ждет
+    reportLocalAnswer(text) {
+        fetch(`${this.apiUrl}/chat/local`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text: text }),
+            keepalive: true
+        }).catch(() => {});
+    }
+
+    // Авторизованные пользователи общаются через /chat/authenticated,
+    // чтобы помощник учитывал историю диалога
+    askServer(message, token) {
+        const headers = { 'Content-Type': 'application/json' };
+        if (token) {
+            headers['Authorization'] = `Bearer ${token}`;
+        }
+        return fetch(`${this.apiUrl}${token ? '/chat/authenticated' : '/chat'}`, {
+            method: 'POST',
+            headers: headers,
+            body: JSON.stringify({ text: message })
+        });
+    }
+
     async sendMessage() {
         const input = document.getElementById('messageInput');
         if (!input) return;
@@ -224,18 +374,41 @@ class ChatWidget {
         this.addMessage(message, 'user');
         input.value = '';
 
+        // Ответ из базы знаний - сразу, без запроса к серверу. Только без входа:
+        // вопросы авторизованных пользователей должны попасть в их историю диалога
+        const token = this.getToken();
+        const localAnswer = token ? null : this.findLocalAnswer(message);
+        if (localAnswer) {
+            this.addMessage(localAnswer, 'bot');
+            this.reportLocalAnswer(message);
+            return;
+        }
+
         // Показываем индикатор загрузки
         const loadingId = 'loading-' + Date.now();
         this.addMessage("Думаю... 🤔", "bot");
 
         try {
-            const response = await fetch(`${this.apiUrl}/chat`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ text: message })
-            });
+            let response = await this.askServer(message, token);
+
+            // Токен отозван или истек раньше, чем показывает exp: вход забывается,
+            // вопрос повторяется без него через /chat
+            if (response.status === 401 && token) {
+                this.forgetToken();
+                response = await this.askServer(message, null);
+            }
+
+            // Сервер ограничивает частоту запросов: не повторяем запрос автоматически,
+            // а сообщаем, через сколько можно спросить снова
+            if (response.status === 429 || response.status === 503) {
+                const retryAfter = parseInt(response.headers.get('Retry-After') || '0', 10);
+                const messagesContainer = document.getElementById('chatMessages');
+                if (messagesContainer && messagesContainer.lastChild) {
+                    messagesContainer.removeChild(messagesContainer.lastChild);
+                }
+                this.addMessage(`Слишком много вопросов подряд. Попробуйте снова через ${retryAfter || 'несколько'} сек.`, 'bot');
+                return;
+            }
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);